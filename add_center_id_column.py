@@ -0,0 +1,65 @@
+from sqlalchemy import bindparam, inspect, select, text, update
+from sqlalchemy.orm import Session
+from centers import center_resolver
+from database import engine
+from models import CreditBalance
+from table_versions import CREDIT_BALANCES, bump_table_version
+
+def add_center_id_column():
+    """Add the center_id foreign key and index to credit_balances and backfill it from the center text."""
+    try:
+        with engine.begin() as conn:
+            columns = [column['name'] for column in inspect(conn).get_columns('credit_balances')]
+
+            if 'center_id' in columns:
+                print("Column 'center_id' already exists.")
+            else:
+                conn.execute(text("ALTER TABLE credit_balances ADD center_id INTEGER NULL"))
+                print("Column 'center_id' added successfully.")
+                if engine.dialect.name != 'sqlite':  # SQLite cannot add constraints to an existing table
+                    conn.execute(text(
+                        "ALTER TABLE credit_balances ADD CONSTRAINT fk_credit_balances_center_id "
+                        "FOREIGN KEY (center_id) REFERENCES delhi.centers (id)"
+                    ))
+                    print("Foreign key 'fk_credit_balances_center_id' created successfully.")
+
+            indexes = [index['name'] for index in inspect(conn).get_indexes('credit_balances')]
+            if 'ix_credit_balances_center_id' not in indexes:
+                conn.execute(text(
+                    "CREATE INDEX ix_credit_balances_center_id ON credit_balances (center_id)"
+                ))
+                print("Index 'ix_credit_balances_center_id' created successfully.")
+
+            # The incremental importer's staging table is recreated with the new column on its next run
+            if inspect(conn).has_table('credit_balances_staging'):
+                conn.execute(text("DROP TABLE credit_balances_staging"))
+                print("Dropped 'credit_balances_staging'.")
+
+        # Backfill: resolve each distinct center name once, then one UPDATE per name
+        with Session(engine) as db:
+            names = db.execute(select(CreditBalance.center).where(CreditBalance.center.isnot(None)).distinct()).scalars().all()
+            resolved = [
+                {'b_center': name, 'b_center_id': center_resolver.resolve(db, name)} for name in names
+            ]
+            unresolved = [entry['b_center'] for entry in resolved if entry['b_center_id'] is None]
+            if resolved:
+                db.execute(
+                    update(CreditBalance.__table__)
+                    .where(CreditBalance.__table__.c.center == bindparam('b_center'))
+                    .values(center_id=bindparam('b_center_id')),
+                    resolved
+                )
+            bump_table_version(db, CREDIT_BALANCES)
+            db.commit()
+            print(f"Backfilled center_id for {len(resolved) - len(unresolved)} center names.")
+            if unresolved:
+                print(f"No matching center for: {', '.join(unresolved)}")
+
+        return True
+
+    except Exception as e:
+        print(f"Error adding center_id column: {e}")
+        return False
+
+if __name__ == "__main__":
+    add_center_id_column()
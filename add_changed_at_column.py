@@ -0,0 +1,40 @@
+from sqlalchemy import inspect, text
+from database import engine
+
+def add_changed_at_column():
+    """Add the computed changed_at column (last change time) and its index to credit_balances."""
+    try:
+        with engine.begin() as conn:
+            columns = [column['name'] for column in inspect(conn).get_columns('credit_balances')]
+
+            if 'changed_at' in columns:
+                print("Column 'changed_at' already exists.")
+            elif engine.dialect.name == 'sqlite':
+                # SQLite can only add virtual generated columns to an existing table; they can still be indexed
+                conn.execute(text(
+                    "ALTER TABLE credit_balances ADD changed_at DATETIME "
+                    "GENERATED ALWAYS AS (COALESCE(updated_at, created_at)) VIRTUAL"
+                ))
+                print("Column 'changed_at' added successfully.")
+            else:
+                # Persisted, so it is computed once per write and can be indexed
+                conn.execute(text(
+                    "ALTER TABLE credit_balances ADD changed_at AS COALESCE(updated_at, created_at) PERSISTED"
+                ))
+                print("Column 'changed_at' added successfully.")
+
+            indexes = [index['name'] for index in inspect(conn).get_indexes('credit_balances')]
+            if 'ix_credit_balances_changed_at' not in indexes:
+                conn.execute(text(
+                    "CREATE INDEX ix_credit_balances_changed_at ON credit_balances (changed_at)"
+                ))
+                print("Index 'ix_credit_balances_changed_at' created successfully.")
+
+        return True
+
+    except Exception as e:
+        print(f"Error adding changed_at column: {e}")
+        return False
+
+if __name__ == "__main__":
+    add_changed_at_column()
@@ -0,0 +1,38 @@
+from sqlalchemy import inspect, text
+from database import engine
+
+def add_voucher_key_column():
+    """Add the normalized voucher_key column and index to credit_balances and backfill it."""
+    try:
+        with engine.begin() as conn:
+            columns = [column['name'] for column in inspect(conn).get_columns('credit_balances')]
+            
+            if 'voucher_key' in columns:
+                print("Column 'voucher_key' already exists.")
+            else:
+                conn.execute(text("ALTER TABLE credit_balances ADD voucher_key VARCHAR(20) NULL"))
+                print("Column 'voucher_key' added successfully.")
+            
+            indexes = [index['name'] for index in inspect(conn).get_indexes('credit_balances')]
+            if 'ix_credit_balances_voucher_key' not in indexes:
+                conn.execute(text(
+                    "CREATE INDEX ix_credit_balances_voucher_key ON credit_balances (voucher_key)"
+                ))
+                print("Index 'ix_credit_balances_voucher_key' created successfully.")
+            
+            # Backfill from the existing voucher numbers
+            result = conn.execute(text("""
+                UPDATE credit_balances
+                SET voucher_key = UPPER(LTRIM(RTRIM(voucher_number)))
+                WHERE voucher_number IS NOT NULL
+            """))
+            print(f"Backfilled voucher_key for {result.rowcount} records.")
+        
+        return True
+        
+    except Exception as e:
+        print(f"Error adding voucher_key column: {e}")
+        return False
+
+if __name__ == "__main__":
+    add_voucher_key_column()
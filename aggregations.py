@@ -0,0 +1,113 @@
+from typing import Optional, Sequence
+
+from fastapi import HTTPException, status
+from sqlalchemy import extract, func, select
+from sqlalchemy.orm import Session
+
+import models
+from auth_cache import MISSING, TTLCache
+from config import settings
+from queries import filter_credit_balances
+from table_versions import CREDIT_BALANCES, get_table_version
+
+GROUP_DIMENSIONS = ('center', 'final_bucket', 'treatment_name', 'created_month')
+METRIC_COLUMNS = ('package_amount', 'amount_paid', 'balance_amount', 'prepaid_gift_card_balance', 'balance_sessions')
+AGGREGATES = {'sum': func.sum, 'avg': func.avg}
+METRICS = ('count',) + tuple(f"{name}_{column}" for name in AGGREGATES for column in METRIC_COLUMNS)
+DEFAULT_METRICS = ('count', 'sum_balance_amount', 'sum_balance_sessions')
+
+# Results are keyed by table version too, so entries never go stale; the TTL only bounds memory
+aggregation_cache = TTLCache(max_size=settings.AGGREGATION_CACHE_MAX_SIZE, ttl=settings.AGGREGATION_CACHE_TTL)
+
+
+def parse_names(
+    value: Optional[str],
+    allowed: Sequence[str],
+    default: Sequence[str],
+    parameter: str,
+    required: bool = False,
+) -> tuple:
+    """Validate a comma-separated list of names against `allowed`."""
+    if value is None:
+        return tuple(default)
+    names = tuple(dict.fromkeys(name.strip() for name in value.split(",") if name.strip()))
+    unknown = [name for name in names if name not in allowed]
+    if unknown or (required and not names):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Invalid {parameter} {unknown}. Use any of: {', '.join(allowed)}"
+        )
+    return names
+
+
+def _dimension_columns(dimension: str) -> list:
+    if dimension == 'created_month':
+        # Year and month separately: extract() compiles on SQL Server, SQLite and PostgreSQL alike
+        return [
+            extract('year', models.CreditBalance.created_at).label('created_year'),
+            extract('month', models.CreditBalance.created_at).label('created_month'),
+        ]
+    return [getattr(models.CreditBalance, dimension)]
+
+
+def _metric_column(metric: str):
+    if metric == 'count':
+        return func.count(models.CreditBalance.id).label(metric)
+    aggregate, column = metric.split('_', 1)
+    return AGGREGATES[aggregate](getattr(models.CreditBalance, column)).label(metric)
+
+
+def run_aggregation(db: Session, group_by: Sequence[str], metrics: Sequence[str], filters: Optional[dict] = None) -> list:
+    """One GROUP BY query; returns a dict per group with the dimension values and metrics.
+
+    `filters` are the client_code/client_name/center filters of the list routes.
+    """
+    dimension_columns = [column for dimension in group_by for column in _dimension_columns(dimension)]
+    stmt = select(*dimension_columns, *(_metric_column(metric) for metric in metrics))
+    stmt = filter_credit_balances(stmt, **(filters or {}))
+    if dimension_columns:
+        stmt = stmt.group_by(*dimension_columns).order_by(*dimension_columns)
+
+    groups = []
+    for row in db.execute(stmt).mappings():
+        group = {}
+        for dimension in group_by:
+            if dimension == 'created_month':
+                year, month = row['created_year'], row['created_month']
+                group[dimension] = f"{int(year):04d}-{int(month):02d}" if year is not None else None
+            else:
+                group[dimension] = row[dimension]
+        for metric in metrics:
+            group[metric] = row[metric] if row[metric] is not None else 0
+        groups.append(group)
+    return groups
+
+
+def aggregate(
+    db: Session,
+    group_by: Sequence[str],
+    metrics: Sequence[str],
+    version: Optional[int] = None,
+    snapshot=None,
+    filters: Optional[dict] = None,
+) -> dict:
+    """Grouped totals, served from the cache while the table version is unchanged.
+
+    With a column_store snapshot the groups are computed from it instead of
+    the database, and `version` is the snapshot's.
+    """
+    filters = {name: value for name, value in (filters or {}).items() if value}
+    if snapshot is not None:
+        version = snapshot.version
+    elif version is None:
+        version = get_table_version(db, CREDIT_BALANCES)
+    key = (version, tuple(group_by), tuple(metrics), tuple(sorted(filters.items())))
+    groups = aggregation_cache.get(key)
+    if groups is MISSING:
+        if snapshot is not None:
+            positions = snapshot.filter(**filters) if filters else None
+            groups = snapshot.aggregate(group_by, metrics, positions)
+        else:
+            groups = run_aggregation(db, group_by, metrics, filters)
+        aggregation_cache.set(key, groups)
+    return {"group_by": list(group_by), "metrics": list(metrics), "version": version, "groups": groups}
@@ -0,0 +1,202 @@
+import asyncio
+import ipaddress
+import logging
+from datetime import datetime, timezone
+from typing import List, Optional
+
+from fastapi import Request
+from sqlalchemy import insert
+
+import models
+from config import settings
+from database import SessionLocal
+
+logger = logging.getLogger(__name__)
+
+
+def parse_networks(value: str) -> list:
+    """Networks from a comma-separated list of addresses and CIDR ranges."""
+    return [ipaddress.ip_network(item.strip(), strict=False) for item in value.split(",") if item.strip()]
+
+
+TRUSTED_PROXIES = parse_networks(settings.TRUSTED_PROXIES)
+
+
+def _is_trusted(address: Optional[str], trusted_proxies) -> bool:
+    try:
+        ip = ipaddress.ip_address(address)
+    except (TypeError, ValueError):
+        return False
+    return any(ip in network for network in trusted_proxies)
+
+
+def client_ip(request: Request, trusted_proxies=None) -> Optional[str]:
+    """Client address, taken from X-Forwarded-For only when the peer is a trusted proxy.
+
+    The header is read right to left, skipping hops that are themselves
+    trusted proxies, so a client cannot put an address of its choosing
+    in front of the ones the proxies appended.
+    """
+    if trusted_proxies is None:
+        trusted_proxies = TRUSTED_PROXIES
+    peer = request.client.host if request.client else None
+    forwarded = request.headers.get("x-forwarded-for")
+    if not forwarded or not _is_trusted(peer, trusted_proxies):
+        return peer
+    hops = [hop.strip() for hop in forwarded.split(",") if hop.strip()]
+    for hop in reversed(hops):
+        if not _is_trusted(hop, trusted_proxies):
+            return hop[:45]
+    return hops[0][:45] if hops else peer
+
+
+def build_log_entry(request: Request, user_name: str, voucher_id: str, api_endpoint: str) -> dict:
+    """Build an ApiLog row for `request`, stamped with the time it was received."""
+    user_agent = request.headers.get("user-agent")
+    return {
+        "user_name": user_name,
+        "voucher_id": voucher_id,
+        "api_endpoint": api_endpoint,
+        "request_timestamp": datetime.now(timezone.utc),
+        "ip_address": client_ip(request),
+        "user_agent": user_agent[:500] if user_agent else None,
+    }
+
+
+class AuditLogWriter:
+    """Queues ApiLog rows in process and writes them in bulk in the background.
+
+    Entries are flushed with a single multi-row INSERT whenever `batch_size`
+    rows are waiting or `flush_interval` seconds have passed. The queue is
+    bounded; when it is full, `log` waits up to `put_timeout` seconds for room
+    and then drops the entry rather than stalling the request indefinitely.
+    """
+
+    def __init__(
+        self,
+        max_queue_size: int = 10000,
+        batch_size: int = 500,
+        flush_interval: float = 2.0,
+        put_timeout: float = 0.5,
+    ):
+        self.max_queue_size = max_queue_size
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.put_timeout = put_timeout
+        self.written = 0
+        self.dropped = 0
+        self.failed = 0
+        self._queue: Optional[asyncio.Queue] = None
+        self._task: Optional[asyncio.Task] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._closing = False
+
+    async def start(self):
+        self._closing = False
+        self._loop = asyncio.get_running_loop()
+        self._queue = asyncio.Queue(maxsize=self.max_queue_size)
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Stop the background task once everything still queued has been flushed."""
+        if self._task is None:
+            return
+        self._closing = True
+        await self._task
+        self._task = None
+        self._loop = None
+
+    async def log(self, entry: dict):
+        """Queue one ApiLog row; falls back to a direct write if the writer is not running."""
+        if self._task is None:
+            await self._flush([entry])
+            return
+        try:
+            await asyncio.wait_for(self._queue.put(entry), timeout=self.put_timeout)
+        except asyncio.TimeoutError:
+            self.dropped += 1
+            logger.warning(f"Audit log queue full, dropped entry for voucher '{entry['voucher_id']}'")
+
+    def submit(self, entry: dict):
+        """Queue one ApiLog row from a threadpool (sync) route handler.
+
+        Blocks the calling worker thread, never the event loop, for at most
+        `put_timeout` seconds when the queue is full.
+        """
+        if self._loop is None:
+            self._write([entry])
+            self.written += 1
+            return
+        asyncio.run_coroutine_threadsafe(self.log(entry), self._loop).result()
+
+    def write_many(self, entries: List[dict]):
+        """Write a batch of ApiLog rows straight away as one bulk insert (from a threadpool handler)."""
+        try:
+            self._write(entries)
+            self.written += len(entries)
+        except Exception as e:
+            self.failed += len(entries)
+            logger.error(f"Error writing {len(entries)} audit log entries: {e}")
+
+    def stats(self) -> dict:
+        return {
+            "queued": self._queue.qsize() if self._queue else 0,
+            "written": self.written,
+            "dropped": self.dropped,
+            "failed": self.failed,
+        }
+
+    async def _run(self):
+        while True:
+            batch = await self._collect()
+            if batch:
+                await self._flush(batch)
+            elif self._closing:
+                return
+
+    async def _collect(self) -> List[dict]:
+        """Gather up to batch_size entries, waiting at most flush_interval."""
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.flush_interval
+        batch = []
+        while len(batch) < self.batch_size:
+            if not self._queue.empty():
+                batch.append(self._queue.get_nowait())
+                continue
+            timeout = deadline - loop.time()
+            if timeout <= 0 or self._closing:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), timeout=timeout))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    async def _flush(self, batch: List[dict]):
+        if not batch:
+            return
+        try:
+            await asyncio.to_thread(self._write, batch)
+            self.written += len(batch)
+        except Exception as e:
+            self.failed += len(batch)
+            logger.error(f"Error writing {len(batch)} audit log entries: {e}")
+
+    @staticmethod
+    def _write(batch: List[dict]):
+        db = SessionLocal()
+        try:
+            db.execute(insert(models.ApiLog), batch)
+            db.commit()
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+
+
+audit_log_writer = AuditLogWriter(
+    max_queue_size=settings.AUDIT_LOG_QUEUE_SIZE,
+    batch_size=settings.AUDIT_LOG_BATCH_SIZE,
+    flush_interval=settings.AUDIT_LOG_FLUSH_INTERVAL,
+)
@@ -0,0 +1,107 @@
+import threading
+import time
+from collections import OrderedDict
+
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import Session
+
+import models
+from config import settings
+
+MISSING = object()
+
+
+class TTLCache:
+    """Small thread-safe LRU cache whose entries expire after `ttl` seconds."""
+
+    def __init__(self, max_size: int = 1024, ttl: float = 60.0):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] < time.monotonic():
+                if entry is not None:
+                    del self._entries[key]
+                self.misses += 1
+                return MISSING
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def set(self, key, value):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, key=None):
+        """Drop one key, or everything when no key is given."""
+        with self._lock:
+            if key is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(key, None)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "size": len(self._entries),
+                "max_size": self.max_size,
+                "ttl_seconds": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+            }
+
+
+user_cache = TTLCache(max_size=settings.AUTH_CACHE_MAX_SIZE, ttl=settings.AUTH_CACHE_TTL)
+center_cache = TTLCache(max_size=settings.AUTH_CACHE_MAX_SIZE, ttl=settings.AUTH_CACHE_TTL)
+
+
+def _load(db: Session, cache: TTLCache, key, query):
+    cached = cache.get(key)
+    if cached is not MISSING:
+        return cached
+    instance = query.first()
+    if instance is not None:
+        # Detach so the cached copy is not expired by a later commit on this session
+        db.expunge(instance)
+        cache.set(key, instance)
+    return instance
+
+
+def get_cached_user(db: Session, username: str):
+    """User by username, served from the cache when fresh."""
+    return _load(db, user_cache, username, db.query(models.User).filter(models.User.username == username))
+
+
+def get_cached_center(db: Session, center_id: int):
+    """Center by id, served from the cache when fresh."""
+    return _load(db, center_cache, center_id, db.query(models.Center).filter(models.Center.id == center_id))
+
+
+def cache_stats() -> dict:
+    return {"users": user_cache.stats(), "centers": center_cache.stats()}
+
+
+# Drop cached entries as soon as this process changes a user or center;
+# changes made elsewhere are bounded by the TTL.
+@event.listens_for(models.User, "after_update")
+@event.listens_for(models.User, "after_delete")
+def _invalidate_user(mapper, connection, target):
+    user_cache.invalidate(target.username)
+    # The username itself may have changed, so also drop the previous key
+    for old_username in inspect(target).attrs.username.history.deleted or ():
+        user_cache.invalidate(old_username)
+
+
+@event.listens_for(models.Center, "after_update")
+@event.listens_for(models.Center, "after_delete")
+def _invalidate_center(mapper, connection, target):
+    center_cache.invalidate(target.id)
@@ -0,0 +1,182 @@
+"""Batched create / update / delete of credit balances in a single transaction.
+
+Every operation in a batch is checked first (one chunked IN query loads all
+rows being updated or deleted). The writes are then sent as one executemany
+INSERT, one executemany UPDATE and chunked DELETEs, and the table version is
+bumped once for the whole batch.
+"""
+from collections import Counter
+from types import SimpleNamespace
+from typing import List
+
+import pandas as pd
+from sqlalchemy import bindparam, delete, insert, select, update
+from sqlalchemy.orm import Session
+
+import models
+import schemas
+from centers import assign_centers, center_resolver
+from change_bus import change_bus, delete_event, record_event
+from change_feed import record_deletes
+from column_store import credit_balance_store
+from queries import chunked
+from search_index import search_index
+from summary_stats import summary_stats_cache, summary_values
+from table_versions import CREDIT_BALANCES, bump_table_version
+from vouchers import generate_voucher_numbers
+
+# Columns set by the database: read back after the writes
+DATABASE_COLUMNS = ('id', 'created_at', 'updated_at', 'changed_at')
+# Everything a batch may write
+WRITE_COLUMNS = [
+    column.name for column in models.CreditBalance.__table__.columns
+    if column.name not in DATABASE_COLUMNS
+]
+VOUCHER_FIELDS = ('center', 'client_code', 'phone_no')
+
+
+def _result(op: str, index: int, record_id=None, error: str = None) -> dict:
+    return {"op": op, "index": index, "id": record_id, "status": "error" if error else "ok", "error": error}
+
+
+def _load_existing(db: Session, ids: List[int]) -> dict:
+    table = models.CreditBalance.__table__
+    existing = {}
+    for chunk in chunked(sorted(set(ids))):
+        for row in db.execute(select(table).where(table.c.id.in_(chunk))).mappings():
+            existing[row['id']] = dict(row)
+    return existing
+
+
+def _insert_records(db: Session, creates: List[schemas.CreditBalanceCreate]) -> List[dict]:
+    """Insert new rows with vectorized center and voucher assignment; returns them with their ids."""
+    frame = pd.DataFrame([item.dict() for item in creates])
+    assign_centers(db, frame)
+    frame['voucher_key'] = frame['voucher_number'].str.strip().str.upper()
+    records = frame[WRITE_COLUMNS].astype(object).where(frame[WRITE_COLUMNS].notna(), None).to_dict('records')
+
+    table = models.CreditBalance.__table__
+    rows = db.execute(
+        insert(table).returning(*(table.c[column] for column in DATABASE_COLUMNS), sort_by_parameter_order=True),
+        records
+    ).all()
+    for record, row in zip(records, rows):
+        record.update(row._mapping)
+    return records
+
+
+def _refresh_timestamps(db: Session, records: List[dict]):
+    """Copy the audit timestamps the UPDATE just set into `records`, so change events carry them."""
+    table = models.CreditBalance.__table__
+    by_id = {record['id']: record for record in records}
+    for chunk in chunked(list(by_id)):
+        for row in db.execute(select(*(table.c[column] for column in DATABASE_COLUMNS)).where(table.c.id.in_(chunk))):
+            by_id[row.id].update(row._mapping)
+
+
+def _updated_records(db: Session, updates: List[schemas.CreditBalanceBatchUpdate], existing: dict) -> List[dict]:
+    """Merge each update into its current row, re-deriving center_id and the voucher where needed."""
+    merged_rows, regenerate = [], []
+    for item in updates:
+        changes = item.dict(exclude_unset=True, exclude={'id'})
+        merged = {**existing[item.id], **changes}
+        if 'center' in changes:
+            merged['center_id'] = center_resolver.resolve(db, merged['center'])
+        if any(field in changes for field in VOUCHER_FIELDS):
+            regenerate.append(merged)
+        merged_rows.append(merged)
+
+    if regenerate:
+        frame = pd.DataFrame(regenerate)
+        center_codes = frame['center_id'].map(center_resolver.codes(db))
+        vouchers = generate_voucher_numbers(frame['client_code'], frame['phone_no'], frame['center'], center_codes)
+        for merged, voucher in zip(regenerate, vouchers):
+            merged['voucher_number'] = voucher
+    for merged in merged_rows:
+        merged['voucher_key'] = models.normalize_voucher(merged['voucher_number'])
+    return merged_rows
+
+
+def apply_batch(db: Session, batch: schemas.CreditBalanceBatchRequest) -> dict:
+    """Validate and apply a batch; returns a CreditBalanceBatchResponse body."""
+    existing = _load_existing(db, [item.id for item in batch.update] + list(batch.delete))
+    occurrences = Counter([item.id for item in batch.update] + list(batch.delete))
+
+    def check(op: str, index: int, record_id: int) -> dict:
+        if record_id not in existing:
+            return _result(op, index, record_id, "Credit balance not found")
+        if occurrences[record_id] > 1:
+            return _result(op, index, record_id, "Id appears more than once in this batch")
+        return _result(op, index, record_id)
+
+    create_results = [_result("create", index) for index in range(len(batch.create))]
+    update_results = [check("update", index, item.id) for index, item in enumerate(batch.update)]
+    delete_results = [check("delete", index, record_id) for index, record_id in enumerate(batch.delete)]
+    results = create_results + update_results + delete_results
+
+    if batch.atomic and any(result["status"] == "error" for result in results):
+        for result in results:
+            if result["status"] == "ok":
+                result["status"] = "skipped"
+        return {"committed": False, "results": results}
+
+    updates = [item for item, result in zip(batch.update, update_results) if result["status"] == "ok"]
+    delete_ids = [record_id for record_id, result in zip(batch.delete, delete_results) if result["status"] == "ok"]
+    table = models.CreditBalance.__table__
+    try:
+        created = _insert_records(db, batch.create) if batch.create else []
+        for result, record in zip(create_results, created):
+            result["id"] = record["id"]
+
+        updated = _updated_records(db, updates, existing) if updates else []
+        if updated:
+            db.execute(
+                update(table)
+                .where(table.c.id == bindparam('b_id'))
+                .values({column: bindparam(f'b_{column}') for column in WRITE_COLUMNS}),
+                [{f'b_{column}': record[column] for column in ['id'] + WRITE_COLUMNS} for record in updated]
+            )
+            _refresh_timestamps(db, updated)
+        for chunk in chunked(delete_ids):
+            record_deletes(db, table.c.id.in_(chunk))
+            db.execute(delete(table).where(table.c.id.in_(chunk)))
+
+        version = bump_table_version(db, CREDIT_BALANCES)
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+
+    # One version bump covers the whole batch
+    summary_stats_cache.record_changes(
+        [(None, summary_values(SimpleNamespace(**record))) for record in created]
+        + [
+            (summary_values(SimpleNamespace(**existing[record['id']])), summary_values(SimpleNamespace(**record)))
+            for record in updated
+        ]
+        + [(summary_values(SimpleNamespace(**existing[record_id])), None) for record_id in delete_ids],
+        version,
+    )
+    search_index.record_changes(
+        [(record['id'], SimpleNamespace(**record)) for record in created + updated]
+        + [(record_id, None) for record_id in delete_ids],
+        version,
+    )
+    credit_balance_store.expire()
+    change_bus.publish(
+        [record_event(SimpleNamespace(**record)) for record in created]
+        + [
+            delete_event(record['id'], existing[record['id']]['center_id'])
+            for record in updated if record['center_id'] != existing[record['id']]['center_id']
+        ]
+        + [record_event(SimpleNamespace(**record)) for record in updated]
+        + [delete_event(record_id, existing[record_id]['center_id']) for record_id in delete_ids],
+        version,
+    )
+    return {
+        "committed": True,
+        "created": len(created),
+        "updated": len(updated),
+        "deleted": len(delete_ids),
+        "results": results,
+    }
@@ -0,0 +1,207 @@
+"""Scripted endpoint benchmarks against a local stand-in database.
+
+Starts the API in-process, replays each scenario with concurrent clients and
+prints p50/p95/p99 latency, throughput and peak RSS as JSON, so runs can be
+compared across releases:
+
+    SQLALCHEMY_DATABASE_URL=sqlite:///bench.db python benchmark_api.py --generate 100000 --output results.json
+
+Without --generate the existing contents of the database are used (see
+benchmark_data.py).
+"""
+import argparse
+import json
+import threading
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+
+import numpy as np
+import uvicorn
+from sqlalchemy import func, select
+
+import models
+from benchmark_concurrency import percentile
+from benchmark_data import BENCHMARK_PASSWORD, dataset_counts, generate, prepare_database
+from config import settings
+from database import SessionLocal, engine
+from metrics import DB_QUERIES_HEADER, DB_TIME_HEADER
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+SCENARIOS = ('list', 'filter', 'by-voucher', 'summary', 'login')
+SAMPLE_SIZE = 200
+
+
+def peak_rss_mb():
+    if resource is None:
+        return None
+    # ru_maxrss is in kilobytes on Linux
+    return round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+
+
+def sample_rows(seed: int = 42) -> list:
+    """Random existing (voucher_number, client_name, center) rows to build requests from."""
+    db = SessionLocal()
+    try:
+        low, high = db.execute(select(func.min(models.CreditBalance.id), func.max(models.CreditBalance.id))).one()
+        if low is None:
+            raise SystemExit("No credit balances to benchmark; run with --generate or benchmark_data.py first")
+        ids = np.random.default_rng(seed).integers(low, high + 1, SAMPLE_SIZE).tolist()
+        return db.execute(
+            select(models.CreditBalance.voucher_number, models.CreditBalance.client_name, models.CreditBalance.center)
+            .where(models.CreditBalance.id.in_(ids))
+        ).all()
+    finally:
+        db.close()
+
+
+def scenario_requests(name: str, rows: list, users: int):
+    """Returns a function building the i-th (path, JSON body or None) for a scenario."""
+    if name == 'list':
+        return lambda i: ("/credit-balances/?limit=100", None)
+    if name == 'filter':
+        return lambda i: (
+            f"/credit-balances/?limit=100&client_name={rows[i % len(rows)].client_name.split()[-1]}"
+            f"&center={urllib.request.quote(rows[i % len(rows)].center)}",
+            None,
+        )
+    if name == 'by-voucher':
+        return lambda i: ("/credit-balances/by-voucher", {
+            "user_name": f"bench_user_{i % max(users, 1)}",
+            "voucher_id": rows[i % len(rows)].voucher_number,
+        })
+    if name == 'summary':
+        return lambda i: ("/credit-balances/stats/summary", None)
+    if name == 'login':
+        return lambda i: ("/login", {"username": f"bench_user_{i % max(users, 1)}", "password": BENCHMARK_PASSWORD})
+    raise ValueError(f"Unknown scenario '{name}'")
+
+
+def send(base_url: str, path: str, body):
+    """Returns (ok, SQL statements, database ms) for one request."""
+    request = urllib.request.Request(
+        base_url + path,
+        data=None if body is None else json.dumps(body).encode(),
+        headers={"Content-Type": "application/json"},
+    )
+    try:
+        with urllib.request.urlopen(request, timeout=120) as response:
+            response.read()
+            return (
+                response.status < 400,
+                int(response.headers.get(DB_QUERIES_HEADER, 0)),
+                float(response.headers.get(DB_TIME_HEADER, 0)),
+            )
+    except urllib.error.URLError:
+        return False, 0, 0.0
+
+
+def run_scenario(base_url: str, build, requests: int, concurrency: int, warmup: int) -> dict:
+    for i in range(warmup):
+        send(base_url, *build(i))
+
+    def timed(i):
+        started = time.perf_counter()
+        result = send(base_url, *build(i))
+        return (time.perf_counter() - started, *result)
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        results = list(pool.map(timed, range(requests)))
+    elapsed = time.perf_counter() - started
+
+    latencies = [latency for latency, _, _, _ in results]
+    return {
+        "requests": requests,
+        "errors": sum(1 for _, ok, _, _ in results if not ok),
+        # A jump here between releases usually means an N+1 query pattern
+        "db_queries_per_request": round(sum(queries for _, _, queries, _ in results) / requests, 2),
+        "db_ms_per_request": round(sum(db_ms for _, _, _, db_ms in results) / requests, 1),
+        "throughput_rps": round(requests / elapsed, 1),
+        "p50_ms": round(percentile(latencies, 0.50) * 1000, 1),
+        "p95_ms": round(percentile(latencies, 0.95) * 1000, 1),
+        "p99_ms": round(percentile(latencies, 0.99) * 1000, 1),
+        "peak_rss_mb": peak_rss_mb(),
+    }
+
+
+def start_server(app, port: int):
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning"))
+    thread = threading.Thread(target=server.run, daemon=True)
+    thread.start()
+    while not server.started:
+        time.sleep(0.05)
+    return server, thread
+
+
+def run(scenarios, requests: int, concurrency: int, warmup: int, port: int) -> dict:
+    # Imported late: main runs create_all on import, which needs the delhi schema from prepare_database()
+    settings.QUERY_STATS_HEADER = True
+    from main import app
+
+    db = SessionLocal()
+    try:
+        counts = dataset_counts(db)
+    finally:
+        db.close()
+    rows = sample_rows()
+    server, thread = start_server(app, port)
+    base_url = f"http://127.0.0.1:{port}"
+
+    report = {
+        "app_version": app.version,
+        "started_at": datetime.now(timezone.utc).isoformat(),
+        "database": engine.dialect.name,
+        "dataset": counts,
+        "requests": requests,
+        "concurrency": concurrency,
+        "scenarios": {},
+    }
+    try:
+        for name in scenarios:
+            report["scenarios"][name] = run_scenario(
+                base_url, scenario_requests(name, rows, counts["users"]), requests, concurrency, warmup
+            )
+    finally:
+        # Let shutdown run so queued audit log entries are written
+        server.should_exit = True
+        thread.join()
+    report["peak_rss_mb"] = peak_rss_mb()
+    return report
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Endpoint benchmarks against a local stand-in database")
+    parser.add_argument("--generate", type=int, metavar="ROWS", help="Regenerate the dataset with this many credit balances first")
+    parser.add_argument("--users", type=int, default=100)
+    parser.add_argument("--api-logs", type=int, default=10000)
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS), help="Comma-separated subset of " + ", ".join(SCENARIOS))
+    parser.add_argument("--requests", type=int, default=200, help="Requests per scenario")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--warmup", type=int, default=10)
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--output", help="Write the JSON report to this file instead of stdout")
+    args = parser.parse_args()
+
+    prepare_database()
+    if args.generate:
+        generate(args.generate, args.users, args.api_logs)
+    selected = [name.strip() for name in args.scenarios.split(",") if name.strip()]
+    unknown = set(selected) - set(SCENARIOS)
+    if unknown:
+        parser.error(f"Unknown scenarios: {', '.join(sorted(unknown))}")
+
+    report = run(selected, args.requests, args.concurrency, args.warmup, args.port)
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as handle:
+            handle.write(output)
+        print(f"Wrote {args.output}")
+    else:
+        print(output)
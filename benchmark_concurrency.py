@@ -0,0 +1,96 @@
+"""Measure API throughput as the number of concurrent clients grows.
+
+Each step runs N client threads that call the target endpoint for a fixed
+duration while a separate prober times GET /health, showing whether slow
+database-bound requests stall unrelated ones. Start the server first
+(python run.py) and then run:
+
+    python benchmark_concurrency.py --url http://localhost:8000 --path "/credit-balances/?limit=100"
+"""
+import argparse
+import json
+import threading
+import time
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+
+def timed_get(url: str, timeout: float) -> float:
+    started = time.perf_counter()
+    with urllib.request.urlopen(url, timeout=timeout) as response:
+        response.read()
+    return time.perf_counter() - started
+
+
+def percentile(samples, fraction: float) -> float:
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+def run_step(base_url: str, path: str, clients: int, duration: float, timeout: float) -> dict:
+    stop = threading.Event()
+    latencies, health_latencies, errors = [], [], [0]
+    lock = threading.Lock()
+
+    def client():
+        while not stop.is_set():
+            try:
+                elapsed = timed_get(base_url + path, timeout)
+                with lock:
+                    latencies.append(elapsed)
+            except Exception:
+                with lock:
+                    errors[0] += 1
+
+    def health_prober():
+        while not stop.is_set():
+            try:
+                health_latencies.append(timed_get(base_url + "/health", timeout))
+            except Exception:
+                pass
+            time.sleep(0.05)
+
+    with ThreadPoolExecutor(max_workers=clients + 1) as pool:
+        for _ in range(clients):
+            pool.submit(client)
+        pool.submit(health_prober)
+        time.sleep(duration)
+        stop.set()
+
+    return {
+        "clients": clients,
+        "requests": len(latencies),
+        "errors": errors[0],
+        "throughput_rps": round(len(latencies) / duration, 1),
+        "latency_p50_ms": round(percentile(latencies, 0.50) * 1000, 1),
+        "latency_p95_ms": round(percentile(latencies, 0.95) * 1000, 1),
+        "health_p50_ms": round(percentile(health_latencies, 0.50) * 1000, 1),
+        "health_p95_ms": round(percentile(health_latencies, 0.95) * 1000, 1),
+        "health_max_ms": round(max(health_latencies, default=0) * 1000, 1),
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Concurrency benchmark for the credit balance API")
+    parser.add_argument("--url", default="http://localhost:8000")
+    parser.add_argument("--path", default="/credit-balances/?limit=100")
+    parser.add_argument("--clients", default="1,2,4,8,16,32", help="Comma-separated client counts")
+    parser.add_argument("--duration", type=float, default=10.0, help="Seconds per step")
+    parser.add_argument("--timeout", type=float, default=60.0)
+    parser.add_argument("--json", action="store_true", help="Print results as JSON")
+    args = parser.parse_args()
+
+    results = []
+    for clients in (int(value) for value in args.clients.split(",")):
+        result = run_step(args.url, args.path, clients, args.duration, args.timeout)
+        results.append(result)
+        if not args.json:
+            print(
+                f"{clients:>4} clients  {result['throughput_rps']:>8} req/s  "
+                f"p50 {result['latency_p50_ms']:>7}ms  p95 {result['latency_p95_ms']:>7}ms  "
+                f"/health p95 {result['health_p95_ms']:>7}ms  errors {result['errors']}"
+            )
+    if args.json:
+        print(json.dumps(results, indent=2))
@@ -0,0 +1,155 @@
+"""Fill a local stand-in database with synthetic credit balances, centers, users and API logs.
+
+Refuses to run against the production SQL Server: point SQLALCHEMY_DATABASE_URL
+at a local database first, e.g.
+
+    SQLALCHEMY_DATABASE_URL=sqlite:///bench.db python benchmark_data.py --rows 1000000
+
+Every generated user can log in with the password in BENCHMARK_PASSWORD.
+"""
+import argparse
+import logging
+import time
+from datetime import datetime, timedelta, timezone
+
+import numpy as np
+from passlib.context import CryptContext
+from sqlalchemy import delete, func, insert, select, text
+from sqlalchemy.orm import Session
+
+import models
+from benchmark_import import CENTER_CODES, CENTERS, synthetic_report
+from bulk_import import DEFAULT_BATCH_SIZE, bulk_insert_credit_balances, clean_credit_balance_frame
+from centers import assign_centers, center_resolver
+from config import settings
+from database import SessionLocal, engine
+from table_versions import CREDIT_BALANCES, bump_table_version
+
+logger = logging.getLogger(__name__)
+
+BENCHMARK_PASSWORD = "benchmark"
+CHUNK_SIZE = 100000
+USER_AGENTS = ['PostmanRuntime/7.36.0', 'okhttp/4.12.0', 'Mozilla/5.0 (Windows NT 10.0; Win64; x64)']
+
+
+def prepare_database():
+    if not settings.SQLALCHEMY_DATABASE_URL:
+        raise SystemExit("Set SQLALCHEMY_DATABASE_URL to a local database before generating benchmark data")
+    if engine.dialect.name == "postgresql":
+        with engine.begin() as connection:
+            connection.execute(text("CREATE SCHEMA IF NOT EXISTS delhi"))
+    models.Base.metadata.create_all(bind=engine)
+
+
+def clear_benchmark_tables(db: Session):
+    # Children first: credit balances and users reference centers
+    for model in (models.ApiLog, models.User, models.CreditBalance, models.CreditBalanceTombstone, models.Center):
+        db.execute(delete(model))
+    db.commit()
+
+
+def seed_centers(db: Session) -> list:
+    db.execute(insert(models.Center), [
+        {'name': name, 'code': code, 'is_active': True} for name, code in zip(CENTERS, CENTER_CODES)
+    ])
+    db.commit()
+    return db.execute(select(models.Center.id)).scalars().all()
+
+
+def seed_users(db: Session, count: int, center_ids: list) -> int:
+    # bcrypt is deliberately slow, so every user shares one hash
+    hashed_password = CryptContext(schemes=["bcrypt"], deprecated="auto").hash(BENCHMARK_PASSWORD)
+    db.execute(insert(models.User), [
+        {
+            'username': f"bench_user_{i}",
+            'email': f"bench_user_{i}@example.com",
+            'hashed_password': hashed_password,
+            'full_name': f"Benchmark User {i}",
+            'role': "USER",
+            'center_id': center_ids[i % len(center_ids)],
+            'is_active': True,
+            'is_verified': True,
+        }
+        for i in range(count)
+    ])
+    db.commit()
+    return count
+
+
+def seed_credit_balances(db: Session, rows: int, seed: int = 42, batch_size: int = DEFAULT_BATCH_SIZE) -> int:
+    """Insert `rows` report rows through the same cleaning and voucher code as the bulk importer."""
+    inserted = 0
+    for start in range(0, rows, CHUNK_SIZE):
+        frame = clean_credit_balance_frame(synthetic_report(min(CHUNK_SIZE, rows - start), seed, start))
+        assign_centers(db, frame)
+        inserted += bulk_insert_credit_balances(db, frame, batch_size)
+    return inserted
+
+
+def seed_api_logs(db: Session, count: int, users: int, seed: int = 42, batch_size: int = DEFAULT_BATCH_SIZE) -> int:
+    """Voucher lookups spread over the last 90 days, against vouchers that exist."""
+    rng = np.random.default_rng(seed)
+    vouchers = db.execute(
+        select(models.CreditBalance.voucher_number).limit(10000)
+    ).scalars().all() or ['XX0000000']
+    now = datetime.now(timezone.utc)
+    voucher_choice = rng.integers(0, len(vouchers), count)
+    user_choice = rng.integers(0, max(users, 1), count)
+    age_seconds = rng.integers(0, 90 * 24 * 3600, count)
+    ip_octets = rng.integers(1, 255, (count, 2))
+    agent_choice = rng.integers(0, len(USER_AGENTS), count)
+
+    for start in range(0, count, batch_size):
+        db.execute(insert(models.ApiLog), [
+            {
+                'user_name': f"bench_user_{user_choice[i]}",
+                'voucher_id': vouchers[voucher_choice[i]],
+                'api_endpoint': "/credit-balances/by-voucher",
+                'request_timestamp': now - timedelta(seconds=int(age_seconds[i])),
+                'ip_address': f"10.0.{ip_octets[i, 0]}.{ip_octets[i, 1]}",
+                'user_agent': USER_AGENTS[agent_choice[i]],
+            }
+            for i in range(start, min(start + batch_size, count))
+        ])
+        db.commit()
+    return count
+
+
+def generate(credit_balances: int, users: int = 100, api_logs: int = 10000, seed: int = 42) -> dict:
+    """Replace the benchmark tables with a fresh synthetic dataset; returns row counts."""
+    prepare_database()
+    started = time.perf_counter()
+    db = SessionLocal()
+    try:
+        clear_benchmark_tables(db)
+        center_ids = seed_centers(db)
+        center_resolver.invalidate()
+        seed_users(db, users, center_ids)
+        seed_credit_balances(db, credit_balances, seed)
+        seed_api_logs(db, api_logs, users, seed)
+        bump_table_version(db, CREDIT_BALANCES)
+        db.commit()
+        counts = dataset_counts(db)
+    finally:
+        db.close()
+    logger.info(f"Generated {counts} in {time.perf_counter() - started:.1f}s")
+    return counts
+
+
+def dataset_counts(db: Session) -> dict:
+    return {
+        model.__tablename__: db.execute(select(func.count()).select_from(model)).scalar()
+        for model in (models.CreditBalance, models.Center, models.User, models.ApiLog)
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=100000, help="Credit balance rows (10k to 5M)")
+    parser.add_argument("--users", type=int, default=100)
+    parser.add_argument("--api-logs", type=int, default=10000)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+    print(generate(args.rows, args.users, args.api_logs, args.seed))
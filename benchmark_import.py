@@ -0,0 +1,117 @@
+"""Compare the row-by-row Excel import path with the bulk loader on a local SQLite database.
+
+Usage: python benchmark_import.py [--rows 100000] [--batch-size 5000]
+"""
+import argparse
+import os
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+# Importing the models builds the app's engine (SQL Server through pyodbc unless
+# SQLALCHEMY_DATABASE_URL is set). This script only uses its own SQLite files,
+# so point that engine at an unused in-memory database instead.
+os.environ.setdefault("SQLALCHEMY_DATABASE_URL", "sqlite://")
+
+from models import CreditBalance
+from bulk_import import DEFAULT_BATCH_SIZE, clean_credit_balance_frame, bulk_insert_credit_balances
+
+CENTERS = ['GK2', 'Punjabi Bagh', 'Preet Vihar', 'Pitampura']
+CENTER_CODES = ['GK', 'PB', 'PV', 'PT']
+BUCKETS = ['Peels', 'Laser Hair Reduction', 'Hydrafacial', 'Hair PRP']
+TREATMENTS = ['Tan-Face-Reviving-15', 'LHR-Full-Body-6', 'Hydra-Glow-3', 'PRP-Scalp-4', 'Peel-Glycolic-6']
+FIRST_NAMES = ['Aarav', 'Ananya', 'Rohan', 'Priya', 'Vikram', 'Neha', 'Arjun', 'Kavya', 'Rahul', 'Isha', 'Sanjay', 'Meera']
+LAST_NAMES = ['Sharma', 'Verma', 'Gupta', 'Kapoor', 'Mehta', 'Singh', 'Malhotra', 'Chopra', 'Bansal', 'Arora']
+
+
+def synthetic_report(rows: int, seed: int = 42, start: int = 0) -> pd.DataFrame:
+    """A DataFrame shaped like the monthly credit balance report sheet.
+
+    Clients hold one to three packages each, at a single center. `start`
+    offsets the client numbering so large datasets can be built in chunks.
+    """
+    rng = np.random.default_rng(seed + start)
+    client = start + np.cumsum(rng.random(rows) < 0.6)  # ~1.7 packages per client
+    center = client % len(CENTERS)
+    package = rng.integers(1000, 200000, rows)
+    paid = (package * rng.random(rows)).round(2)
+    sessions = rng.integers(1, 12, rows).astype(float)
+    consumed = np.floor(sessions * rng.random(rows))
+    first = np.array(FIRST_NAMES)[client % len(FIRST_NAMES)]
+    last = np.array(LAST_NAMES)[(client // len(FIRST_NAMES)) % len(LAST_NAMES)]
+    phone = 7000000000 + (client * 7919) % 2999999999
+    return pd.DataFrame({
+        'Client Code': [f"{CENTER_CODES[c]}{i:07d}" for c, i in zip(center, client)],
+        'Client name': [f"{f} {l}" for f, l in zip(first, last)],
+        'Phone No': phone,
+        "Email ID's": [f"{f.lower()}.{l.lower()}{i}@example.com" if i % 3 else None for f, l, i in zip(first, last, client)],
+        'Treatment Name': rng.choice(TREATMENTS, rows),
+        'Package Amount (₹)': [f"{value:,}" for value in package],
+        'Amount Paid by the client': paid,
+        'Balance Amount (₹)': (package - paid).round(2),
+        'Prepaid / Gift Card Balance': 0.0,
+        'Center': np.array(CENTERS)[center],
+        'Final Bucket': rng.choice(BUCKETS, rows),
+        'Sessions Paid': sessions,
+        'Sessions Consumed': consumed,
+        'Balance Sessions': sessions - consumed,
+    })
+
+
+def row_by_row_load(db, df: pd.DataFrame) -> int:
+    """The per-row ORM path used by import_excel.py, kept here as the baseline."""
+    imported_count = 0
+    for index, row in df.iterrows():
+        db.add(CreditBalance(
+            client_code=str(row.get('Client Code', '')),
+            client_name=str(row.get('Client name', '')),
+            phone_no=str(row.get('Phone No', '')) if pd.notna(row.get('Phone No')) else None,
+            treatment_name=str(row.get('Treatment Name', '')) if pd.notna(row.get('Treatment Name')) else None,
+            package_amount=float(str(row.get('Package Amount (₹)', 0)).replace(',', '')) if pd.notna(row.get('Package Amount (₹)')) else 0.0,
+            amount_paid=float(str(row.get('Amount Paid by the client', 0)).replace(',', '')) if pd.notna(row.get('Amount Paid by the client')) else 0.0,
+            balance_amount=float(str(row.get('Balance Amount (₹)', 0)).replace(',', '')) if pd.notna(row.get('Balance Amount (₹)')) else 0.0,
+            prepaid_gift_card_balance=float(str(row.get('Prepaid / Gift Card Balance', 0)).replace(',', '')) if pd.notna(row.get('Prepaid / Gift Card Balance')) else 0.0,
+            center=str(row.get('Center', '')) if pd.notna(row.get('Center')) else None,
+            final_bucket=str(row.get('Final Bucket', '')) if pd.notna(row.get('Final Bucket')) else None,
+            sessions_paid=float(row.get('Sessions Paid', 0)) if pd.notna(row.get('Sessions Paid')) else 0.0,
+            sessions_consumed=float(row.get('Sessions Consumed', 0)) if pd.notna(row.get('Sessions Consumed')) else 0.0,
+            balance_sessions=float(row.get('Balance Sessions', 0)) if pd.notna(row.get('Balance Sessions')) else 0.0,
+        ))
+        imported_count += 1
+        if imported_count % 100 == 0:
+            db.commit()
+    db.commit()
+    return imported_count
+
+
+def run(label: str, load, df: pd.DataFrame) -> float:
+    with tempfile.TemporaryDirectory() as directory:
+        engine = create_engine(f"sqlite:///{os.path.join(directory, 'bench.db')}")
+        CreditBalance.__table__.create(engine)
+        db = sessionmaker(bind=engine)()
+        try:
+            started = time.perf_counter()
+            count = load(db, df)
+            elapsed = time.perf_counter() - started
+        finally:
+            db.close()
+            engine.dispose()
+    rate = count / elapsed
+    print(f"{label:<12} {count:>9,} rows  {elapsed:8.2f}s  {rate:>12,.0f} rows/s")
+    return rate
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=100000)
+    parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE)
+    args = parser.parse_args()
+
+    report = synthetic_report(args.rows)
+    baseline = run("row-by-row", row_by_row_load, report)
+    bulk = run("bulk", lambda db, df: bulk_insert_credit_balances(db, clean_credit_balance_frame(df), args.batch_size), report)
+    print(f"Speed-up: {bulk / baseline:.1f}x")
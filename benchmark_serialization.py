@@ -0,0 +1,81 @@
+"""Compare the ORM + Pydantic response path with the column-tuple + orjson path on a local SQLite database.
+
+Usage: python benchmark_serialization.py [--rows 1000,10000,100000] [--repeat 3]
+"""
+import argparse
+import json
+import os
+import tempfile
+import time
+from typing import List
+
+from pydantic import TypeAdapter
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+# Importing the models builds the app's engine (SQL Server through pyodbc unless
+# SQLALCHEMY_DATABASE_URL is set). This script only uses its own SQLite files,
+# so point that engine at an unused in-memory database instead.
+os.environ.setdefault("SQLALCHEMY_DATABASE_URL", "sqlite://")
+
+import models
+import schemas
+from benchmark_import import synthetic_report
+from bulk_import import bulk_insert_credit_balances, clean_credit_balance_frame
+from serialization import credit_balance_columns, rows_response
+from vouchers import generate_voucher_numbers
+
+RESPONSE_ADAPTER = TypeAdapter(List[schemas.CreditBalance])
+
+
+def model_path(db, rows: int) -> bytes:
+    """What FastAPI does for response_model=List[schemas.CreditBalance]."""
+    records = db.query(models.CreditBalance).order_by(models.CreditBalance.id).limit(rows).all()
+    content = RESPONSE_ADAPTER.dump_python(RESPONSE_ADAPTER.validate_python(records), mode="json")
+    return json.dumps(content, ensure_ascii=False, allow_nan=False, separators=(",", ":")).encode("utf-8")
+
+
+def fast_path(db, rows: int) -> bytes:
+    records = db.query(*credit_balance_columns()).order_by(models.CreditBalance.id).limit(rows).all()
+    return rows_response(records).body
+
+
+def best_of(path, session_factory, rows: int, repeat: int):
+    """Fastest of `repeat` runs, each on a fresh session so no identity map is reused."""
+    timings, body = [], b""
+    for _ in range(repeat):
+        db = session_factory()
+        try:
+            started = time.perf_counter()
+            body = path(db, rows)
+            timings.append(time.perf_counter() - started)
+        finally:
+            db.close()
+    return min(timings), len(body)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", default="1000,10000,100000", help="Comma-separated response sizes")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+    sizes = [int(size) for size in args.rows.split(",")]
+
+    with tempfile.TemporaryDirectory() as directory:
+        engine = create_engine(f"sqlite:///{os.path.join(directory, 'bench.db')}")
+        models.CreditBalance.__table__.create(engine)
+        session_factory = sessionmaker(bind=engine)
+        db = session_factory()
+        try:
+            frame = clean_credit_balance_frame(synthetic_report(max(sizes)))
+            frame['voucher_number'] = generate_voucher_numbers(frame['client_code'], frame['phone_no'], frame['center'])
+            bulk_insert_credit_balances(db, frame)
+        finally:
+            db.close()
+
+        print(f"{'rows':>9}  {'model path':>11}  {'fast path':>11}  {'speed-up':>8}  {'bytes':>12}")
+        for size in sizes:
+            baseline, _ = best_of(model_path, session_factory, size, args.repeat)
+            fast, length = best_of(fast_path, session_factory, size, args.repeat)
+            print(f"{size:>9,}  {baseline * 1000:>9.1f}ms  {fast * 1000:>9.1f}ms  {baseline / fast:>7.1f}x  {length:>12,}")
+        engine.dispose()
@@ -0,0 +1,105 @@
+import logging
+import time
+
+import pandas as pd
+from sqlalchemy import insert
+from sqlalchemy.orm import Session
+
+import models
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BATCH_SIZE = 5000
+
+# Excel header -> CreditBalance column
+TEXT_COLUMNS = {
+    'Client Code': 'client_code',
+    'Client name': 'client_name',
+    'Phone No': 'phone_no',
+    "Email ID's": 'email_id',
+    'Treatment Name': 'treatment_name',
+    'Center': 'center',
+    'Final Bucket': 'final_bucket',
+}
+
+NUMERIC_COLUMNS = {
+    'Package Amount (₹)': 'package_amount',
+    'Amount Paid by the client': 'amount_paid',
+    'Balance Amount (₹)': 'balance_amount',
+    'Prepaid / Gift Card Balance': 'prepaid_gift_card_balance',
+    'Sessions Paid': 'sessions_paid',
+    'Sessions Consumed': 'sessions_consumed',
+    'Balance Sessions': 'balance_sessions',
+}
+
+# Required text columns fall back to the string form of a missing value, like the row importers did
+REQUIRED_TEXT_COLUMNS = {'client_code', 'client_name'}
+
+
+def _clean_text(series: pd.Series, required: bool) -> pd.Series:
+    text = series.astype(str)
+    if required:
+        return text
+    return text.where(series.notna(), None)
+
+
+def _clean_numeric(series: pd.Series) -> pd.Series:
+    values = pd.to_numeric(series.astype(str).str.replace(',', '', regex=False), errors='coerce')
+    invalid = int((values.isna() & series.notna()).sum())
+    if invalid:
+        logger.warning(f"{invalid} non-numeric values in '{series.name}' imported as 0")
+    return values.fillna(0.0).astype(float)
+
+
+def clean_credit_balance_frame(df: pd.DataFrame) -> pd.DataFrame:
+    """Turn a raw report sheet into a frame of CreditBalance column values.
+
+    All conversions are column-wise. Headers missing from the sheet become
+    NULL text columns or 0.0 numeric columns.
+    """
+    clean = pd.DataFrame(index=df.index)
+    for header, column in TEXT_COLUMNS.items():
+        if header in df.columns:
+            clean[column] = _clean_text(df[header], column in REQUIRED_TEXT_COLUMNS)
+        else:
+            clean[column] = '' if column in REQUIRED_TEXT_COLUMNS else None
+    for header, column in NUMERIC_COLUMNS.items():
+        clean[column] = _clean_numeric(df[header]) if header in df.columns else 0.0
+    return clean
+
+
+def bulk_insert_credit_balances(
+    db: Session,
+    frame: pd.DataFrame,
+    batch_size: int = DEFAULT_BATCH_SIZE,
+    commit: bool = True,
+) -> int:
+    """Insert every row of `frame` in executemany batches, committing after each one.
+
+    With commit=False the batches are only sent, and the caller commits them
+    in the same transaction as its other changes (e.g. clearing the table).
+    On MSSQL the engine's fast_executemany sends each batch to the server as
+    one parameter array. voucher_key is derived here because Core inserts
+    bypass the model validator.
+    """
+    if 'voucher_number' in frame.columns:
+        frame = frame.assign(voucher_key=frame['voucher_number'].str.strip().str.upper())
+
+    # Object dtype so missing values reach the driver as NULL rather than NaN
+    records = frame.astype(object).where(frame.notna(), None).to_dict('records')
+    statement = insert(models.CreditBalance.__table__)
+
+    started = time.perf_counter()
+    inserted = 0
+    for start in range(0, len(records), batch_size):
+        batch = records[start:start + batch_size]
+        db.execute(statement, batch)
+        if commit:
+            db.commit()
+        inserted += len(batch)
+        logger.info(f"Inserted {inserted}/{len(records)} records ({inserted / (time.perf_counter() - started):,.0f} rows/s)")
+
+    elapsed = time.perf_counter() - started
+    rate = inserted / elapsed if elapsed > 0 else float('inf')
+    logger.info(f"Bulk insert finished: {inserted} records in {elapsed:.2f}s ({rate:,.0f} rows/s)")
+    return inserted
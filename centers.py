@@ -0,0 +1,102 @@
+import threading
+import time
+from typing import Dict, Optional
+
+import pandas as pd
+from sqlalchemy import event, select
+from sqlalchemy.orm import Session
+
+import models
+from config import settings
+from vouchers import DEFAULT_PREFIX, center_prefix, generate_voucher_numbers
+
+
+def normalize_center(value) -> str:
+    """Upper-cased center text with runs of whitespace collapsed."""
+    if value is None:
+        return ''
+    return ' '.join(str(value).split()).upper()
+
+
+class CenterResolver:
+    """Maps free-text center names from reports and API payloads to centers.id.
+
+    A name resolves when it equals a center's name or code (ignoring case and
+    spacing), or when the voucher keyword rules give a prefix that is a
+    center's code ('Punjabi Bagh West' -> PB). The centers table is cached
+    and reloaded after `ttl` seconds, or straight away when this process
+    changes a center.
+    """
+
+    def __init__(self, ttl: float = 300.0):
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._loaded_at = None
+        self._aliases: Dict[str, int] = {}
+        self._codes: Dict[int, str] = {}
+
+    def _tables(self, db: Session):
+        with self._lock:
+            if self._loaded_at is not None and time.monotonic() - self._loaded_at < self.ttl:
+                return self._aliases, self._codes
+        rows = db.execute(select(models.Center.id, models.Center.name, models.Center.code)).all()
+        aliases, codes = {}, {}
+        for center_id, name, code in rows:
+            codes[center_id] = code
+            aliases[normalize_center(code)] = center_id
+        # Names win over codes if the two ever collide
+        for center_id, name, code in rows:
+            aliases[normalize_center(name)] = center_id
+        with self._lock:
+            self._aliases, self._codes = aliases, codes
+            self._loaded_at = time.monotonic()
+        return aliases, codes
+
+    def resolve(self, db: Session, center) -> Optional[int]:
+        key = normalize_center(center)
+        if not key:
+            return None
+        aliases, _ = self._tables(db)
+        if key in aliases:
+            return aliases[key]
+        prefix = center_prefix(key)
+        return aliases.get(prefix) if prefix != DEFAULT_PREFIX else None
+
+    def resolve_many(self, db: Session, centers: pd.Series) -> pd.Series:
+        """center_id for a whole column, resolving each distinct name once."""
+        resolved = {center: self.resolve(db, center) for center in centers.dropna().unique()}
+        return centers.map(resolved).astype('Int64')
+
+    def code(self, db: Session, center_id: Optional[int]) -> Optional[str]:
+        if center_id is None:
+            return None
+        _, codes = self._tables(db)
+        return codes.get(center_id)
+
+    def codes(self, db: Session) -> Dict[int, str]:
+        _, codes = self._tables(db)
+        return dict(codes)
+
+    def invalidate(self):
+        with self._lock:
+            self._loaded_at = None
+
+
+center_resolver = CenterResolver(ttl=settings.CENTER_RESOLVER_TTL)
+
+
+def assign_centers(db: Session, frame: pd.DataFrame) -> pd.DataFrame:
+    """Fill center_id and voucher_number on a cleaned credit balance frame (in place)."""
+    frame['center_id'] = center_resolver.resolve_many(db, frame['center'])
+    center_codes = frame['center_id'].map(center_resolver.codes(db))
+    frame['voucher_number'] = generate_voucher_numbers(
+        frame['client_code'], frame['phone_no'], frame['center'], center_codes
+    )
+    return frame
+
+
+@event.listens_for(models.Center, "after_insert")
+@event.listens_for(models.Center, "after_update")
+@event.listens_for(models.Center, "after_delete")
+def _invalidate_centers(mapper, connection, target):
+    center_resolver.invalidate()
@@ -0,0 +1,291 @@
+"""In-process publish/subscribe of credit balance changes, pushed to clients per center.
+
+The write handlers publish an event for every record they create, update
+or delete once the transaction has committed. Each subscriber (one Server-Sent
+Events stream) has its own bounded buffer keyed by record id. Repeated
+changes to a record before they are sent collapse into the latest one. A
+subscriber that falls more than `max_pending` records behind gets a single
+`resync` event instead, and should reload its list.
+
+Importers and other API workers write from other processes. A background
+task notices them through the table version every `poll_interval` seconds,
+but only while someone is subscribed. It then reads the change feed from its
+last watermark and publishes what it finds. The feed also returns this
+process's own writes (and re-reads recent changes), so the last `max_recent`
+published states are remembered and not published again.
+"""
+import asyncio
+import logging
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Optional, Set
+
+import orjson
+
+from config import settings
+from database import SessionLocal
+from change_feed import changes_page, current_watermark
+from serialization import CREDIT_BALANCE_FIELDS
+from table_versions import CREDIT_BALANCES, get_table_version
+
+logger = logging.getLogger(__name__)
+
+RESYNC_EVENT = {"op": "resync"}
+DELETED = "deleted"
+
+
+def upsert_event(record: dict) -> dict:
+    """Upsert event carrying `record`, a dict of the credit balance response fields."""
+    return {"op": "upsert", "id": record["id"], "center_id": record["center_id"], "record": record}
+
+
+def record_event(credit_balance) -> dict:
+    """Upsert event for a credit balance (a model instance or any object with its attributes)."""
+    return upsert_event({field: getattr(credit_balance, field, None) for field in CREDIT_BALANCE_FIELDS})
+
+
+def delete_event(credit_balance_id: int, center_id: Optional[int] = None) -> dict:
+    """Delete event; without a center_id it goes to every subscriber."""
+    return {"op": "delete", "id": credit_balance_id, "center_id": center_id}
+
+
+def event_state(event: dict):
+    """What an event says about its record: the time of the change for an upsert, DELETED for a delete."""
+    if event["op"] == "delete":
+        return DELETED
+    record = event["record"]
+    changed_at = record.get("updated_at") or record.get("created_at")
+    return changed_at.replace(tzinfo=None) if changed_at is not None else None
+
+
+def format_sse(event: dict) -> str:
+    """One Server-Sent Events message named after the event's op, encoded like FastJSONResponse."""
+    return f"event: {event['op']}\ndata: {orjson.dumps(event, option=orjson.OPT_UTC_Z).decode()}\n\n"
+
+
+class Subscription:
+    """Pending events for one subscriber; filled from any thread, drained on the event loop."""
+
+    def __init__(self, center_id: int, loop: asyncio.AbstractEventLoop, max_pending: int, coalesce_interval: float):
+        self.center_id = center_id
+        self.max_pending = max_pending
+        self.coalesce_interval = coalesce_interval
+        self.sent = 0
+        self.resyncs = 0
+        self._loop = loop
+        self._lock = threading.Lock()
+        self._pending: "OrderedDict[int, dict]" = OrderedDict()
+        self._overflowed = False
+        self._ready = asyncio.Event()
+
+    def offer(self, event: dict):
+        with self._lock:
+            if self._overflowed:
+                return
+            if event["op"] == "resync":
+                self._overflowed = True
+                self._pending.clear()
+            else:
+                # The latest change to a record replaces any unsent one
+                self._pending.pop(event["id"], None)
+                self._pending[event["id"]] = event
+                if len(self._pending) > self.max_pending:
+                    self._overflowed = True
+                    self._pending.clear()
+        try:
+            self._loop.call_soon_threadsafe(self._ready.set)
+        except RuntimeError:
+            pass  # Event loop already closed
+
+    async def next_events(self, timeout: float) -> Optional[List[dict]]:
+        """The events waiting after at most `timeout` seconds; None if there were none (time for a keepalive)."""
+        try:
+            await asyncio.wait_for(self._ready.wait(), timeout)
+        except asyncio.TimeoutError:
+            return None
+        # Let a burst of writes settle so each record is sent once, in its latest state
+        await asyncio.sleep(self.coalesce_interval)
+        self._ready.clear()
+        with self._lock:
+            if self._overflowed:
+                events = [RESYNC_EVENT]
+                self._overflowed = False
+                self.resyncs += 1
+            else:
+                events = list(self._pending.values())
+            self._pending.clear()
+        self.sent += len(events)
+        return events
+
+
+class ChangeBus:
+    def __init__(
+        self,
+        max_pending: int = 1000,
+        coalesce_interval: float = 0.25,
+        poll_interval: float = 5.0,
+        keepalive_interval: float = 15.0,
+        max_recent: int = 10000,
+    ):
+        self.max_pending = max_pending
+        self.coalesce_interval = coalesce_interval
+        self.poll_interval = poll_interval
+        self.keepalive_interval = keepalive_interval
+        self.max_recent = max_recent
+        self.published = 0
+        self._lock = threading.Lock()
+        # Last published state of recently changed records: id -> event_state
+        self._recent: "OrderedDict[int, object]" = OrderedDict()
+        self._subscriptions: Dict[int, Set[Subscription]] = {}
+        # Table version whose changes have all been published, and the change feed position of the last poll
+        self._version: Optional[int] = None
+        self._watermark: Optional[str] = None
+        self._task: Optional[asyncio.Task] = None
+
+    def subscribe(self, center_id: int) -> Subscription:
+        """New subscription to `center_id`; call from the event loop."""
+        subscription = Subscription(
+            center_id, asyncio.get_running_loop(), self.max_pending, self.coalesce_interval
+        )
+        with self._lock:
+            self._subscriptions.setdefault(center_id, set()).add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription):
+        with self._lock:
+            subscriptions = self._subscriptions.get(subscription.center_id, set())
+            subscriptions.discard(subscription)
+            if not subscriptions:
+                self._subscriptions.pop(subscription.center_id, None)
+
+    def publish(self, events: List[dict], version: Optional[int] = None):
+        """Deliver the events of one committed write; `version` is what bump_table_version returned for it.
+
+        Upserts go to the record's center. Deletes go to their center, or to
+        everyone when it is not known. Resync events go to everyone.
+        """
+        with self._lock:
+            if version is not None and self._version is not None and version == self._version + 1:
+                self._version = version
+            for event in events:
+                if event["op"] != "resync":
+                    self._recent.pop(event["id"], None)
+                    self._recent[event["id"]] = event_state(event)
+            while len(self._recent) > self.max_recent:
+                self._recent.popitem(last=False)
+            subscriptions = {center_id: list(subs) for center_id, subs in self._subscriptions.items()}
+        everyone = [subscription for subs in subscriptions.values() for subscription in subs]
+        for event in events:
+            if event["op"] == "resync" or (event["op"] == "delete" and event["center_id"] is None):
+                targets = everyone
+            else:
+                targets = subscriptions.get(event["center_id"], ())
+            for subscription in targets:
+                subscription.offer(event)
+        self.published += len(events)
+
+    async def stream(self, subscription: Subscription):
+        """Server-Sent Events for `subscription`, with keepalive comments; unsubscribes when the client goes away."""
+        try:
+            yield format_sse({"op": "ready", "center_id": subscription.center_id})
+            while True:
+                events = await subscription.next_events(self.keepalive_interval)
+                if events is None:
+                    yield ": keepalive\n\n"
+                    continue
+                for event in events:
+                    yield format_sse(event)
+        finally:
+            self.unsubscribe(subscription)
+
+    async def start(self):
+        self._task = asyncio.create_task(self._poll())
+
+    async def stop(self):
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+    async def _poll(self):
+        while True:
+            await asyncio.sleep(self.poll_interval)
+            with self._lock:
+                subscribed = bool(self._subscriptions)
+            if not subscribed:
+                # Start from the then current position once someone subscribes again
+                self._watermark = None
+                continue
+            try:
+                events = await asyncio.to_thread(self._read_external_changes)
+            except Exception as e:
+                logger.warning(f"Error reading credit balance changes for push subscribers: {e}")
+                continue
+            if events:
+                self.publish(events)
+
+    def _read_external_changes(self) -> List[dict]:
+        """Events for changes this process did not publish itself, read from the change feed."""
+        db = SessionLocal()
+        try:
+            version = get_table_version(db, CREDIT_BALANCES)
+            with self._lock:
+                known_version = self._version
+            if self._watermark is None:
+                self._watermark = current_watermark(db)
+                with self._lock:
+                    self._version = version
+                return []
+            if version == known_version:
+                # Every change so far was published by this process; keep the feed position close behind
+                self._watermark = current_watermark(db)
+                return []
+
+            events, watermark = [], self._watermark
+            while True:
+                page = changes_page(db, since=watermark)
+                page_events = [upsert_event(record) for record in page["changes"]]
+                page_events += [delete_event(credit_balance_id) for credit_balance_id in page["deleted"]]
+                with self._lock:
+                    events.extend(event for event in page_events if not self._already_published(event))
+                watermark = page["watermark"]
+                if not page["has_more"]:
+                    break
+                if len(events) > self.max_pending:
+                    # Too much to push record by record (e.g. a full re-import)
+                    events, watermark = [RESYNC_EVENT], current_watermark(db)
+                    break
+            self._watermark = watermark
+            with self._lock:
+                self._version = version
+            return events
+        finally:
+            db.close()
+
+    def _already_published(self, event: dict) -> bool:
+        """Whether `event` repeats the last state published for its record; call with the lock held."""
+        return event["id"] in self._recent and self._recent[event["id"]] == event_state(event)
+
+    def stats(self) -> dict:
+        with self._lock:
+            subscriptions = [subscription for subs in self._subscriptions.values() for subscription in subs]
+            return {
+                "subscribers": len(subscriptions),
+                "centers": len(self._subscriptions),
+                "published": self.published,
+                "sent": sum(subscription.sent for subscription in subscriptions),
+                "resyncs": sum(subscription.resyncs for subscription in subscriptions),
+                "version": self._version,
+            }
+
+
+change_bus = ChangeBus(
+    max_pending=settings.CHANGE_PUSH_MAX_PENDING,
+    coalesce_interval=settings.CHANGE_PUSH_COALESCE_INTERVAL,
+    poll_interval=settings.CHANGE_PUSH_POLL_INTERVAL,
+    keepalive_interval=settings.CHANGE_PUSH_KEEPALIVE_INTERVAL,
+)
@@ -0,0 +1,220 @@
+"""Change feed over credit_balances for clients that keep their own copy.
+
+Created and updated records come in (changed_at, id) order, changed_at
+being the indexed computed column coalesce(updated_at, created_at). Deletes
+are read from credit_balance_tombstones in (deleted_at, id) order; every
+code path that deletes credit balances writes one in the same transaction
+(see record_deletes). Each page carries a watermark holding both positions;
+passing it back as `since` returns only what changed after it. A record
+changed several times between two polls is sent once, in its latest state.
+
+Timestamps are taken when a statement runs, not when its transaction
+commits, so a slow transaction can commit rows behind a watermark already
+handed out. Once a client has caught up, its next poll therefore starts
+CHANGE_FEED_OVERLAP seconds before the time the last page was read, and
+recently changed records and deletes can be sent again. Clients must apply
+the feed idempotently.
+"""
+import base64
+import json
+from datetime import datetime, timedelta
+from typing import Optional, Sequence
+
+from fastapi import HTTPException, status
+from sqlalchemy import and_, func, insert, or_, select
+from sqlalchemy.orm import Session
+
+import models
+from config import settings
+from metrics import record_rows
+from pagination import page_size
+from serialization import CREDIT_BALANCE_FIELDS, credit_balance_columns
+
+CHANGED_AT = models.CreditBalance.changed_at
+
+# Re-read changes timestamped this long before a caught-up watermark was read, in case they committed after it
+WATERMARK_OVERLAP = timedelta(seconds=settings.CHANGE_FEED_OVERLAP)
+
+# SQL Server keeps timestamps to 100ns but they come back truncated to microseconds,
+# so rows inside the watermark's microsecond are told apart by id instead
+TIMESTAMP_RESOLUTION = timedelta(microseconds=1)
+
+
+def record_deletes(db: Session, *criteria):
+    """Write a tombstone for every credit balance matching `criteria` (every row if none are given).
+
+    Call it in the same transaction as the DELETE, just before it.
+    """
+    db.execute(insert(models.CreditBalanceTombstone.__table__).from_select(
+        ['credit_balance_id'],
+        select(models.CreditBalance.id).where(*criteria),
+    ))
+
+
+def _naive(value: Optional[datetime]) -> Optional[datetime]:
+    """`value` without its offset; the database hands back both kinds, always in its own time zone."""
+    return value.replace(tzinfo=None) if value is not None else None
+
+
+def _timestamp(value: Optional[str]) -> Optional[datetime]:
+    return datetime.fromisoformat(value) if value else None
+
+
+def encode_watermark(
+    changed_at: Optional[datetime],
+    last_id: int,
+    deleted_at: Optional[datetime],
+    tombstone_id: int,
+    read_at: Optional[datetime] = None,
+) -> str:
+    """Opaque watermark for the last record and tombstone a client has seen.
+
+    `read_at` is the database time the page was read, given only once the
+    client has caught up; the next poll rewinds to WATERMARK_OVERLAP before it.
+    """
+    raw = json.dumps(
+        {
+            "changed_at": changed_at.isoformat() if changed_at else None,
+            "id": last_id,
+            "deleted_at": deleted_at.isoformat() if deleted_at else None,
+            "tombstone_id": tombstone_id,
+            "read_at": read_at.isoformat() if read_at else None,
+        },
+        separators=(",", ":"),
+    ).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_watermark(db: Session, watermark: str) -> tuple:
+    """(changed_at, last_id, deleted_at, tombstone_id, read_at) from a watermark produced by encode_watermark."""
+    try:
+        padded = watermark + "=" * (-len(watermark) % 4)
+        data = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        last_id, tombstone_id = data["id"], data["tombstone_id"]
+        if not isinstance(last_id, int) or not isinstance(tombstone_id, int):
+            raise ValueError("positions must be integers")
+        changed_at, read_at = _timestamp(data["changed_at"]), _timestamp(data.get("read_at"))
+        if "deleted_at" in data:
+            deleted_at = _timestamp(data["deleted_at"])
+        else:
+            # Watermarks handed out before tombstones were ordered by time only have the id
+            deleted_at = db.execute(
+                select(models.CreditBalanceTombstone.deleted_at)
+                .where(models.CreditBalanceTombstone.id == tombstone_id)
+            ).scalar()
+    except (ValueError, KeyError, TypeError, AttributeError):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Invalid change feed watermark"
+        )
+    return changed_at, last_id, deleted_at, tombstone_id, read_at
+
+
+def _rewind(position: tuple, read_at: Optional[datetime]) -> tuple:
+    """`position` moved back to WATERMARK_OVERLAP before `read_at`, unless it is already earlier."""
+    if read_at is None:
+        return position
+    rewound = _naive(read_at) - WATERMARK_OVERLAP
+    changed_at = _naive(position[0])
+    if changed_at is None or changed_at < rewound:
+        return position
+    return rewound, 0
+
+
+def _after(column, id_column, position: tuple):
+    """Rows ordered after `position` by (column, id_column)."""
+    changed_at, last_id = position
+    if changed_at is None:
+        return id_column > last_id
+    next_tick = changed_at + TIMESTAMP_RESOLUTION
+    return or_(
+        column >= next_tick,
+        and_(column >= changed_at, column < next_tick, id_column > last_id),
+    )
+
+
+def _last_tombstone(db: Session) -> tuple:
+    tombstones = models.CreditBalanceTombstone
+    last = db.execute(
+        select(tombstones.deleted_at, tombstones.id)
+        .order_by(tombstones.deleted_at.desc(), tombstones.id.desc())
+        .limit(1)
+    ).first()
+    return tuple(last) if last is not None else (None, 0)
+
+
+def _database_time(db: Session) -> datetime:
+    return db.execute(select(func.now())).scalar()
+
+
+def current_watermark(db: Session) -> str:
+    """Watermark at the current end of the feed, for readers that only want what changes from now on."""
+    read_at = _database_time(db)
+    last = db.execute(
+        select(CHANGED_AT, models.CreditBalance.id)
+        .order_by(CHANGED_AT.desc(), models.CreditBalance.id.desc())
+        .limit(1)
+    ).first()
+    changed_at, last_id = tuple(last) if last is not None else (None, 0)
+    return encode_watermark(changed_at, last_id, *_last_tombstone(db), read_at)
+
+
+def _start_position(db: Session, updated_since: Optional[datetime]) -> tuple:
+    """Feed positions for a client without a watermark: every record changed at or after
+    `updated_since` (all of them when it is None), and only the deletes after it."""
+    if updated_since is None:
+        return (None, 0), _last_tombstone(db)
+    return (updated_since, 0), (updated_since, 0)
+
+
+def changes_page(
+    db: Session,
+    since: Optional[str] = None,
+    updated_since: Optional[datetime] = None,
+    limit: Optional[int] = None,
+    fields: Sequence[str] = CREDIT_BALANCE_FIELDS,
+) -> dict:
+    """One page of the feed: changed records, deleted ids, the next watermark and whether more is waiting.
+
+    Clients apply `changes` before `deleted`, then keep polling with the
+    returned watermark; while `has_more` is true the next page is ready.
+    """
+    size = page_size(limit)
+    if since:
+        changed_at, last_id, deleted_at, tombstone_id, read_at = decode_watermark(db, since)
+        position = _rewind((changed_at, last_id), read_at)
+        tombstone_position = _rewind((deleted_at, tombstone_id), read_at)
+    else:
+        position, tombstone_position = _start_position(db, updated_since)
+    read_at = _database_time(db)
+
+    rows = db.execute(
+        select(*credit_balance_columns(fields), CHANGED_AT.label('changed_at'))
+        .where(_after(CHANGED_AT, models.CreditBalance.id, position))
+        .order_by(CHANGED_AT, models.CreditBalance.id)
+        .limit(size + 1)
+    ).all()
+
+    # Read after the records, so a record deleted in between is also listed as deleted in this page
+    tombstones = models.CreditBalanceTombstone
+    deleted = db.execute(
+        select(tombstones.id, tombstones.credit_balance_id, tombstones.deleted_at)
+        .where(_after(tombstones.deleted_at, tombstones.id, tombstone_position))
+        .order_by(tombstones.deleted_at, tombstones.id)
+        .limit(size + 1)
+    ).all()
+
+    has_more = len(rows) > size or len(deleted) > size
+    rows, deleted = rows[:size], deleted[:size]
+    if rows:
+        position = rows[-1].changed_at, rows[-1].id
+    if deleted:
+        tombstone_position = deleted[-1].deleted_at, deleted[-1].id
+    record_rows(len(rows) + len(deleted))
+    return {
+        "changes": [dict(zip(fields, row)) for row in rows],
+        "deleted": [tombstone.credit_balance_id for tombstone in deleted],
+        # Pages that leave the client caught up carry the read time, so the next poll starts with the overlap
+        "watermark": encode_watermark(*position, *tombstone_position, None if has_more else read_at),
+        "has_more": has_more,
+    }
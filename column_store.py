@@ -0,0 +1,367 @@
+"""Optional in-memory column store of credit_balances for the read-heavy routes.
+
+The whole table is held as NumPy columns in id order: float64 for the amount
+and session fields (NaN for NULL), dictionary-encoded int32 codes for center,
+final_bucket and treatment_name, and object arrays for the other text and
+timestamp fields. Filtering, keyset pagination, voucher lookups and grouped
+totals are then answered in process without a database round-trip.
+
+Snapshots are immutable and swapped in whole. A read refreshes the snapshot
+at most every COLUMN_STORE_MAX_STALENESS seconds: if the table version has
+moved, only rows whose changed_at is at or after the
+previous watermark are read and merged. Deletes cannot be seen through a
+watermark, so a count/sum(id) check after the merge falls back to a full
+reload. If a refresh fails (e.g. the link to SQL Server is down) the last
+snapshot keeps being served.
+"""
+import bisect
+import logging
+import threading
+import time
+from datetime import timedelta
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+from sqlalchemy import BigInteger, cast, func, select
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.orm import Session
+
+import models
+from config import settings
+from metrics import record_rows
+from pagination import decode_cursor, encode_cursor, page_size
+from serialization import CREDIT_BALANCE_FIELDS
+from table_versions import CREDIT_BALANCES, get_table_version
+
+logger = logging.getLogger(__name__)
+
+FLOAT_COLUMNS = (
+    'package_amount', 'amount_paid', 'balance_amount', 'prepaid_gift_card_balance',
+    'sessions_paid', 'sessions_consumed', 'balance_sessions',
+)
+ENCODED_COLUMNS = ('center', 'final_bucket', 'treatment_name')
+STORE_COLUMNS = CREDIT_BALANCE_FIELDS + ('voucher_key',)
+OBJECT_COLUMNS = tuple(
+    name for name in STORE_COLUMNS if name not in FLOAT_COLUMNS + ENCODED_COLUMNS + ('id', 'center_id')
+)
+
+# Re-read rows changed shortly before the watermark, in case they committed after it was taken
+WATERMARK_OVERLAP = timedelta(seconds=60)
+NULL_CODE = -1
+
+_CHANGED_AT = models.CreditBalance.changed_at
+
+
+def _encode(values: Sequence, categories: list, lookup: dict) -> np.ndarray:
+    """Dictionary codes for `values`, adding unseen values to `categories` and `lookup`."""
+    codes = np.empty(len(values), dtype=np.int32)
+    for position, value in enumerate(values):
+        if value is None:
+            codes[position] = NULL_CODE
+            continue
+        code = lookup.get(value)
+        if code is None:
+            code = lookup[value] = len(categories)
+            categories.append(value)
+        codes[position] = code
+    return codes
+
+
+def _to_arrays(rows: Sequence, categories: Dict[str, list], lookups: Dict[str, dict]) -> dict:
+    """Columns of `rows` (tuples in STORE_COLUMNS order) as NumPy arrays."""
+    values = dict(zip(STORE_COLUMNS, zip(*rows))) if rows else {name: () for name in STORE_COLUMNS}
+    arrays = {
+        'id': np.array(values['id'], dtype=np.int64),
+        'center_id': np.array([NULL_CODE if value is None else value for value in values['center_id']], dtype=np.int64),
+    }
+    for name in FLOAT_COLUMNS:
+        # None becomes NaN
+        arrays[name] = np.array(values[name], dtype=np.float64)
+    for name in ENCODED_COLUMNS:
+        arrays[name] = _encode(values[name], categories[name], lookups[name])
+    for name in OBJECT_COLUMNS:
+        array = np.empty(len(rows), dtype=object)
+        array[:] = values[name]
+        arrays[name] = array
+    return arrays
+
+
+class ColumnSnapshot:
+    """One immutable copy of the table, ordered by id, plus the lookup structures derived from it."""
+
+    def __init__(self, version: int, watermark, columns: Dict[str, np.ndarray], categories: Dict[str, list]):
+        self.version = version
+        self.watermark = watermark
+        self.columns = columns
+        self.categories = categories
+        self.ids = columns['id']
+        self.id_sum = int(self.ids.sum())
+
+        self._lookups = {name: {value: code for code, value in enumerate(values)} for name, values in categories.items()}
+        self.voucher_positions: Dict[str, List[int]] = {}
+        for position, key in enumerate(columns['voucher_key'].tolist()):
+            if key is not None:
+                self.voucher_positions.setdefault(key, []).append(position)
+        self.voucher_keys = sorted(self.voucher_positions)
+        self._lowered = {
+            name: [(value or '').lower() for value in columns[name].tolist()] for name in ('client_code', 'client_name')
+        }
+        self.month_categories: list = []
+        self.month_codes = _encode(
+            [f"{value.year:04d}-{value.month:02d}" if value else None for value in columns['created_at'].tolist()],
+            self.month_categories,
+            {},
+        )
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    @classmethod
+    def from_rows(cls, rows: Sequence, version: int, watermark) -> 'ColumnSnapshot':
+        categories = {name: [] for name in ENCODED_COLUMNS}
+        lookups = {name: {} for name in ENCODED_COLUMNS}
+        return cls(version, watermark, _to_arrays(rows, categories, lookups), categories)
+
+    def merge(self, rows: Sequence, version: int, watermark) -> 'ColumnSnapshot':
+        """New snapshot with `rows` inserted, or replacing the rows with the same ids."""
+        categories = {name: list(values) for name, values in self.categories.items()}
+        lookups = {name: dict(lookup) for name, lookup in self._lookups.items()}
+        delta = _to_arrays(rows, categories, lookups)
+        keep = ~np.isin(self.ids, delta['id'])
+        columns = {name: np.concatenate([self.columns[name][keep], delta[name]]) for name in STORE_COLUMNS}
+        order = np.argsort(columns['id'], kind='stable')
+        return ColumnSnapshot(version, watermark, {name: column[order] for name, column in columns.items()}, categories)
+
+    def _code_mask(self, name: str, term: str) -> np.ndarray:
+        """Rows whose dictionary-encoded `name` contains `term`, case-insensitively (ilike '%term%')."""
+        term = term.lower()
+        codes = [code for code, value in enumerate(self.categories[name]) if term in value.lower()]
+        return np.isin(self.columns[name], codes)
+
+    def filter(
+        self,
+        client_code: Optional[str] = None,
+        client_name: Optional[str] = None,
+        center: Optional[str] = None,
+        center_id: Optional[int] = None,
+    ) -> np.ndarray:
+        """Positions, in id order, of the rows matching the filters of queries.filter_credit_balances."""
+        mask = np.ones(len(self.ids), dtype=bool)
+        if center_id is not None:
+            mask &= self.columns['center_id'] == center_id
+        if center:
+            mask &= self._code_mask('center', center)
+        for name, term in (('client_code', client_code), ('client_name', client_name)):
+            if term:
+                term = term.lower()
+                mask &= np.fromiter((term in value for value in self._lowered[name]), dtype=bool, count=len(self.ids))
+        return np.flatnonzero(mask)
+
+    def page(self, positions: np.ndarray, cursor: Optional[str] = None, skip: int = 0, limit: Optional[int] = None):
+        """One page of `positions`, with the same cursor and skip semantics as pagination.paginate."""
+        size = page_size(limit)
+        if cursor:
+            start = np.searchsorted(self.ids, decode_cursor(cursor), side='right')
+            positions = positions[np.searchsorted(positions, start):]
+        elif skip:
+            positions = positions[skip:]
+        page = positions[:size]
+        record_rows(len(page))
+        if len(positions) > size:
+            return page, encode_cursor(int(self.ids[page[-1]]))
+        return page, None
+
+    def find(self, record_id: int) -> Optional[int]:
+        """Position of the row with `record_id`, if there is one."""
+        position = int(np.searchsorted(self.ids, record_id))
+        if position < len(self.ids) and self.ids[position] == record_id:
+            return position
+        return None
+
+    def voucher_matches(self, voucher_id: str, match: str = 'exact') -> np.ndarray:
+        """Positions of the rows matching `voucher_id`, like queries.filter_by_voucher."""
+        voucher_key = models.normalize_voucher(voucher_id)
+        if match == 'exact':
+            positions = self.voucher_positions.get(voucher_key, [])
+        elif match == 'prefix':
+            start = bisect.bisect_left(self.voucher_keys, voucher_key)
+            end = bisect.bisect_left(self.voucher_keys, voucher_key + '\uffff', start)
+            positions = sorted(
+                position for key in self.voucher_keys[start:end] for position in self.voucher_positions[key]
+            )
+        elif match == 'contains':
+            term = voucher_id.strip().lower()
+            positions = [
+                position for position, value in enumerate(self.columns['voucher_number'].tolist())
+                if value is not None and term in value.lower()
+            ]
+        else:
+            raise ValueError(f"Unknown voucher match mode '{match}'")
+        return np.array(positions, dtype=np.int64)
+
+    def values(self, name: str, positions) -> list:
+        """Plain Python values of column `name` at `positions`, with NULLs as None."""
+        column = self.columns[name][positions]
+        if name in FLOAT_COLUMNS:
+            return [None if value != value else value for value in column.tolist()]
+        if name in ENCODED_COLUMNS:
+            categories = self.categories[name]
+            return [None if code == NULL_CODE else categories[code] for code in column.tolist()]
+        if name == 'center_id':
+            return [None if value == NULL_CODE else value for value in column.tolist()]
+        return column.tolist()
+
+    def rows(self, positions, fields: Sequence[str] = CREDIT_BALANCE_FIELDS) -> list:
+        """Row tuples of `fields` at `positions`, ready for serialization.rows_response."""
+        return list(zip(*(self.values(name, positions) for name in fields)))
+
+    def _dimension(self, dimension: str) -> tuple:
+        if dimension == 'created_month':
+            return self.month_codes, self.month_categories
+        return self.columns[dimension], self.categories[dimension]
+
+    def aggregate(self, group_by: Sequence[str], metrics: Sequence[str], positions: Optional[np.ndarray] = None) -> list:
+        """Same groups as aggregations.run_aggregation, computed with bincount over the dictionary codes.
+
+        `positions` (from filter) restricts the rows; every row when None.
+        """
+        if positions is None:
+            positions = np.arange(len(self.ids))
+        dimensions = [
+            (codes[positions], categories) for codes, categories in (self._dimension(dimension) for dimension in group_by)
+        ]
+        if dimensions and not len(positions):
+            return []
+        if dimensions:
+            keys, inverse = np.unique(np.stack([codes for codes, _ in dimensions], axis=1), axis=0, return_inverse=True)
+            inverse = inverse.reshape(-1)
+        else:
+            keys, inverse = np.empty((1, 0), dtype=np.int32), np.zeros(len(positions), dtype=np.intp)
+
+        group_count = len(keys)
+        counts = np.bincount(inverse, minlength=group_count)
+        results = {}
+        for metric in metrics:
+            if metric == 'count':
+                results[metric] = counts.tolist()
+                continue
+            aggregate, column = metric.split('_', 1)
+            data = self.columns[column][positions]
+            present = ~np.isnan(data)
+            sums = np.bincount(inverse, weights=np.where(present, data, 0.0), minlength=group_count)
+            if aggregate == 'avg':
+                # Like SQL AVG, NULLs are left out of the divisor
+                present_counts = np.bincount(inverse, weights=present, minlength=group_count)
+                sums = np.divide(sums, present_counts, out=np.zeros_like(sums), where=present_counts > 0)
+            results[metric] = sums.tolist()
+
+        groups = []
+        for index, key in enumerate(keys.tolist()):
+            group = {
+                dimension: None if code == NULL_CODE else categories[code]
+                for dimension, code, (_, categories) in zip(group_by, key, dimensions)
+            }
+            for metric in metrics:
+                group[metric] = results[metric][index]
+            groups.append(group)
+        # NULL groups first, as SQL Server orders them
+        groups.sort(key=lambda group: [(group[dimension] is not None, group[dimension] or '') for dimension in group_by])
+        return groups
+
+
+class ColumnStore:
+    """Holds the current ColumnSnapshot and keeps it within `max_staleness` seconds of the table."""
+
+    def __init__(self, enabled: bool = False, max_staleness: float = 5.0):
+        self.enabled = enabled
+        self.max_staleness = max_staleness
+        self._snapshot: Optional[ColumnSnapshot] = None
+        self._checked_at = 0.0
+        # When the snapshot was last confirmed to match the table
+        self._verified_at = 0.0
+        self._refresh_lock = threading.Lock()
+        self.refreshes = {"full": 0, "incremental": 0, "failed": 0}
+        self.last_error: Optional[str] = None
+
+    def snapshot(self, db: Session) -> Optional[ColumnSnapshot]:
+        """The snapshot to answer a read from; None when disabled or nothing could be loaded yet."""
+        if not self.enabled:
+            return None
+        if time.monotonic() - self._checked_at > self.max_staleness:
+            # One thread refreshes while the others keep reading the current snapshot;
+            # only the very first load makes them wait
+            if self._refresh_lock.acquire(blocking=self._snapshot is None):
+                try:
+                    if time.monotonic() - self._checked_at > self.max_staleness:
+                        self.refresh(db)
+                finally:
+                    self._refresh_lock.release()
+        return self._snapshot
+
+    def expire(self):
+        """Check the table on the next read; called after writes so this process reads its own writes."""
+        self._checked_at = 0.0
+
+    def refresh(self, db: Session, full: bool = False):
+        """Bring the snapshot up to the current table version; on database errors keep the old one."""
+        current = None if full else self._snapshot
+        try:
+            version = get_table_version(db, CREDIT_BALANCES)
+            if current is None or version != current.version:
+                self._snapshot = self._load(db, version, current)
+            self._verified_at = time.monotonic()
+            self.last_error = None
+        except SQLAlchemyError as e:
+            self.refreshes["failed"] += 1
+            self.last_error = str(e)
+            age = f"{time.monotonic() - self._verified_at:.0f}s old" if self._snapshot else "none loaded"
+            logger.warning(f"Column store refresh failed, serving the previous snapshot ({age}): {e}")
+            try:
+                db.rollback()
+            except SQLAlchemyError:
+                pass
+        finally:
+            self._checked_at = time.monotonic()
+
+    def _load(self, db: Session, version: int, current: Optional[ColumnSnapshot]) -> ColumnSnapshot:
+        # The watermark and checksum are read before the rows, so the snapshot is never older than them
+        watermark, count, id_sum = db.execute(
+            select(
+                func.max(_CHANGED_AT),
+                func.count(models.CreditBalance.id),
+                func.sum(cast(models.CreditBalance.id, BigInteger)),
+            )
+        ).one()
+        stmt = select(*(getattr(models.CreditBalance, name) for name in STORE_COLUMNS)).order_by(models.CreditBalance.id)
+
+        if current is not None and current.watermark is not None:
+            rows = db.execute(stmt.where(_CHANGED_AT >= current.watermark - WATERMARK_OVERLAP)).all()
+            snapshot = current.merge(rows, version, watermark or current.watermark)
+            if len(snapshot) == count and snapshot.id_sum == (id_sum or 0):
+                self.refreshes["incremental"] += 1
+                return snapshot
+            logger.info(f"Column store has {len(snapshot)} rows, table has {count}; reloading")
+
+        rows = db.execute(stmt).all()
+        self.refreshes["full"] += 1
+        return ColumnSnapshot.from_rows(rows, version, watermark)
+
+    def stats(self) -> dict:
+        snapshot = self._snapshot
+        return {
+            "enabled": self.enabled,
+            "records": len(snapshot) if snapshot else 0,
+            "version": snapshot.version if snapshot else None,
+            "watermark": snapshot.watermark if snapshot else None,
+            "age_seconds": round(time.monotonic() - self._verified_at, 3) if snapshot else None,
+            "max_staleness_seconds": self.max_staleness,
+            "categories": {name: len(values) for name, values in snapshot.categories.items()} if snapshot else {},
+            "refreshes": dict(self.refreshes),
+            "last_error": self.last_error,
+        }
+
+
+credit_balance_store = ColumnStore(
+    enabled=settings.COLUMN_STORE_ENABLED,
+    max_staleness=settings.COLUMN_STORE_MAX_STALENESS,
+)
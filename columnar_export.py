@@ -0,0 +1,233 @@
+"""Parquet / Arrow IPC export of credit balances.
+
+Rows are read in chunks from a server-side cursor and converted into Arrow
+record batches. Each batch is encoded (one Parquet row group or one IPC
+message) and sent as soon as it is read, so memory stays bounded by one
+chunk and the first bytes go out before the last rows are read. With a
+snapshot directory configured, the bytes are also written to a file that is
+reused until the credit_balances table version changes; the directory is
+kept under a size limit by removing the least recently used files.
+"""
+import glob
+import hashlib
+import logging
+import os
+import tempfile
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Iterator, Optional
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+from sqlalchemy import DateTime, Float, Integer, select
+from sqlalchemy.orm import Session
+
+import models
+from centers import center_resolver
+from database import SessionLocal
+from export import EXPORT_COLUMNS
+from metrics import record_rows
+
+logger = logging.getLogger(__name__)
+
+COLUMNAR_FORMATS = {
+    "parquet": "application/vnd.apache.parquet",
+    "arrow": "application/vnd.apache.arrow.stream",
+}
+
+COLUMNAR_CHUNK_SIZE = 50000
+
+
+def _arrow_type(column):
+    if isinstance(column.type, Integer):
+        return pa.int64()
+    if isinstance(column.type, Float):
+        return pa.float64()
+    if isinstance(column.type, DateTime):
+        return pa.timestamp("us", tz="UTC")
+    return pa.string()
+
+
+ARROW_SCHEMA = pa.schema([
+    pa.field(name, _arrow_type(models.CreditBalance.__table__.c[name])) for name in EXPORT_COLUMNS
+])
+
+
+def export_statement(
+    db: Session,
+    center: Optional[str] = None,
+    final_bucket: Optional[str] = None,
+    updated_since: Optional[datetime] = None,
+):
+    """SELECT of the export columns, filtered by center, bucket and last change time."""
+    stmt = select(*(getattr(models.CreditBalance, name) for name in EXPORT_COLUMNS))
+    if center:
+        center_id = center_resolver.resolve(db, center)
+        if center_id is not None:
+            stmt = stmt.where(models.CreditBalance.center_id == center_id)
+        else:
+            stmt = stmt.where(models.CreditBalance.center.ilike(f"%{center}%"))
+    if final_bucket:
+        stmt = stmt.where(models.CreditBalance.final_bucket == final_bucket)
+    if updated_since:
+        stmt = stmt.where(models.CreditBalance.changed_at >= updated_since)
+    return stmt.order_by(models.CreditBalance.id)
+
+
+def iter_record_batches(db: Session, stmt, chunk_size: int = COLUMNAR_CHUNK_SIZE) -> Iterator[pa.RecordBatch]:
+    result = db.execute(stmt.execution_options(yield_per=chunk_size))
+    for chunk in result.partitions():
+        columns = list(zip(*chunk))
+        yield pa.RecordBatch.from_arrays(
+            [pa.array(values, type=field.type) for values, field in zip(columns, ARROW_SCHEMA)],
+            schema=ARROW_SCHEMA,
+        )
+
+
+class _ByteSink:
+    """Write-only file object that keeps what the Arrow writers write until it is drained."""
+
+    def __init__(self):
+        self._chunks = []
+        self._position = 0
+        self.closed = False
+
+    def write(self, data) -> int:
+        self._chunks.append(bytes(data))
+        self._position += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        return self._position
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def drain(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks = []
+        return data
+
+
+@contextmanager
+def _batch_writer(format: str, sink):
+    if format == "parquet":
+        # One row group per batch
+        with pq.ParquetWriter(sink, ARROW_SCHEMA, compression="zstd") as writer:
+            yield writer
+    elif format == "arrow":
+        with pa.ipc.new_stream(sink, ARROW_SCHEMA) as writer:
+            yield writer
+    else:
+        raise ValueError(f"Unknown columnar format '{format}'")
+
+
+def write_columnar(db: Session, path: str, format: str, stmt, chunk_size: int = COLUMNAR_CHUNK_SIZE) -> int:
+    """Write the rows of `stmt` to `path` as Parquet or an Arrow IPC stream; returns the row count."""
+    rows = 0
+    with pa.OSFile(path, "wb") as sink, _batch_writer(format, sink) as writer:
+        for batch in iter_record_batches(db, stmt, chunk_size):
+            writer.write_batch(batch)
+            rows += batch.num_rows
+    return rows
+
+
+def snapshot_path(cache_dir: str, version: int, format: str, **filters) -> str:
+    key = hashlib.sha1(repr(sorted(filters.items())).encode()).hexdigest()[:16]
+    return os.path.join(cache_dir, f"credit_balances-v{version}-{key}.{format}")
+
+
+def cached_snapshot(cache_dir: Optional[str], version: int, format: str, **filters) -> Optional[str]:
+    """Path of a finished snapshot for `filters` at table `version`, if one is cached."""
+    if not cache_dir:
+        return None
+    path = snapshot_path(cache_dir, version, format, **filters)
+    try:
+        # Mark it as recently used for evict_snapshots
+        os.utime(path)
+    except OSError:
+        return None
+    return path
+
+
+def evict_snapshots(cache_dir: str, version: int, max_bytes: int, keep: Optional[str] = None):
+    """Remove snapshots of other table versions, then the least recently used ones until the
+    directory holds at most `max_bytes`. `keep` (the snapshot just written) is never removed."""
+    snapshots = []
+    for path in glob.glob(os.path.join(cache_dir, "credit_balances-v*")):
+        name = os.path.basename(path)
+        if name.endswith(".partial"):
+            continue
+        try:
+            if not name.startswith(f"credit_balances-v{version}-"):
+                os.remove(path)
+                continue
+            stat = os.stat(path)
+        except OSError:
+            continue  # Removed by another worker
+        snapshots.append((stat.st_mtime, stat.st_size, path))
+
+    total = sum(size for _, size, _ in snapshots)
+    for _, size, path in sorted(snapshots):
+        if total <= max_bytes:
+            break
+        if path == keep:
+            continue
+        try:
+            os.remove(path)
+        except OSError:
+            pass  # Already removed by another worker; files being served stay readable until closed
+        total -= size
+
+
+def stream_columnar(
+    format: str,
+    version: int,
+    cache_dir: Optional[str] = None,
+    cache_max_bytes: int = 0,
+    chunk_size: int = COLUMNAR_CHUNK_SIZE,
+    **filters,
+) -> Iterator[bytes]:
+    """Encoded export bytes for `filters`, yielded batch by batch.
+
+    Uses its own session so the stream outlives the request. With
+    `cache_dir`, the bytes are also written to a snapshot for `version`,
+    which is only put in place once the whole export has been sent. The
+    version is read before the rows, so a snapshot can only ever be newer
+    than its label, never older.
+    """
+    cache, partial, path = None, None, None
+    if cache_dir:
+        path = snapshot_path(cache_dir, version, format, **filters)
+        os.makedirs(cache_dir, exist_ok=True)
+        handle, partial = tempfile.mkstemp(dir=cache_dir, prefix=os.path.basename(path) + ".", suffix=".partial")
+        cache = os.fdopen(handle, "wb")
+
+    db = SessionLocal()
+    sink = _ByteSink()
+    try:
+        with _batch_writer(format, sink) as writer:
+            for batch in iter_record_batches(db, export_statement(db, **filters), chunk_size):
+                writer.write_batch(batch)
+                record_rows(batch.num_rows)
+                data = sink.drain()
+                if cache:
+                    cache.write(data)
+                yield data
+        # The Parquet footer / end-of-stream marker
+        data = sink.drain()
+        if cache:
+            cache.write(data)
+            cache.close()
+            os.replace(partial, path)
+            evict_snapshots(cache_dir, version, cache_max_bytes, keep=path)
+        yield data
+    finally:
+        db.close()
+        if cache:
+            cache.close()
+            if os.path.exists(partial):
+                os.remove(partial)
@@ -1,8 +1,11 @@
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event
+from sqlalchemy.ext.compiler import compiles
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
-import pyodbc
+from sqlalchemy.sql.functions import now
+from sqlalchemy.pool import StaticPool
 from urllib.parse import quote_plus
+import os
 from config import settings
 
 # Direct pyodbc connection string
@@ -27,16 +30,60 @@ connection_string = (
     "MultipleActiveResultSets=True;"
 )
 
-# Create SQLAlchemy engine with pyodbc and connection pooling
-engine = create_engine(
-    f"mssql+pyodbc:///?odbc_connect={quote_plus(connection_string)}",
-    echo=False,
-    pool_size=10,
-    max_overflow=20,
-    pool_pre_ping=True,
-    pool_recycle=3600,  # Recycle connections every hour
-    pool_timeout=30
-)
+
+@compiles(now, "sqlite")
+def _sqlite_now(element, compiler, **kw):
+    """CURRENT_TIMESTAMP with microseconds, in the format SQLAlchemy binds datetimes in.
+
+    SQLite compares timestamps as text, so whole-second "YYYY-MM-DD HH:MM:SS"
+    values would sort before the same instant bound as "...:SS.000000".
+    """
+    return "strftime('%Y-%m-%d %H:%M:%f000', 'now')"
+
+
+def create_local_engine(url: str):
+    """Engine for a local stand-in database (SQLite or PostgreSQL), used for benchmarks.
+
+    The SQL Server tables live in the `delhi` schema. On SQLite that schema is
+    a second file next to the main one (bench.db -> bench.delhi.db), attached
+    under that name; on PostgreSQL the schema must exist (see benchmark_data.py).
+    """
+    if not url.startswith("sqlite"):
+        return create_engine(url, echo=False, pool_size=10, max_overflow=20, pool_pre_ping=True)
+
+    database = url.split("///", 1)[1] if "///" in url else ""
+    in_memory = database in ("", ":memory:")
+    root, extension = os.path.splitext(database)
+    delhi_database = ":memory:" if in_memory else f"{root}.delhi{extension}"
+    sqlite_engine = create_engine(
+        url,
+        echo=False,
+        connect_args={"check_same_thread": False},
+        # An in-memory database only exists on its one connection
+        **({"poolclass": StaticPool} if in_memory else {}),
+    )
+
+    @event.listens_for(sqlite_engine, "connect")
+    def attach_delhi_schema(dbapi_connection, connection_record):
+        dbapi_connection.execute(f"ATTACH DATABASE '{delhi_database}' AS delhi")
+
+    return sqlite_engine
+
+
+if settings.SQLALCHEMY_DATABASE_URL:
+    engine = create_local_engine(settings.SQLALCHEMY_DATABASE_URL)
+else:
+    # Create SQLAlchemy engine with pyodbc and connection pooling
+    engine = create_engine(
+        f"mssql+pyodbc:///?odbc_connect={quote_plus(connection_string)}",
+        echo=False,
+        pool_size=10,
+        max_overflow=20,
+        pool_pre_ping=True,
+        pool_recycle=3600,  # Recycle connections every hour
+        pool_timeout=30,
+        fast_executemany=True  # Send executemany batches as one parameter array
+    )
 
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
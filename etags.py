@@ -0,0 +1,60 @@
+import hashlib
+from typing import Optional
+
+from fastapi import Request, Response, status
+from sqlalchemy import func, select
+from sqlalchemy.orm import Session
+
+import models
+
+ETAG_HEADER = "ETag"
+
+
+def make_etag(*parts) -> str:
+    """Strong ETag derived from the given validator parts."""
+    digest = hashlib.sha1(":".join(str(part) for part in parts).encode()).hexdigest()
+    return f'"{digest[:20]}"'
+
+
+def request_etag(request: Request, version: int, *parts) -> str:
+    """ETag for a GET response that depends only on the table version and the request URL.
+
+    Query parameters are sorted so equivalent URLs share an ETag. Pass
+    anything else the response depends on (e.g. the caller's center) as
+    `parts`.
+    """
+    query = sorted(request.query_params.multi_items())
+    return make_etag(version, request.url.path, query, *parts)
+
+
+def centers_etag(db: Session) -> str:
+    """ETag for the centers list from one aggregate query instead of loading every row."""
+    count, max_id, max_created, max_updated = db.execute(
+        select(
+            func.count(models.Center.id),
+            func.max(models.Center.id),
+            func.max(models.Center.created_at),
+            func.max(models.Center.updated_at),
+        ).where(models.Center.is_active == True)
+    ).one()
+    return make_etag("centers", count, max_id, max_created, max_updated)
+
+
+def etag_matches(request: Request, etag: str) -> bool:
+    """Whether the request's If-None-Match already names `etag` (weak comparison, as RFC 9110 requires)."""
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    if header.strip() == "*":
+        return True
+    candidates = {candidate.strip().removeprefix("W/") for candidate in header.split(",")}
+    return etag in candidates
+
+
+def cache_headers(etag: str, headers: Optional[dict] = None) -> dict:
+    """ETag plus Cache-Control: no-cache, so clients always revalidate before reusing a copy."""
+    return {**(headers or {}), ETAG_HEADER: etag, "Cache-Control": "no-cache"}
+
+
+def not_modified(etag: str) -> Response:
+    return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=cache_headers(etag))
@@ -0,0 +1,99 @@
+import csv
+import io
+import json
+from datetime import datetime
+from typing import Iterator, Optional
+
+from sqlalchemy import select
+
+import models
+from database import SessionLocal
+from metrics import record_rows
+from queries import filter_credit_balances
+
+# Columns written by the exporters, in output order
+EXPORT_COLUMNS = [
+    "id",
+    "client_code",
+    "client_name",
+    "phone_no",
+    "email_id",
+    "treatment_name",
+    "package_amount",
+    "amount_paid",
+    "balance_amount",
+    "prepaid_gift_card_balance",
+    "center",
+    "final_bucket",
+    "sessions_paid",
+    "sessions_consumed",
+    "balance_sessions",
+    "voucher_number",
+    "created_at",
+    "updated_at",
+]
+
+EXPORT_FORMATS = {
+    "ndjson": "application/x-ndjson",
+    "csv": "text/csv",
+}
+
+EXPORT_CHUNK_SIZE = 1000
+
+
+def iter_credit_balance_chunks(
+    client_code: Optional[str] = None,
+    client_name: Optional[str] = None,
+    center: Optional[str] = None,
+    chunk_size: int = EXPORT_CHUNK_SIZE,
+) -> Iterator[list]:
+    """Yield lists of plain row tuples, fetched from a server-side cursor.
+
+    Uses its own session so the stream outlives the request dependency, and
+    selects bare columns so no ORM identity map grows while exporting.
+    """
+    columns = [getattr(models.CreditBalance, name) for name in EXPORT_COLUMNS]
+    stmt = filter_credit_balances(select(*columns), client_code, client_name, center)
+    stmt = stmt.order_by(models.CreditBalance.id)
+
+    db = SessionLocal()
+    try:
+        result = db.execute(stmt.execution_options(yield_per=chunk_size))
+        for chunk in result.partitions():
+            record_rows(len(chunk))
+            yield chunk
+    finally:
+        db.close()
+
+
+def _json_default(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def ndjson_stream(chunks: Iterator[list]) -> Iterator[str]:
+    """Encode row chunks as newline-delimited JSON, one write per chunk."""
+    for chunk in chunks:
+        yield "".join(
+            json.dumps(dict(zip(EXPORT_COLUMNS, row)), default=_json_default) + "\n"
+            for row in chunk
+        )
+
+
+def csv_stream(chunks: Iterator[list]) -> Iterator[str]:
+    """Encode row chunks as CSV with a header line, one write per chunk."""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(EXPORT_COLUMNS)
+    # Send the header straight away so the client gets its first byte immediately
+    yield buffer.getvalue()
+
+    for chunk in chunks:
+        buffer.seek(0)
+        buffer.truncate()
+        writer.writerows(
+            [value.isoformat() if isinstance(value, datetime) else value for value in row]
+            for row in chunk
+        )
+        yield buffer.getvalue()
@@ -0,0 +1,59 @@
+"""Export credit balances to a Parquet file or an Arrow IPC stream for analytics.
+
+Usage: python export_columnar.py credit_balances.parquet [--center GK2] [--bucket Peels] [--updated-since 2024-01-01]
+
+The format follows the file extension (.parquet or .arrow) unless --format
+is given. Load the result with pandas.read_parquet or pyarrow.ipc.open_stream.
+"""
+import argparse
+import logging
+import os
+import time
+from datetime import datetime
+
+from columnar_export import COLUMNAR_CHUNK_SIZE, COLUMNAR_FORMATS, export_statement, write_columnar
+from database import SessionLocal
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+def export_columnar(path: str, format: str, chunk_size: int = COLUMNAR_CHUNK_SIZE, **filters) -> int:
+    db = SessionLocal()
+    try:
+        started = time.perf_counter()
+        rows = write_columnar(db, path, format, export_statement(db, **filters), chunk_size)
+        elapsed = time.perf_counter() - started
+        logger.info(
+            f"Exported {rows} records to {path} ({os.path.getsize(path):,} bytes) in {elapsed:.2f}s"
+        )
+        return rows
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("output_path")
+    parser.add_argument("--format", choices=sorted(COLUMNAR_FORMATS), help="Defaults to the output file extension")
+    parser.add_argument("--center")
+    parser.add_argument("--bucket", dest="final_bucket")
+    parser.add_argument("--updated-since", type=datetime.fromisoformat, help="ISO date or timestamp")
+    parser.add_argument("--chunk-size", type=int, default=COLUMNAR_CHUNK_SIZE)
+    args = parser.parse_args()
+
+    format = args.format or os.path.splitext(args.output_path)[1].lstrip(".").lower()
+    if format not in COLUMNAR_FORMATS:
+        parser.error("Pass --format or use a .parquet or .arrow output file")
+    try:
+        count = export_columnar(
+            args.output_path,
+            format,
+            args.chunk_size,
+            center=args.center,
+            final_bucket=args.final_bucket,
+            updated_since=args.updated_since,
+        )
+        print(f"Export completed successfully. {count} records exported.")
+    except Exception as e:
+        print(f"Export failed: {e}")
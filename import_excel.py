@@ -2,13 +2,26 @@ import pandas as pd
 from sqlalchemy.orm import sessionmaker
 from database import engine, Base
 from models import CreditBalance
+from table_versions import CREDIT_BALANCES, bump_table_version
+from bulk_import import DEFAULT_BATCH_SIZE, clean_credit_balance_frame, bulk_insert_credit_balances
+from centers import assign_centers, center_resolver
+from change_feed import record_deletes
+from incremental_import import sync_credit_balances
+import argparse
 import logging
+import time
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-def import_excel_data(excel_file_path: str):
+def import_excel_data(
+    excel_file_path: str,
+    bulk: bool = False,
+    batch_size: int = DEFAULT_BATCH_SIZE,
+    incremental: bool = False,
+    staging: bool = False
+):
     """Import data from Excel file to database."""
     
     # Create session
@@ -30,47 +43,69 @@ def import_excel_data(excel_file_path: str):
         logger.info(f"Found {len(df)} rows in Excel file")
         logger.info(f"Columns: {df.columns.tolist()}")
         
-        # Clear existing data
-        logger.info("Clearing existing data...")
-        db.query(CreditBalance).delete()
-        db.commit()
+        # Clear existing data (incremental imports only apply the differences). A reload is
+        # one transaction: readers see the old rows until the new ones are committed, and a
+        # failed import rolls back to the old rows instead of leaving the table truncated
+        if not incremental:
+            logger.info("Clearing existing data...")
+            # Sync clients see the reload as every old record deleted and every new one created
+            record_deletes(db)
+            db.query(CreditBalance).delete()
+        
+        started = time.perf_counter()
         
-        # Import data
-        imported_count = 0
-        for index, row in df.iterrows():
-            try:
-                # Create CreditBalance object
-                credit_balance = CreditBalance(
-                    client_code=str(row.get('Client Code', '')),
-                    client_name=str(row.get('Client name', '')),
-                    phone_no=str(row.get('Phone No', '')) if pd.notna(row.get('Phone No')) else None,
-                    treatment_name=str(row.get('Treatment Name', '')) if pd.notna(row.get('Treatment Name')) else None,
-                    package_amount=float(str(row.get('Package Amount (₹)', 0)).replace(',', '')) if pd.notna(row.get('Package Amount (₹)')) else 0.0,
-                    amount_paid=float(str(row.get('Amount Paid by the client', 0)).replace(',', '')) if pd.notna(row.get('Amount Paid by the client')) else 0.0,
-                    balance_amount=float(str(row.get('Balance Amount (₹)', 0)).replace(',', '')) if pd.notna(row.get('Balance Amount (₹)')) else 0.0,
-                    prepaid_gift_card_balance=float(str(row.get('Prepaid / Gift Card Balance', 0)).replace(',', '')) if pd.notna(row.get('Prepaid / Gift Card Balance')) else 0.0,
-                    center=str(row.get('Center', '')) if pd.notna(row.get('Center')) else None,
-                    final_bucket=str(row.get('Final Bucket', '')) if pd.notna(row.get('Final Bucket')) else None,
-                    sessions_paid=float(row.get('Sessions Paid', 0)) if pd.notna(row.get('Sessions Paid')) else 0.0,
-                    sessions_consumed=float(row.get('Sessions Consumed', 0)) if pd.notna(row.get('Sessions Consumed')) else 0.0,
-                    balance_sessions=float(row.get('Balance Sessions', 0)) if pd.notna(row.get('Balance Sessions')) else 0.0,
-                )
+        if bulk or incremental:
+            # Vectorized column cleaning plus executemany batches
+            frame = clean_credit_balance_frame(df)
+            assign_centers(db, frame)
+            if incremental:
+                sync_credit_balances(db, frame, batch_size, staging=staging)
+                imported_count = len(frame)
+            else:
+                imported_count = bulk_insert_credit_balances(db, frame, batch_size, commit=False)
+        else:
+            # Import data
+            imported_count = 0
+            for index, row in df.iterrows():
+                try:
+                    # Create CreditBalance object
+                    credit_balance = CreditBalance(
+                        client_code=str(row.get('Client Code', '')),
+                        client_name=str(row.get('Client name', '')),
+                        phone_no=str(row.get('Phone No', '')) if pd.notna(row.get('Phone No')) else None,
+                        treatment_name=str(row.get('Treatment Name', '')) if pd.notna(row.get('Treatment Name')) else None,
+                        package_amount=float(str(row.get('Package Amount (₹)', 0)).replace(',', '')) if pd.notna(row.get('Package Amount (₹)')) else 0.0,
+                        amount_paid=float(str(row.get('Amount Paid by the client', 0)).replace(',', '')) if pd.notna(row.get('Amount Paid by the client')) else 0.0,
+                        balance_amount=float(str(row.get('Balance Amount (₹)', 0)).replace(',', '')) if pd.notna(row.get('Balance Amount (₹)')) else 0.0,
+                        prepaid_gift_card_balance=float(str(row.get('Prepaid / Gift Card Balance', 0)).replace(',', '')) if pd.notna(row.get('Prepaid / Gift Card Balance')) else 0.0,
+                        center=str(row.get('Center', '')) if pd.notna(row.get('Center')) else None,
+                        final_bucket=str(row.get('Final Bucket', '')) if pd.notna(row.get('Final Bucket')) else None,
+                        sessions_paid=float(row.get('Sessions Paid', 0)) if pd.notna(row.get('Sessions Paid')) else 0.0,
+                        sessions_consumed=float(row.get('Sessions Consumed', 0)) if pd.notna(row.get('Sessions Consumed')) else 0.0,
+                        balance_sessions=float(row.get('Balance Sessions', 0)) if pd.notna(row.get('Balance Sessions')) else 0.0,
+                    )
+                    credit_balance.center_id = center_resolver.resolve(db, credit_balance.center)
+                    credit_balance.voucher_number = credit_balance.generate_voucher_number(
+                        center_resolver.code(db, credit_balance.center_id)
+                    )
                 
-                db.add(credit_balance)
-                imported_count += 1
+                    db.add(credit_balance)
+                    imported_count += 1
                 
-                # Commit in batches of 100
-                if imported_count % 100 == 0:
-                    db.commit()
-                    logger.info(f"Imported {imported_count} records...")
+                    # Send to the server in batches of 100; committed with the delete at the end
+                    if imported_count % 100 == 0:
+                        db.flush()
+                        logger.info(f"Imported {imported_count} records...")
                     
-            except Exception as e:
-                logger.error(f"Error importing row {index}: {e}")
-                continue
+                except (ValueError, TypeError) as e:
+                    logger.error(f"Error importing row {index}: {e}")
+                    continue
         
-        # Final commit
+        # Final commit; bumping the table version lets running API workers refresh their caches
+        bump_table_version(db, CREDIT_BALANCES)
         db.commit()
-        logger.info(f"Successfully imported {imported_count} records")
+        elapsed = time.perf_counter() - started
+        logger.info(f"Successfully imported {imported_count} records in {elapsed:.2f}s ({imported_count / max(elapsed, 1e-9):,.0f} rows/s)")
         
         return imported_count
         
@@ -82,9 +117,21 @@ def import_excel_data(excel_file_path: str):
         db.close()
 
 if __name__ == "__main__":
-    excel_file_path = r"C:\Users\Oliva\Downloads\Credit balance report Delhi - Copy.xlsx"
+    parser = argparse.ArgumentParser(description="Import the credit balance report")
+    parser.add_argument("excel_file_path", nargs="?", default=r"C:\Users\Oliva\Downloads\Credit balance report Delhi - Copy.xlsx")
+    parser.add_argument("--bulk", action="store_true", help="Use vectorized cleaning and batched executemany inserts")
+    parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE)
+    parser.add_argument("--incremental", action="store_true", help="Apply only the inserts, updates and deletes needed instead of reloading")
+    parser.add_argument("--staging", action="store_true", help="With --incremental, upload changes to a staging table and apply them atomically")
+    args = parser.parse_args()
     try:
-        count = import_excel_data(excel_file_path)
+        count = import_excel_data(
+            args.excel_file_path,
+            bulk=args.bulk,
+            batch_size=args.batch_size,
+            incremental=args.incremental,
+            staging=args.staging
+        )
         print(f"Import completed successfully. {count} records imported.")
     except Exception as e:
         print(f"Import failed: {e}")
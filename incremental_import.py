@@ -0,0 +1,186 @@
+"""Differential (upsert) import of a cleaned credit balance frame.
+
+Incoming rows are matched to existing ones on the natural key
+(client_code, treatment_name, center), with repeated keys paired up in id
+order. Row-content hashes then decide what changed, and only the required
+inserts, updates and deletes are written. Unchanged rows keep their id and
+created_at.
+"""
+import logging
+import time
+
+import pandas as pd
+from sqlalchemy import Column, Integer, MetaData, String, Table, bindparam, delete, insert, select, update
+from sqlalchemy.orm import Session
+
+import models
+from bulk_import import DEFAULT_BATCH_SIZE
+from change_feed import record_deletes
+
+logger = logging.getLogger(__name__)
+
+KEY_COLUMNS = ['client_code', 'treatment_name', 'center']
+TEXT_CONTENT_COLUMNS = ['client_name', 'phone_no', 'email_id', 'final_bucket', 'voucher_number']
+NUMERIC_CONTENT_COLUMNS = [
+    'package_amount',
+    'amount_paid',
+    'balance_amount',
+    'prepaid_gift_card_balance',
+    'sessions_paid',
+    'sessions_consumed',
+    'balance_sessions',
+]
+# Foreign keys; missing values hash as 0
+REFERENCE_CONTENT_COLUMNS = ['center_id']
+CONTENT_COLUMNS = TEXT_CONTENT_COLUMNS + NUMERIC_CONTENT_COLUMNS + REFERENCE_CONTENT_COLUMNS
+WRITE_COLUMNS = KEY_COLUMNS + CONTENT_COLUMNS + ['voucher_key']
+
+# Diff rows uploaded ahead of the atomic apply; op is 'I'nsert, 'U'pdate or 'D'elete
+staging_metadata = MetaData()
+credit_balances_staging = Table(
+    'credit_balances_staging',
+    staging_metadata,
+    Column('target_id', Integer, nullable=True),
+    Column('op', String(1), nullable=False),
+    *(Column(column.name, column.type) for column in models.CreditBalance.__table__.columns if column.name in WRITE_COLUMNS),
+)
+
+
+def _match_keys(frame: pd.DataFrame) -> pd.DataFrame:
+    """Normalized natural key plus an occurrence counter for duplicate keys."""
+    keys = pd.DataFrame({column: frame[column].fillna('').astype(str).str.strip() for column in KEY_COLUMNS})
+    keys['occurrence'] = keys.groupby(KEY_COLUMNS).cumcount()
+    return keys
+
+
+def _content_hash(frame: pd.DataFrame) -> pd.Series:
+    normalized = pd.DataFrame(index=frame.index)
+    for column in TEXT_CONTENT_COLUMNS:
+        normalized[column] = frame[column].fillna('').astype(str)
+    for column in NUMERIC_CONTENT_COLUMNS:
+        normalized[column] = frame[column].astype(float).fillna(0.0).round(6)
+    for column in REFERENCE_CONTENT_COLUMNS:
+        normalized[column] = pd.to_numeric(frame[column]).fillna(0).astype('int64')
+    return pd.util.hash_pandas_object(normalized, index=False)
+
+
+def _records(frame: pd.DataFrame) -> list:
+    frame = frame.assign(voucher_key=frame['voucher_number'].str.strip().str.upper())
+    return frame.astype(object).where(frame.notna(), None).to_dict('records')
+
+
+def compute_diff(db: Session, incoming: pd.DataFrame):
+    """Work out which rows to insert, update and delete.
+
+    Returns (inserts, updates, delete_ids): inserts is a frame of new rows,
+    updates is a frame of changed rows with their existing `id`.
+    """
+    columns = ['id'] + KEY_COLUMNS + CONTENT_COLUMNS
+    rows = db.execute(
+        select(*(getattr(models.CreditBalance, column) for column in columns)).order_by(models.CreditBalance.id)
+    ).all()
+    existing = pd.DataFrame(rows, columns=columns)
+    incoming = incoming.reset_index(drop=True)
+
+    left = _match_keys(existing).assign(id=existing['id'], existing_hash=_content_hash(existing))
+    right = _match_keys(incoming).assign(row=incoming.index, incoming_hash=_content_hash(incoming))
+    matched = left.merge(right, on=KEY_COLUMNS + ['occurrence'], how='outer', indicator=True)
+
+    inserts = incoming.loc[matched.loc[matched['_merge'] == 'right_only', 'row'].astype(int)]
+    delete_ids = matched.loc[matched['_merge'] == 'left_only', 'id'].astype(int).tolist()
+    changed = matched[(matched['_merge'] == 'both') & (matched['existing_hash'] != matched['incoming_hash'])]
+    updates = incoming.loc[changed['row'].astype(int)].assign(id=changed['id'].astype(int).to_numpy())
+    return inserts, updates, delete_ids
+
+
+def _apply_direct(db: Session, inserts, updates, delete_ids, batch_size: int):
+    table = models.CreditBalance.__table__
+    update_statement = (
+        update(table)
+        .where(table.c.id == bindparam('b_id'))
+        .values({column: bindparam(f'b_{column}') for column in WRITE_COLUMNS})
+    )
+    update_records = [
+        {f'b_{key}': value for key, value in record.items()}
+        for record in _records(updates[['id'] + KEY_COLUMNS + CONTENT_COLUMNS])
+    ]
+    insert_records = _records(inserts[KEY_COLUMNS + CONTENT_COLUMNS])
+
+    for start in range(0, len(delete_ids), batch_size):
+        chunk = delete_ids[start:start + batch_size]
+        record_deletes(db, table.c.id.in_(chunk))
+        db.execute(delete(table).where(table.c.id.in_(chunk)))
+        db.commit()
+    for start in range(0, len(update_records), batch_size):
+        db.execute(update_statement, update_records[start:start + batch_size])
+        db.commit()
+    for start in range(0, len(insert_records), batch_size):
+        db.execute(insert(table), insert_records[start:start + batch_size])
+        db.commit()
+
+
+def _apply_staged(db: Session, inserts, updates, delete_ids, batch_size: int):
+    """Upload the diff to a staging table, then apply it in one short transaction."""
+    table = models.CreditBalance.__table__
+    staging = credit_balances_staging
+    staging.create(db.connection(), checkfirst=True)
+    db.execute(delete(staging))
+
+    staged = (
+        [dict(record, target_id=None, op='I') for record in _records(inserts[KEY_COLUMNS + CONTENT_COLUMNS])]
+        + [
+            dict(record, target_id=target_id, op='U')
+            for target_id, record in zip(updates['id'].tolist(), _records(updates[KEY_COLUMNS + CONTENT_COLUMNS]))
+        ]
+        + [dict(dict.fromkeys(WRITE_COLUMNS), target_id=record_id, op='D') for record_id in delete_ids]
+    )
+    for start in range(0, len(staged), batch_size):
+        db.execute(insert(staging), staged[start:start + batch_size])
+    db.commit()
+
+    # Everything below is visible to readers all at once
+    staged_deletes = table.c.id.in_(select(staging.c.target_id).where(staging.c.op == 'D'))
+    record_deletes(db, staged_deletes)
+    db.execute(delete(table).where(staged_deletes))
+    db.execute(
+        update(table)
+        .where(table.c.id == staging.c.target_id)
+        .where(staging.c.op == 'U')
+        .values({column: staging.c[column] for column in WRITE_COLUMNS})
+    )
+    db.execute(insert(table).from_select(
+        WRITE_COLUMNS,
+        select(*(staging.c[column] for column in WRITE_COLUMNS)).where(staging.c.op == 'I')
+    ))
+    db.execute(delete(staging))
+    db.commit()
+
+
+def sync_credit_balances(db: Session, incoming: pd.DataFrame, batch_size: int = DEFAULT_BATCH_SIZE, staging: bool = False) -> dict:
+    """Bring credit_balances in line with `incoming`, writing only the differences.
+
+    `incoming` is a cleaned frame (see bulk_import.clean_credit_balance_frame)
+    with center_id and voucher_number filled in (see centers.assign_centers). With staging=True the changes are uploaded
+    first and applied atomically; otherwise they are written in committed
+    batches.
+    """
+    started = time.perf_counter()
+    inserts, updates, delete_ids = compute_diff(db, incoming)
+    stats = {
+        'inserted': len(inserts),
+        'updated': len(updates),
+        'deleted': len(delete_ids),
+        'unchanged': len(incoming) - len(inserts) - len(updates),
+    }
+    logger.info(
+        f"Diff: {stats['inserted']} inserts, {stats['updated']} updates, "
+        f"{stats['deleted']} deletes, {stats['unchanged']} unchanged"
+    )
+
+    if staging:
+        _apply_staged(db, inserts, updates, delete_ids, batch_size)
+    else:
+        _apply_direct(db, inserts, updates, delete_ids, batch_size)
+
+    logger.info(f"Differential import applied in {time.perf_counter() - started:.2f}s")
+    return stats
@@ -1,5 +1,6 @@
-from fastapi import FastAPI, Depends, HTTPException, status
+from fastapi import FastAPI, Depends, HTTPException, Request, Response, status
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import FileResponse, StreamingResponse
 from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
 from sqlalchemy.orm import Session
 from typing import List, Optional
@@ -8,13 +9,40 @@ from jose import JWTError, jwt
 from passlib.context import CryptContext
 import models
 import schemas
-from database import get_db, engine
+from database import SessionLocal, get_db, engine
+from pagination import paginate, page_size, next_page_headers, NEXT_CURSOR_HEADER, LINK_HEADER
+from queries import filter_credit_balances, filter_by_voucher, filter_by_voucher_keys, chunked
+from export import EXPORT_FORMATS, iter_credit_balance_chunks, ndjson_stream, csv_stream
+from columnar_export import COLUMNAR_FORMATS, cached_snapshot, stream_columnar
+from batch_writes import apply_batch
+from change_feed import changes_page, record_deletes
+from change_bus import change_bus, record_event, delete_event
+from aggregations import GROUP_DIMENSIONS, METRICS, DEFAULT_METRICS, aggregate, parse_names
+from audit_log import audit_log_writer, build_log_entry
+from table_versions import CREDIT_BALANCES, bump_table_version, get_table_version
+from summary_stats import summary_stats_cache, summary_values
+from auth_cache import get_cached_user, get_cached_center, cache_stats
+from search_index import search_index, SEARCH_FIELDS, SEARCH_MODES
+from centers import center_resolver
+from column_store import credit_balance_store
+from etags import ETAG_HEADER, request_etag, centers_etag, etag_matches, cache_headers, not_modified
+from serialization import credit_balance_columns, parse_fields, rows_response, FastJSONResponse
+from metrics import (
+    metrics_registry, MetricsMiddleware, instrument_engine, record_rows,
+    METRICS_MEDIA_TYPE, DB_QUERIES_HEADER, DB_TIME_HEADER,
+)
+from slow_queries import slow_query_log
+from config import settings
 
 # Create tables
 models.Base.metadata.create_all(bind=engine)
 
 app = FastAPI(title="Delhi Clinic Credit Balance API", version="1.0.0")
 
+# Route handlers that touch the database are plain `def` functions: FastAPI runs
+# them in its threadpool, so a slow pyodbc round-trip never blocks the event loop.
+# Only handlers that do no blocking I/O are declared `async def`.
+
 # CORS middleware
 app.add_middleware(
     CORSMiddleware,
@@ -22,8 +50,13 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=[NEXT_CURSOR_HEADER, LINK_HEADER, ETAG_HEADER, DB_QUERIES_HEADER, DB_TIME_HEADER],
 )
 
+# Per-route request metrics and SQL timings, served from /metrics
+app.add_middleware(MetricsMiddleware, registry=metrics_registry, query_stats_header=settings.QUERY_STATS_HEADER)
+instrument_engine(engine, metrics_registry, slow_query_log)
+
 # Authentication configuration
 SECRET_KEY = "your-secret-key-change-this-in-production"
 ALGORITHM = "HS256"
@@ -60,7 +93,8 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
 
-async def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)):
+def authenticate(db: Session, token: str) -> models.User:
+    """The user a bearer token was issued to; 401 if it is invalid or the user is gone."""
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
@@ -73,11 +107,51 @@ async def get_current_user(token: str = Depends(oauth2_scheme), db: Session = De
             raise credentials_exception
     except JWTError:
         raise credentials_exception
-    user = get_user(db, username=username)
+    user = get_cached_user(db, username=username)
     if user is None:
         raise credentials_exception
     return user
 
+def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)):
+    return authenticate(db, token)
+
+def get_streaming_user(token: str = Depends(oauth2_scheme)):
+    """get_current_user for long-lived responses: the session is closed before the route runs.
+
+    A get_db session is only closed once the response is complete, which for
+    an event stream means holding a pooled connection until the client leaves.
+    """
+    db = SessionLocal()
+    try:
+        return authenticate(db, token)
+    finally:
+        db.close()
+
+def require_admin(current_user: models.User = Depends(get_current_user)):
+    if (current_user.role or "").upper() != "ADMIN":
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Admin privileges required"
+        )
+    return current_user
+
+@app.on_event("startup")
+async def start_audit_log_writer():
+    await audit_log_writer.start()
+
+@app.on_event("startup")
+async def start_change_bus():
+    await change_bus.start()
+
+@app.on_event("shutdown")
+async def stop_audit_log_writer():
+    # Flush any queued API log entries before the worker exits
+    await audit_log_writer.stop()
+
+@app.on_event("shutdown")
+async def stop_change_bus():
+    await change_bus.stop()
+
 @app.get("/")
 async def root():
     return {"message": "Delhi Clinic Credit Balance API"}
@@ -86,62 +160,266 @@ async def root():
 async def health_check():
     return {"status": "healthy"}
 
+@app.get("/metrics", include_in_schema=False)
+async def get_metrics():
+    """Request, database and connection pool metrics in the Prometheus text format."""
+    return Response(content=metrics_registry.render(engine), media_type=METRICS_MEDIA_TYPE)
+
+@app.get("/debug/slow-queries", dependencies=[Depends(require_admin)])
+async def get_slow_queries(limit: int = 50, clear: bool = False):
+    """Most recent statements over SLOW_QUERY_THRESHOLD_MS, newest first (admins only)."""
+    queries = slow_query_log.entries(limit)
+    if clear:
+        slow_query_log.clear()
+    return {**slow_query_log.stats(), "queries": queries}
+
+@app.get("/debug/change-bus", dependencies=[Depends(require_admin)])
+async def get_change_bus_stats():
+    """Push subscribers and published/sent event counters (admins only)."""
+    return change_bus.stats()
+
+@app.get("/debug/column-store", dependencies=[Depends(require_admin)])
+async def get_column_store_stats():
+    """Size, version, age and refresh counters of the in-memory column store (admins only)."""
+    return credit_balance_store.stats()
+
 # CRUD operations for CreditBalance
 @app.post("/credit-balances/", response_model=schemas.CreditBalance)
-async def create_credit_balance(credit_balance: schemas.CreditBalanceCreate, db: Session = Depends(get_db)):
+def create_credit_balance(credit_balance: schemas.CreditBalanceCreate, db: Session = Depends(get_db)):
     db_credit_balance = models.CreditBalance(**credit_balance.dict())
+    db_credit_balance.center_id = center_resolver.resolve(db, db_credit_balance.center)
     # Generate voucher number
-    db_credit_balance.voucher_number = db_credit_balance.generate_voucher_number()
+    db_credit_balance.voucher_number = db_credit_balance.generate_voucher_number(
+        center_resolver.code(db, db_credit_balance.center_id)
+    )
     db.add(db_credit_balance)
+    version = bump_table_version(db, CREDIT_BALANCES)
     db.commit()
     db.refresh(db_credit_balance)
+    summary_stats_cache.record_change(None, summary_values(db_credit_balance), version)
+    search_index.record_change(db_credit_balance.id, db_credit_balance, version)
+    credit_balance_store.expire()
+    change_bus.publish([record_event(db_credit_balance)], version)
     return db_credit_balance
 
+@app.post("/credit-balances/batch", response_model=schemas.CreditBalanceBatchResponse)
+def batch_credit_balances(
+    batch: schemas.CreditBalanceBatchRequest,
+    response: Response,
+    db: Session = Depends(get_db)
+):
+    """Create, update and delete up to MAX_BATCH_OPERATIONS credit balances in one transaction.
+    
+    Results are reported per operation. With atomic=true (the default) any
+    invalid operation fails the whole batch with 422 and nothing is written;
+    with atomic=false the valid operations are still applied.
+    """
+    operations = len(batch.create) + len(batch.update) + len(batch.delete)
+    if operations > settings.MAX_BATCH_OPERATIONS:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Batch has {operations} operations; the limit is {settings.MAX_BATCH_OPERATIONS}"
+        )
+    
+    result = apply_batch(db, batch)
+    if not result["committed"]:
+        response.status_code = status.HTTP_422_UNPROCESSABLE_ENTITY
+    return result
+
 @app.get("/credit-balances/", response_model=List[schemas.CreditBalance])
-async def get_credit_balances(
+def get_credit_balances(
+    request: Request,
     skip: int = 0, 
     limit: Optional[int] = None, 
+    cursor: Optional[str] = None,
     client_code: Optional[str] = None,
     client_name: Optional[str] = None,
     center: Optional[str] = None,
+    fields: Optional[str] = None,
     db: Session = Depends(get_db)
 ):
+    """List credit balances; `fields` is a comma-separated subset of columns to return.
+    
+    Responses carry an ETag; a matching If-None-Match gets 304 before any
+    rows are read. With COLUMN_STORE_ENABLED the rows come from the
+    in-memory column store.
+    """
     from sqlalchemy.exc import OperationalError
     
+    selected = parse_fields(fields)
     try:
-        query = db.query(models.CreditBalance)
+        snapshot = credit_balance_store.snapshot(db)
+        version = snapshot.version if snapshot is not None else get_table_version(db, CREDIT_BALANCES)
+        etag = request_etag(request, version)
+        if etag_matches(request, etag):
+            return not_modified(etag)
         
-        if client_code:
-            query = query.filter(models.CreditBalance.client_code.ilike(f"%{client_code}%"))
-        if client_name:
-            query = query.filter(models.CreditBalance.client_name.ilike(f"%{client_name}%"))
-        if center:
-            query = query.filter(models.CreditBalance.center.ilike(f"%{center}%"))
-        
-        # SQL Server requires ORDER BY for OFFSET/LIMIT
-        query = query.order_by(models.CreditBalance.id).offset(skip)
-        
-        # If limit is provided, apply it; otherwise return all records
-        if limit is not None:
-            print(f"API: Returning {limit} records (limit provided)")
-            return query.limit(limit).all()
+        # Keyset pagination on id; page size is capped at MAX_PAGE_SIZE
+        if snapshot is not None:
+            positions, next_cursor = snapshot.page(
+                snapshot.filter(client_code, client_name, center), cursor, skip, limit
+            )
+            records = snapshot.rows(positions, selected)
         else:
-            print(f"API: Returning ALL records (no limit provided)")
-            return query.all()
+            query = filter_credit_balances(db.query(*credit_balance_columns(selected)), client_code, client_name, center)
+            records, next_cursor = paginate(query, models.CreditBalance.id, cursor, skip, limit)
+        print(f"API: Returning {len(records)} records")
+        return rows_response(records, selected, headers=cache_headers(etag, next_page_headers(request, next_cursor)))
     except OperationalError as e:
         print(f"Database connection error: {e}")
         # Return empty list if database is unavailable
         return []
 
-@app.get("/credit-balances/{credit_balance_id}", response_model=schemas.CreditBalance)
-async def get_credit_balance(credit_balance_id: int, db: Session = Depends(get_db)):
-    credit_balance = db.query(models.CreditBalance).filter(models.CreditBalance.id == credit_balance_id).first()
+@app.get("/credit-balances/search", response_model=List[schemas.CreditBalance])
+def search_credit_balances(
+    q: str,
+    fields: str = ",".join(SEARCH_FIELDS),
+    mode: str = "substring",
+    limit: int = 20,
+    db: Session = Depends(get_db)
+):
+    """Ranked, case-insensitive search on client name, code and phone.
+    
+    Served from the in-process trigram index; exact matches rank first, then
+    prefix, word-prefix and plain substring matches. Queries of one or two
+    characters always match as in mode=prefix: the start of the value or of
+    one of its words.
+    """
+    from sqlalchemy.exc import OperationalError
+    
+    search_fields = [field.strip() for field in fields.split(",") if field.strip()]
+    unknown = [field for field in search_fields if field not in SEARCH_FIELDS]
+    if unknown or not search_fields:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Invalid search fields {unknown}. Use any of: {', '.join(SEARCH_FIELDS)}"
+        )
+    if mode not in SEARCH_MODES:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Invalid search mode '{mode}'. Use one of: {', '.join(SEARCH_MODES)}"
+        )
+    
+    try:
+        search_index.ensure_fresh(db)
+        ids = search_index.search(q, search_fields, mode, page_size(limit))
+        if not ids:
+            return []
+        records = db.query(*credit_balance_columns()).filter(models.CreditBalance.id.in_(ids)).all()
+        by_id = {record.id: record for record in records}
+        record_rows(len(records))
+        return rows_response(by_id[record_id] for record_id in ids if record_id in by_id)
+    except OperationalError as e:
+        print(f"Database connection error: {e}")
+        return []
+
+@app.get("/credit-balances/export")
+async def export_credit_balances(
+    format: str = "ndjson",
+    client_code: Optional[str] = None,
+    client_name: Optional[str] = None,
+    center: Optional[str] = None
+):
+    """Stream all matching credit balance records as NDJSON or CSV."""
+    if format not in EXPORT_FORMATS:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Unsupported export format '{format}'. Use one of: {', '.join(EXPORT_FORMATS)}"
+        )
+    
+    chunks = iter_credit_balance_chunks(client_code, client_name, center)
+    body = csv_stream(chunks) if format == "csv" else ndjson_stream(chunks)
+    return StreamingResponse(
+        body,
+        media_type=EXPORT_FORMATS[format],
+        headers={"Content-Disposition": f"attachment; filename=credit_balances.{format}"}
+    )
+
+@app.get("/credit-balances/changes", response_model=schemas.CreditBalanceChanges)
+def get_credit_balance_changes(
+    since: Optional[str] = None,
+    updated_since: Optional[datetime] = None,
+    limit: Optional[int] = None,
+    fields: Optional[str] = None,
+    db: Session = Depends(get_db)
+):
+    """Records created or updated after the `since` watermark, and the ids deleted since then.
+    
+    Start without `since` (or with `updated_since`) for a first copy, then
+    poll with the returned watermark; fetch again at once while has_more is
+    true.
+    """
+    selected = parse_fields(fields)
+    return FastJSONResponse(changes_page(db, since, updated_since, limit, selected))
+
+@app.get("/credit-balances/export/columnar")
+def export_credit_balances_columnar(
+    format: str = "parquet",
+    center: Optional[str] = None,
+    final_bucket: Optional[str] = None,
+    updated_since: Optional[datetime] = None,
+    db: Session = Depends(get_db)
+):
+    """Export matching credit balances as a Parquet file or an Arrow IPC stream.
+    
+    The file is streamed as it is built from chunked reads; with
+    COLUMNAR_EXPORT_CACHE_DIR set it is also kept and served again until the
+    table changes.
+    """
+    if format not in COLUMNAR_FORMATS:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Unsupported export format '{format}'. Use one of: {', '.join(COLUMNAR_FORMATS)}"
+        )
+    
+    filters = {"center": center, "final_bucket": final_bucket, "updated_since": updated_since}
+    cache_dir = settings.COLUMNAR_EXPORT_CACHE_DIR or None
+    version = get_table_version(db, CREDIT_BALANCES)
+    # The stream has its own session; give this one's connection back before it starts
+    db.close()
+    filename = f"credit_balances.{format}"
+    cached = cached_snapshot(cache_dir, version, format, **filters)
+    if cached:
+        return FileResponse(cached, media_type=COLUMNAR_FORMATS[format], filename=filename)
+    return StreamingResponse(
+        stream_columnar(
+            format,
+            version,
+            cache_dir=cache_dir,
+            cache_max_bytes=settings.COLUMNAR_EXPORT_CACHE_MAX_MB * 1024 * 1024,
+            chunk_size=settings.COLUMNAR_EXPORT_CHUNK_SIZE,
+            **filters,
+        ),
+        media_type=COLUMNAR_FORMATS[format],
+        headers={"Content-Disposition": f"attachment; filename={filename}"}
+    )
+
+@app.get("/credit-balances/{credit_balance_id:int}", response_model=schemas.CreditBalance)
+def get_credit_balance(
+    credit_balance_id: int,
+    request: Request,
+    fields: Optional[str] = None,
+    db: Session = Depends(get_db)
+):
+    selected = parse_fields(fields)
+    snapshot = credit_balance_store.snapshot(db)
+    version = snapshot.version if snapshot is not None else get_table_version(db, CREDIT_BALANCES)
+    etag = request_etag(request, version)
+    if etag_matches(request, etag):
+        return not_modified(etag)
+    if snapshot is not None:
+        position = snapshot.find(credit_balance_id)
+        credit_balance = snapshot.rows([position], selected)[0] if position is not None else None
+    else:
+        credit_balance = db.query(*credit_balance_columns(selected)).filter(
+            models.CreditBalance.id == credit_balance_id
+        ).first()
     if credit_balance is None:
         raise HTTPException(status_code=404, detail="Credit balance not found")
-    return credit_balance
+    return FastJSONResponse(dict(zip(selected, credit_balance)), headers=cache_headers(etag))
 
-@app.put("/credit-balances/{credit_balance_id}", response_model=schemas.CreditBalance)
-async def update_credit_balance(
+@app.put("/credit-balances/{credit_balance_id:int}", response_model=schemas.CreditBalance)
+def update_credit_balance(
     credit_balance_id: int, 
     credit_balance_update: schemas.CreditBalanceUpdate, 
     db: Session = Depends(get_db)
@@ -150,47 +428,72 @@ async def update_credit_balance(
     if credit_balance is None:
         raise HTTPException(status_code=404, detail="Credit balance not found")
     
+    before = summary_values(credit_balance)
+    previous_center_id = credit_balance.center_id
     update_data = credit_balance_update.dict(exclude_unset=True)
     for field, value in update_data.items():
         setattr(credit_balance, field, value)
     
+    if 'center' in update_data:
+        credit_balance.center_id = center_resolver.resolve(db, credit_balance.center)
+    
     # Regenerate voucher number if relevant fields were updated
     if any(field in update_data for field in ['center', 'client_code', 'phone_no']):
-        credit_balance.voucher_number = credit_balance.generate_voucher_number()
+        credit_balance.voucher_number = credit_balance.generate_voucher_number(
+            center_resolver.code(db, credit_balance.center_id)
+        )
     
+    version = bump_table_version(db, CREDIT_BALANCES)
     db.commit()
     db.refresh(credit_balance)
+    summary_stats_cache.record_change(before, summary_values(credit_balance), version)
+    search_index.record_change(credit_balance.id, credit_balance, version)
+    credit_balance_store.expire()
+    events = [record_event(credit_balance)]
+    if credit_balance.center_id != previous_center_id:
+        # Screens of the old center drop the record
+        events.insert(0, delete_event(credit_balance.id, previous_center_id))
+    change_bus.publish(events, version)
     return credit_balance
 
-@app.delete("/credit-balances/{credit_balance_id}")
-async def delete_credit_balance(credit_balance_id: int, db: Session = Depends(get_db)):
+@app.delete("/credit-balances/{credit_balance_id:int}")
+def delete_credit_balance(credit_balance_id: int, db: Session = Depends(get_db)):
     credit_balance = db.query(models.CreditBalance).filter(models.CreditBalance.id == credit_balance_id).first()
     if credit_balance is None:
         raise HTTPException(status_code=404, detail="Credit balance not found")
     
+    before = summary_values(credit_balance)
+    center_id = credit_balance.center_id
+    record_deletes(db, models.CreditBalance.id == credit_balance_id)
     db.delete(credit_balance)
+    version = bump_table_version(db, CREDIT_BALANCES)
     db.commit()
+    summary_stats_cache.record_change(before, None, version)
+    search_index.record_change(credit_balance_id, None, version)
+    credit_balance_store.expire()
+    change_bus.publish([delete_event(credit_balance_id, center_id)], version)
     return {"message": "Credit balance deleted successfully"}
 
 @app.get("/credit-balances/stats/summary")
-async def get_summary_stats(db: Session = Depends(get_db)):
-    from sqlalchemy import func
+def get_summary_stats(request: Request, response: Response, refresh: bool = False, db: Session = Depends(get_db)):
+    """Summary totals with per-center and per-bucket breakdowns.
+    
+    Served from the in-memory aggregate cache, which is brought up to the
+    current table version first; pass refresh=true to recompute from the
+    table (e.g. for auditing).
+    """
     from sqlalchemy.exc import OperationalError
     
     try:
-        total_records = db.query(models.CreditBalance).count()
-        total_balance = db.query(func.sum(models.CreditBalance.balance_amount)).scalar() or 0
-        total_sessions = db.query(func.sum(models.CreditBalance.balance_sessions)).scalar() or 0
-        
-        centers = db.query(models.CreditBalance.center).distinct().all()
-        center_list = [center[0] for center in centers if center[0]]
-        
-        return {
-            "total_records": total_records,
-            "total_balance_amount": total_balance,
-            "total_balance_sessions": total_sessions,
-            "centers": center_list
-        }
+        version = get_table_version(db, CREDIT_BALANCES)
+        etag = request_etag(request, version)
+        if not refresh and etag_matches(request, etag):
+            return not_modified(etag)
+        computed_at, stats = summary_stats_cache.get(db, refresh=refresh, version=version)
+        if computed_at is not None:
+            # The ETag names the version the totals were computed at, not the one read above
+            response.headers.update(cache_headers(request_etag(request, computed_at)))
+        return stats
     except OperationalError as e:
         # Handle database connection errors
         print(f"Database connection error: {e}")
@@ -199,12 +502,40 @@ async def get_summary_stats(db: Session = Depends(get_db)):
             "total_records": 0,
             "total_balance_amount": 0,
             "total_balance_sessions": 0,
-            "centers": []
+            "centers": [],
+            "by_center": {},
+            "by_final_bucket": {}
         }
 
+@app.get("/credit-balances/aggregate")
+def aggregate_credit_balances(
+    request: Request,
+    response: Response,
+    group_by: Optional[str] = None,
+    metrics: Optional[str] = None,
+    client_code: Optional[str] = None,
+    client_name: Optional[str] = None,
+    center: Optional[str] = None,
+    db: Session = Depends(get_db)
+):
+    """Grouped counts, sums and averages, e.g. ?group_by=center,created_month&metrics=count,sum_balance_amount
+
+    Takes the same client_code/client_name/center filters as the list route.
+    """
+    dimensions = parse_names(group_by, GROUP_DIMENSIONS, (), "group_by")
+    selected = parse_names(metrics, METRICS, DEFAULT_METRICS, "metrics", required=True)
+    snapshot = credit_balance_store.snapshot(db)
+    version = snapshot.version if snapshot is not None else get_table_version(db, CREDIT_BALANCES)
+    etag = request_etag(request, version)
+    if etag_matches(request, etag):
+        return not_modified(etag)
+    response.headers.update(cache_headers(etag))
+    filters = {"client_code": client_code, "client_name": client_name, "center": center}
+    return aggregate(db, dimensions, selected, version, snapshot, filters)
+
 # Authentication endpoints
 @app.post("/login", response_model=schemas.LoginResponse)
-async def login(login_data: schemas.LoginRequest, db: Session = Depends(get_db)):
+def login(login_data: schemas.LoginRequest, db: Session = Depends(get_db)):
     user = authenticate_user(db, login_data.username, login_data.password)
     if not user:
         raise HTTPException(
@@ -223,7 +554,7 @@ async def login(login_data: schemas.LoginRequest, db: Session = Depends(get_db))
     }
 
 @app.post("/token", response_model=schemas.LoginResponse)
-async def login_for_access_token(form_data: OAuth2PasswordRequestForm = Depends(), db: Session = Depends(get_db)):
+def login_for_access_token(form_data: OAuth2PasswordRequestForm = Depends(), db: Session = Depends(get_db)):
     user = authenticate_user(db, form_data.username, form_data.password)
     if not user:
         raise HTTPException(
@@ -243,44 +574,61 @@ async def login_for_access_token(form_data: OAuth2PasswordRequestForm = Depends(
 
 # Center-based API endpoints
 @app.get("/credit-balances/by-center/{center_name}", response_model=List[schemas.CreditBalance])
-async def get_credit_balances_by_center(
+def get_credit_balances_by_center(
     center_name: str,
+    request: Request,
     skip: int = 0,
     limit: Optional[int] = None,
+    cursor: Optional[str] = None,
+    fields: Optional[str] = None,
     db: Session = Depends(get_db)
 ):
     """Get all credit balance records for a specific center."""
     from sqlalchemy.exc import OperationalError
     
+    selected = parse_fields(fields)
     try:
-        query = db.query(models.CreditBalance).filter(
-            models.CreditBalance.center.ilike(f"%{center_name}%")
-        )
-        
-        # SQL Server requires ORDER BY for OFFSET/LIMIT
-        query = query.order_by(models.CreditBalance.id).offset(skip)
-        
-        # If limit is provided, apply it; otherwise return all records
-        if limit is not None:
-            print(f"API: Returning {limit} records for center '{center_name}' (limit provided)")
-            return query.limit(limit).all()
+        # Indexed equality on center_id; names that match no center fall back to a text search
+        center_id = center_resolver.resolve(db, center_name)
+        snapshot = credit_balance_store.snapshot(db)
+        version = snapshot.version if snapshot is not None else get_table_version(db, CREDIT_BALANCES)
+        etag = request_etag(request, version, center_id)
+        if etag_matches(request, etag):
+            return not_modified(etag)
+        if snapshot is not None:
+            if center_id is not None:
+                positions = snapshot.filter(center_id=center_id)
+            else:
+                positions = snapshot.filter(center=center_name)
+            positions, next_cursor = snapshot.page(positions, cursor, skip, limit)
+            records = snapshot.rows(positions, selected)
         else:
-            print(f"API: Returning ALL records for center '{center_name}' (no limit provided)")
-            return query.all()
+            if center_id is not None:
+                center_filter = models.CreditBalance.center_id == center_id
+            else:
+                center_filter = models.CreditBalance.center.ilike(f"%{center_name}%")
+            query = db.query(*credit_balance_columns(selected)).filter(center_filter)
+            records, next_cursor = paginate(query, models.CreditBalance.id, cursor, skip, limit)
+        print(f"API: Returning {len(records)} records for center '{center_name}'")
+        return rows_response(records, selected, headers=cache_headers(etag, next_page_headers(request, next_cursor)))
     except OperationalError as e:
         print(f"Database connection error: {e}")
         return []
 
 @app.get("/credit-balances/by-user-center", response_model=List[schemas.CreditBalance])
-async def get_credit_balances_by_user_center(
+def get_credit_balances_by_user_center(
+    request: Request,
     skip: int = 0,
     limit: Optional[int] = None,
+    cursor: Optional[str] = None,
+    fields: Optional[str] = None,
     current_user: models.User = Depends(get_current_user),
     db: Session = Depends(get_db)
 ):
     """Get all credit balance records for the current user's center."""
     from sqlalchemy.exc import OperationalError
     
+    selected = parse_fields(fields)
     try:
         # Get user's center
         if not current_user.center_id:
@@ -290,76 +638,110 @@ async def get_credit_balances_by_user_center(
             )
         
         # Get center name from center_id
-        center = db.query(models.Center).filter(models.Center.id == current_user.center_id).first()
+        center = get_cached_center(db, current_user.center_id)
         if not center:
             raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND,
                 detail="Center not found"
             )
         
-        # Get credit balances for this center
-        query = db.query(models.CreditBalance).filter(
-            models.CreditBalance.center.ilike(f"%{center.name}%")
-        )
-        
-        # SQL Server requires ORDER BY for OFFSET/LIMIT
-        query = query.order_by(models.CreditBalance.id).offset(skip)
+        # The same URL returns different rows for users of different centers
+        snapshot = credit_balance_store.snapshot(db)
+        version = snapshot.version if snapshot is not None else get_table_version(db, CREDIT_BALANCES)
+        etag = request_etag(request, version, center.id)
+        if etag_matches(request, etag):
+            return not_modified(etag)
         
-        # If limit is provided, apply it; otherwise return all records
-        if limit is not None:
-            print(f"API: Returning {limit} records for user's center '{center.name}' (limit provided)")
-            return query.limit(limit).all()
+        # Get credit balances for this center
+        if snapshot is not None:
+            positions, next_cursor = snapshot.page(snapshot.filter(center_id=center.id), cursor, skip, limit)
+            records = snapshot.rows(positions, selected)
         else:
-            print(f"API: Returning ALL records for user's center '{center.name}' (no limit provided)")
-            return query.all()
+            query = db.query(*credit_balance_columns(selected)).filter(
+                models.CreditBalance.center_id == center.id
+            )
+            records, next_cursor = paginate(query, models.CreditBalance.id, cursor, skip, limit)
+        print(f"API: Returning {len(records)} records for user's center '{center.name}'")
+        return rows_response(records, selected, headers=cache_headers(etag, next_page_headers(request, next_cursor)))
     except OperationalError as e:
         print(f"Database connection error: {e}")
         return []
 
+@app.get("/credit-balances/by-user-center/stream")
+async def stream_credit_balances_by_user_center(current_user: models.User = Depends(get_streaming_user)):
+    """Server-Sent Events with every change to the current user's center.
+    
+    Events are `upsert` (with the record), `delete` and `resync` (reload the
+    list); `: keepalive` comments keep idle connections open. Subscribe
+    first, then load /credit-balances/by-user-center once, so no change falls
+    in between.
+    """
+    if not current_user.center_id:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="User is not associated with any center"
+        )
+    subscription = change_bus.subscribe(current_user.center_id)
+    return StreamingResponse(
+        change_bus.stream(subscription),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
 # User management endpoints
 @app.get("/users/me", response_model=schemas.User)
 async def read_users_me(current_user: models.User = Depends(get_current_user)):
     return current_user
 
+@app.get("/cache/stats", dependencies=[Depends(require_admin)])
+async def get_cache_stats():
+    """Hit/miss counters for the user and center caches (admins only)."""
+    return cache_stats()
+
 @app.get("/centers", response_model=List[schemas.Center])
-async def get_centers(db: Session = Depends(get_db)):
-    """Get all centers."""
-    return db.query(models.Center).filter(models.Center.is_active == True).all()
+def get_centers(request: Request, response: Response, db: Session = Depends(get_db)):
+    """Get all centers; If-None-Match is answered from an aggregate query without loading them."""
+    etag = centers_etag(db)
+    if etag_matches(request, etag):
+        return not_modified(etag)
+    centers = db.query(models.Center).filter(models.Center.is_active == True).all()
+    record_rows(len(centers))
+    response.headers.update(cache_headers(etag))
+    return centers
 
 # Voucher-based API endpoint
 @app.post("/credit-balances/by-voucher", response_model=List[schemas.CreditBalance])
-async def get_credit_balances_by_voucher(
+def get_credit_balances_by_voucher(
     request: schemas.VoucherSearchRequest,
+    http_request: Request,
+    fields: Optional[str] = None,
     db: Session = Depends(get_db)
 ):
     """Get all credit balance records for a specific voucher ID and log the API usage."""
     from sqlalchemy.exc import OperationalError
-    from fastapi import Request
     
+    selected = parse_fields(fields)
     try:
         # Search for records with the given voucher ID
-        query = db.query(models.CreditBalance).filter(
-            models.CreditBalance.voucher_number.ilike(f"%{request.voucher_id}%")
-        )
-        
-        # Get all matching records
-        records = query.order_by(models.CreditBalance.id).all()
+        snapshot = credit_balance_store.snapshot(db)
+        if snapshot is not None:
+            records = snapshot.rows(snapshot.voucher_matches(request.voucher_id, request.match), selected)
+        else:
+            query = filter_by_voucher(db.query(*credit_balance_columns(selected)), request.voucher_id, request.match)
+            records = query.order_by(models.CreditBalance.id).all()
+        record_rows(len(records))
         
-        # Log the API usage
-        api_log = models.ApiLog(
+        # Log the API usage; written in bulk by the background audit log writer
+        audit_log_writer.submit(build_log_entry(
+            http_request,
             user_name=request.user_name,
             voucher_id=request.voucher_id,
-            api_endpoint="/credit-balances/by-voucher",
-            ip_address=None,  # Could be extracted from request if needed
-            user_agent=None   # Could be extracted from request if needed
-        )
-        
-        db.add(api_log)
-        db.commit()
+            api_endpoint="/credit-balances/by-voucher"
+        ))
         
         print(f"API: User '{request.user_name}' searched for voucher '{request.voucher_id}' and found {len(records)} records")
         
-        return records
+        return rows_response(records, selected)
         
     except OperationalError as e:
         print(f"Database connection error: {e}")
@@ -372,8 +754,62 @@ async def get_credit_balances_by_voucher(
             detail=f"Error processing voucher search: {str(e)}"
         )
 
+@app.post("/credit-balances/by-voucher/batch", response_model=schemas.VoucherBatchResponse)
+def get_credit_balances_by_vouchers(
+    request: schemas.VoucherBatchRequest,
+    http_request: Request,
+    fields: Optional[str] = None,
+    db: Session = Depends(get_db)
+):
+    """Resolve up to MAX_VOUCHER_BATCH_SIZE vouchers (exact match) and log every lookup."""
+    if len(request.voucher_ids) > settings.MAX_VOUCHER_BATCH_SIZE:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Batch has {len(request.voucher_ids)} vouchers; the limit is {settings.MAX_VOUCHER_BATCH_SIZE}"
+        )
+    
+    selected = parse_fields(fields)
+    # Distinct normalized keys of the requested ids
+    requested = list(dict.fromkeys(models.normalize_voucher(voucher_id) for voucher_id in request.voucher_ids))
+    
+    by_key = {}
+    snapshot = credit_balance_store.snapshot(db)
+    if snapshot is not None:
+        for key in requested:
+            positions = snapshot.voucher_positions.get(key)
+            if positions:
+                by_key[key] = [dict(zip(selected, record)) for record in snapshot.rows(positions, selected)]
+    else:
+        columns = credit_balance_columns(selected) + [models.CreditBalance.voucher_key]
+        for keys in chunked(requested):
+            query = filter_by_voucher_keys(db.query(*columns), keys).order_by(models.CreditBalance.id)
+            for record in query:
+                by_key.setdefault(record.voucher_key, []).append(dict(zip(selected, record)))
+    
+    # In request order; ids that normalize to the same key share its records
+    results = {
+        voucher_id: by_key.get(models.normalize_voucher(voucher_id), [])
+        for voucher_id in dict.fromkeys(request.voucher_ids)
+    }
+    missing = [voucher_id for voucher_id, records in results.items() if not records]
+    record_rows(sum(len(records) for records in by_key.values()))
+    
+    # One bulk insert for the whole batch instead of one queued entry per voucher
+    audit_log_writer.write_many([
+        build_log_entry(
+            http_request,
+            user_name=request.user_name,
+            voucher_id=voucher_id,
+            api_endpoint="/credit-balances/by-voucher/batch"
+        )
+        for voucher_id in results
+    ])
+    
+    print(f"API: User '{request.user_name}' resolved {len(results)} vouchers, {len(missing)} not found")
+    return FastJSONResponse({"results": results, "missing": missing})
+
 @app.get("/api-logs", response_model=List[schemas.ApiLog])
-async def get_api_logs(
+def get_api_logs(
     skip: int = 0,
     limit: Optional[int] = 100,
     db: Session = Depends(get_db)
@@ -386,15 +822,16 @@ async def get_api_logs(
         query = query.offset(skip)
         
         if limit is not None:
-            return query.limit(limit).all()
-        else:
-            return query.all()
+            query = query.limit(limit)
+        logs = query.all()
+        record_rows(len(logs))
+        return logs
     except OperationalError as e:
         print(f"Database connection error: {e}")
         return []
 
 @app.get("/api-logs/by-user/{user_name}", response_model=List[schemas.ApiLog])
-async def get_api_logs_by_user(
+def get_api_logs_by_user(
     user_name: str,
     skip: int = 0,
     limit: Optional[int] = 100,
@@ -411,9 +848,10 @@ async def get_api_logs_by_user(
         query = query.offset(skip)
         
         if limit is not None:
-            return query.limit(limit).all()
-        else:
-            return query.all()
+            query = query.limit(limit)
+        logs = query.all()
+        record_rows(len(logs))
+        return logs
     except OperationalError as e:
         print(f"Database connection error: {e}")
         return []
@@ -0,0 +1,273 @@
+"""Request and connection pool metrics, served from /metrics in the Prometheus text format.
+
+`MetricsMiddleware` times every HTTP request and records its status, response
+size, the rows it returned and the statements and time it spent in the
+database. Row counts and database time are collected through a per-request `RequestStats` object
+held in a context variable; FastAPI copies the context into its threadpool, so
+route handlers and SQLAlchemy cursor events add to the same object. All
+observations for one request are applied under a single lock acquisition.
+"""
+import bisect
+import contextvars
+import threading
+import time
+from typing import Dict, Optional, Sequence, Tuple
+
+from sqlalchemy import event
+
+from slow_queries import SlowQueryLog, slow_query_log
+
+METRICS_MEDIA_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# Optional per-response query count and database time (QUERY_STATS_HEADER)
+DB_QUERIES_HEADER = "X-DB-Queries"
+DB_TIME_HEADER = "X-DB-Time-Ms"
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304, 16777216, 67108864)
+ROW_BUCKETS = (0, 1, 10, 50, 100, 500, 1000, 5000, 10000, 100000, 1000000)
+QUERY_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+
+# Requests that match no route share one label so unknown paths cannot blow up cardinality
+UNMATCHED_ROUTE = "unmatched"
+
+# (metric name, help text, buckets) for each per-route histogram
+REQUEST_HISTOGRAMS = (
+    ("http_request_duration_seconds", "Time to serve the request, including streaming the body", LATENCY_BUCKETS),
+    ("http_response_size_bytes", "Response body size", SIZE_BUCKETS),
+    ("http_response_rows", "Records returned by the request", ROW_BUCKETS),
+    ("http_request_db_seconds", "Time spent executing SQL statements for the request", LATENCY_BUCKETS),
+    ("http_request_db_queries", "SQL statements executed for the request", QUERY_BUCKETS),
+)
+
+# (metric name, help text, pool method) for each pool gauge
+POOL_GAUGES = (
+    ("db_pool_size", "Configured number of pooled connections", "size"),
+    ("db_pool_checked_out", "Connections currently checked out", "checkedout"),
+    ("db_pool_checked_in", "Idle connections in the pool", "checkedin"),
+    ("db_pool_overflow", "Connections open beyond pool_size (negative while the pool is filling)", "overflow"),
+)
+
+
+class Histogram:
+    """Fixed-bucket histogram; callers hold the registry lock."""
+
+    __slots__ = ("buckets", "counts", "sum", "count")
+
+    def __init__(self, buckets: Sequence[float]):
+        self.buckets = buckets
+        # One count per bucket plus +Inf
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def render(self, name: str, labels: str) -> list:
+        separator = "," if labels else ""
+        lines, cumulative = [], 0
+        for bound, count in zip(self.buckets, self.counts):
+            cumulative += count
+            lines.append(f'{name}_bucket{{{labels}{separator}le="{bound}"}} {cumulative}')
+        lines.append(f'{name}_bucket{{{labels}{separator}le="+Inf"}} {self.count}')
+        lines.append(f"{name}_sum{{{labels}}} {self.sum}")
+        lines.append(f"{name}_count{{{labels}}} {self.count}")
+        return lines
+
+
+class RequestStats:
+    """Per-request counters filled in while the request is being served."""
+
+    __slots__ = ("scope", "rows", "db_seconds", "db_queries", "response_bytes")
+
+    def __init__(self, scope: Optional[dict] = None):
+        self.scope = scope
+        self.rows = 0
+        self.db_seconds = 0.0
+        self.db_queries = 0
+        self.response_bytes = 0
+
+    @property
+    def route(self) -> str:
+        # The router stores the matched route in the scope
+        route = self.scope.get("route") if self.scope else None
+        return getattr(route, "path", None) or UNMATCHED_ROUTE
+
+
+_current_request: contextvars.ContextVar = contextvars.ContextVar("request_stats", default=None)
+
+
+def current_request_stats() -> Optional[RequestStats]:
+    """Stats of the request being served, or None outside a request (scripts, background tasks)."""
+    return _current_request.get()
+
+
+def record_rows(count: int):
+    """Count `count` records towards the current request's rows histogram."""
+    stats = _current_request.get()
+    if stats is not None:
+        stats.rows += count
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._requests: Dict[Tuple[str, str, int], int] = {}
+        self._histograms: Dict[Tuple[str, str], Tuple[Histogram, ...]] = {}
+        self._pool_wait = Histogram(LATENCY_BUCKETS)
+
+    def observe_request(self, method: str, route: str, status_code: int, duration: float, stats: RequestStats):
+        key = (method, route)
+        with self._lock:
+            histograms = self._histograms.get(key)
+            if histograms is None:
+                histograms = self._histograms[key] = tuple(
+                    Histogram(buckets) for _, _, buckets in REQUEST_HISTOGRAMS
+                )
+            counter_key = (method, route, status_code)
+            self._requests[counter_key] = self._requests.get(counter_key, 0) + 1
+            histograms[0].observe(duration)
+            histograms[1].observe(stats.response_bytes)
+            histograms[2].observe(stats.rows)
+            histograms[3].observe(stats.db_seconds)
+            histograms[4].observe(stats.db_queries)
+
+    def observe_pool_wait(self, seconds: float):
+        with self._lock:
+            self._pool_wait.observe(seconds)
+
+    def render(self, engine=None) -> str:
+        """All metrics in the Prometheus text exposition format."""
+        with self._lock:
+            requests = sorted(self._requests.items())
+            histograms = sorted(self._histograms.items())
+            pool_wait = self._pool_wait.render("db_pool_checkout_wait_seconds", "")
+
+        lines = [
+            "# HELP http_requests_total Requests served, by route and status code",
+            "# TYPE http_requests_total counter",
+        ]
+        for (method, route, status_code), count in requests:
+            lines.append(
+                f'http_requests_total{{method="{method}",route="{_escape(route)}",status="{status_code}"}} {count}'
+            )
+        for index, (name, help_text, _) in enumerate(REQUEST_HISTOGRAMS):
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} histogram")
+            for (method, route), route_histograms in histograms:
+                lines.extend(route_histograms[index].render(name, f'method="{method}",route="{_escape(route)}"'))
+
+        lines.append("# HELP db_pool_checkout_wait_seconds Time to obtain a connection from the pool")
+        lines.append("# TYPE db_pool_checkout_wait_seconds histogram")
+        lines.extend(pool_wait)
+        if engine is not None:
+            # Not every pool class has these (e.g. SQLite's StaticPool)
+            for name, help_text, method in POOL_GAUGES:
+                gauge = getattr(engine.pool, method, None)
+                if gauge is None:
+                    continue
+                lines.append(f"# HELP {name} {help_text}")
+                lines.append(f"# TYPE {name} gauge")
+                lines.append(f"{name} {gauge()}")
+        return "\n".join(lines) + "\n"
+
+
+metrics_registry = MetricsRegistry()
+
+
+class MetricsMiddleware:
+    """Pure ASGI middleware, so streamed responses pass through without buffering.
+
+    With `query_stats_header` set, every response carries the number of SQL
+    statements and the database time spent before its headers were sent.
+    """
+
+    def __init__(self, app, registry: MetricsRegistry = metrics_registry, query_stats_header: bool = False):
+        self.app = app
+        self.registry = registry
+        self.query_stats_header = query_stats_header
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        stats = RequestStats(scope)
+        token = _current_request.set(stats)
+        status_code = 500
+        started = time.perf_counter()
+
+        async def send_with_metrics(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+                if self.query_stats_header:
+                    message = {**message, "headers": [
+                        *message.get("headers", []),
+                        (DB_QUERIES_HEADER.encode(), str(stats.db_queries).encode()),
+                        (DB_TIME_HEADER.encode(), f"{stats.db_seconds * 1000:.1f}".encode()),
+                    ]}
+            elif message["type"] == "http.response.body":
+                stats.response_bytes += len(message.get("body", b""))
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_metrics)
+        finally:
+            duration = time.perf_counter() - started
+            _current_request.reset(token)
+            self.registry.observe_request(scope["method"], stats.route, status_code, duration, stats)
+
+
+def instrument_engine(
+    engine,
+    registry: MetricsRegistry = metrics_registry,
+    slow_queries: SlowQueryLog = slow_query_log,
+):
+    """Attribute SQL statements and their time to the current request and time pool checkouts.
+
+    Statements slower than the slow query threshold are also handed to
+    `slow_queries` together with the route that issued them.
+
+    Checkouts are timed around `engine.raw_connection`, which every new
+    Connection goes through, so the measurement covers waiting for a free
+    connection, pre-ping and opening new connections.
+    """
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def _start_query_timer(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("query_started_at", []).append(time.perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _stop_query_timer(conn, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - conn.info["query_started_at"].pop()
+        stats = _current_request.get()
+        if stats is not None:
+            stats.db_seconds += elapsed
+            stats.db_queries += 1
+        if elapsed >= slow_queries.threshold:
+            slow_queries.record(statement, parameters, executemany, elapsed, stats.route if stats else None)
+
+    @event.listens_for(engine, "handle_error")
+    def _drop_query_timer(exception_context):
+        started = exception_context.connection.info.get("query_started_at") if exception_context.connection else None
+        if started:
+            started.pop()
+
+    raw_connection = engine.raw_connection
+
+    def timed_raw_connection(*args, **kwargs):
+        started = time.perf_counter()
+        try:
+            return raw_connection(*args, **kwargs)
+        finally:
+            registry.observe_pool_wait(time.perf_counter() - started)
+
+    engine.raw_connection = timed_raw_connection
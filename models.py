@@ -1,7 +1,16 @@
-from sqlalchemy import Column, Integer, String, Float, DateTime, Text, Boolean, ForeignKey
+from sqlalchemy import Column, Computed, Integer, String, Float, DateTime, Text, Boolean, ForeignKey
 from sqlalchemy.sql import func
-from sqlalchemy.orm import relationship
+from sqlalchemy.orm import relationship, validates
 from database import Base
+from vouchers import generate_voucher_number
+
+
+def normalize_voucher(voucher):
+    """Canonical form used for indexed voucher lookups (trimmed, upper-cased)."""
+    if voucher is None:
+        return None
+    return str(voucher).strip().upper()
+
 
 class CreditBalance(Base):
     """Credit Balance model for storing client credit balance data."""
@@ -25,6 +34,8 @@ class CreditBalance(Base):
     
     # Center and category information
     center = Column(String(50), nullable=True)
+    # Resolved from `center` by centers.center_resolver; center-scoped queries filter on this
+    center_id = Column(Integer, ForeignKey("delhi.centers.id"), nullable=True, index=True)
     final_bucket = Column(String(100), nullable=True)
     
     # Session information
@@ -34,50 +45,48 @@ class CreditBalance(Base):
     
     # Voucher information
     voucher_number = Column(String(20), nullable=True, index=True)
+    # Normalized copy of voucher_number for exact/prefix index seeks
+    voucher_key = Column(String(20), nullable=True, index=True)
     
     # Audit fields
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     updated_at = Column(DateTime(timezone=True), onupdate=func.now())
-    
-    def generate_voucher_number(self):
-        """Generate voucher number based on center, client code, and phone number."""
-        try:
-            # Get center prefix
-            if self.center:
-                center_upper = self.center.upper()
-                if 'GK' in center_upper or 'GREATER KAILASH' in center_upper:
-                    prefix = 'GK'
-                elif 'PV' in center_upper or 'PREET' in center_upper:
-                    prefix = 'PV'
-                elif 'PUNJABI' in center_upper or 'BAGH' in center_upper:
-                    prefix = 'PB'
-                elif 'PITAMPURA' in center_upper:
-                    prefix = 'PT'
-                else:
-                    prefix = 'XX'  # Default prefix for unknown centers
-            else:
-                prefix = 'XX'
-            
-            # Get first 3 digits of client code
-            client_digits = self.client_code[:3] if self.client_code else '000'
-            
-            # Get middle 4 digits of phone number
-            phone_clean = str(self.phone_no).replace(' ', '').replace('-', '') if self.phone_no else '0000000000'
-            if len(phone_clean) >= 7:
-                middle_digits = phone_clean[3:7]  # Middle 4 digits
-            else:
-                middle_digits = phone_clean.zfill(4)[:4]  # Pad with zeros if too short
-            
-            voucher_number = f"{prefix}{client_digits}{middle_digits}"
-            return voucher_number
-        except Exception as e:
-            from datetime import datetime
-            return f"ERR{datetime.now().strftime('%Y%m%d%H%M%S')}"
+    # Last change time, kept by the database; the change feed seeks and orders on its index
+    changed_at = Column(
+        DateTime(timezone=True), Computed("COALESCE(updated_at, created_at)", persisted=True), index=True
+    )
+    
+    @validates('voucher_number')
+    def _sync_voucher_key(self, key, value):
+        self.voucher_key = normalize_voucher(value)
+        return value
+    
+    def generate_voucher_number(self, center_code=None):
+        """Generate voucher number based on center, client code, and phone number.
+        
+        `center_code` is the code of the resolved center; without it the
+        prefix is guessed from the center text.
+        """
+        return generate_voucher_number(self.client_code, self.phone_no, self.center, center_code)
     
     def __repr__(self):
         return f"<CreditBalance(id={self.id}, client_code='{self.client_code}', client_name='{self.client_name}')>"
 
 
+class CreditBalanceTombstone(Base):
+    """A deleted credit balance, kept so the change feed can pass the delete on to sync clients."""
+    
+    __tablename__ = "credit_balance_tombstones"
+    
+    # Feed position of the delete
+    id = Column(Integer, primary_key=True, index=True)
+    credit_balance_id = Column(Integer, nullable=False, index=True)
+    deleted_at = Column(DateTime(timezone=True), server_default=func.now(), index=True)
+    
+    def __repr__(self):
+        return f"<CreditBalanceTombstone(id={self.id}, credit_balance_id={self.credit_balance_id})>"
+
+
 class Center(Base):
     """Center model for storing clinic center information."""
     
@@ -143,3 +152,17 @@ class ApiLog(Base):
     
     def __repr__(self):
         return f"<ApiLog(id={self.id}, user_name='{self.user_name}', voucher_id='{self.voucher_id}', timestamp='{self.request_timestamp}')>"
+
+
+class TableVersion(Base):
+    """Per-table change counter bumped by every writer, used to invalidate in-process caches."""
+    
+    __tablename__ = "table_versions"
+    __table_args__ = {'schema': 'delhi'}
+    
+    table_name = Column(String(50), primary_key=True)
+    version = Column(Integer, nullable=False, default=0)
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+    
+    def __repr__(self):
+        return f"<TableVersion(table_name='{self.table_name}', version={self.version})>"
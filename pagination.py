@@ -0,0 +1,72 @@
+import base64
+import json
+from typing import Optional
+
+from fastapi import HTTPException, Request, status
+
+from config import settings
+from metrics import record_rows
+
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+LINK_HEADER = "Link"
+
+
+def encode_cursor(after_id: int) -> str:
+    """Encode the last seen primary key into an opaque cursor string."""
+    raw = json.dumps({"after_id": after_id}, separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> int:
+    """Decode a cursor produced by encode_cursor back into the last seen id."""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        after_id = json.loads(base64.urlsafe_b64decode(padded.encode()))["after_id"]
+        if not isinstance(after_id, int):
+            raise ValueError("after_id must be an integer")
+        return after_id
+    except (ValueError, KeyError, TypeError):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Invalid pagination cursor"
+        )
+
+
+def page_size(limit: Optional[int]) -> int:
+    """Clamp the requested limit to the server-enforced maximum page size."""
+    if limit is None or limit <= 0:
+        return settings.MAX_PAGE_SIZE
+    return min(limit, settings.MAX_PAGE_SIZE)
+
+
+def next_page_headers(request: Request, next_cursor: Optional[str]) -> Optional[dict]:
+    """X-Next-Cursor and an RFC 8288 `Link: rel="next"` header for the following page, or None on the last page."""
+    if next_cursor is None:
+        return None
+    next_url = request.url.remove_query_params("skip").include_query_params(cursor=next_cursor)
+    return {NEXT_CURSOR_HEADER: next_cursor, LINK_HEADER: f'<{next_url}>; rel="next"'}
+
+
+def paginate(query, id_column, cursor: Optional[str] = None, skip: int = 0, limit: Optional[int] = None):
+    """Fetch one page of `query` ordered by `id_column`.
+
+    With a cursor the page starts after the encoded id (keyset seek on the
+    primary key index); without one the legacy `skip` offset is honoured.
+    Pages never exceed MAX_PAGE_SIZE, and an omitted limit gets a full page.
+    Returns (rows, next_cursor) where next_cursor is None on the last page.
+    """
+    query = query.order_by(id_column)
+    size = page_size(limit)
+    if cursor:
+        query = query.filter(id_column > decode_cursor(cursor))
+    elif skip:
+        query = query.offset(skip)
+
+    # Fetch one extra row to know whether another page exists
+    rows = query.limit(size + 1).all()
+    if len(rows) > size:
+        rows = rows[:size]
+        record_rows(len(rows))
+        return rows, encode_cursor(rows[-1].id)
+    record_rows(len(rows))
+    return rows, None
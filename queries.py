@@ -0,0 +1,58 @@
+from typing import Iterator, Optional, Sequence
+
+import models
+
+VOUCHER_MATCH_MODES = ("exact", "prefix", "contains")
+
+# Keeps IN (...) lists well under SQL Server's 2100 parameter limit
+IN_CLAUSE_CHUNK_SIZE = 1000
+
+
+def chunked(values: Sequence, size: int = IN_CLAUSE_CHUNK_SIZE) -> Iterator[Sequence]:
+    """Consecutive slices of `values` with at most `size` items, for chunked IN (...) queries."""
+    for start in range(0, len(values), size):
+        yield values[start:start + size]
+
+
+def filter_credit_balances(
+    query,
+    client_code: Optional[str] = None,
+    client_name: Optional[str] = None,
+    center: Optional[str] = None,
+):
+    """Apply the standard client_code/client_name/center filters to a credit balance query."""
+    if client_code:
+        query = query.filter(models.CreditBalance.client_code.ilike(f"%{client_code}%"))
+    if client_name:
+        query = query.filter(models.CreditBalance.client_name.ilike(f"%{client_name}%"))
+    if center:
+        query = query.filter(models.CreditBalance.center.ilike(f"%{center}%"))
+    return query
+
+
+def filter_by_voucher_keys(query, voucher_keys: Sequence[str]):
+    """Exact matches for many normalized vouchers at once (an IN seek on the voucher_key index)."""
+    return query.filter(models.CreditBalance.voucher_key.in_(voucher_keys))
+
+
+def _escape_like(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+
+def filter_by_voucher(query, voucher_id: str, match: str = "exact"):
+    """Filter credit balances by voucher.
+
+    `exact` and `prefix` compare against the indexed, normalized voucher_key
+    column so the database can seek; `contains` is the old unanchored
+    substring scan and must be requested explicitly.
+    """
+    voucher_key = models.normalize_voucher(voucher_id)
+    if match == "exact":
+        return query.filter(models.CreditBalance.voucher_key == voucher_key)
+    if match == "prefix":
+        return query.filter(
+            models.CreditBalance.voucher_key.like(f"{_escape_like(voucher_key)}%", escape="\\")
+        )
+    if match == "contains":
+        return query.filter(models.CreditBalance.voucher_number.ilike(f"%{voucher_id.strip()}%"))
+    raise ValueError(f"Unknown voucher match mode '{match}'")
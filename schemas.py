@@ -1,5 +1,5 @@
 from pydantic import BaseModel
-from typing import Optional
+from typing import Dict, List, Optional, Literal
 from datetime import datetime
 
 class CreditBalanceBase(BaseModel):
@@ -39,14 +39,47 @@ class CreditBalanceUpdate(BaseModel):
     balance_sessions: Optional[float] = None
     voucher_number: Optional[str] = None
 
+class CreditBalanceBatchUpdate(CreditBalanceUpdate):
+    id: int
+
+class CreditBalanceBatchRequest(BaseModel):
+    create: List[CreditBalanceCreate] = []
+    update: List[CreditBalanceBatchUpdate] = []
+    delete: List[int] = []
+    # All-or-nothing by default; with atomic=False the valid operations are applied and the rest reported
+    atomic: bool = True
+
+class BatchItemResult(BaseModel):
+    op: Literal["create", "update", "delete"]
+    index: int
+    id: Optional[int] = None
+    status: Literal["ok", "error", "skipped"]
+    error: Optional[str] = None
+
+class CreditBalanceBatchResponse(BaseModel):
+    committed: bool
+    created: int = 0
+    updated: int = 0
+    deleted: int = 0
+    results: List[BatchItemResult]
+
 class CreditBalance(CreditBalanceBase):
     id: int
+    center_id: Optional[int] = None
     created_at: datetime
     updated_at: Optional[datetime] = None
     
     class Config:
         from_attributes = True
 
+class CreditBalanceChanges(BaseModel):
+    changes: List[CreditBalance]
+    # Ids of credit balances deleted since the previous watermark
+    deleted: List[int]
+    # Pass back as `since` on the next poll
+    watermark: str
+    has_more: bool
+
 
 # Center Schemas
 class CenterBase(BaseModel):
@@ -145,3 +178,14 @@ class ApiLog(ApiLogBase):
 class VoucherSearchRequest(BaseModel):
     voucher_id: str
     user_name: str
+    # exact/prefix use the voucher index; contains is a full substring scan
+    match: Literal["exact", "prefix", "contains"] = "exact"
+
+class VoucherBatchRequest(BaseModel):
+    voucher_ids: List[str]
+    user_name: str
+
+class VoucherBatchResponse(BaseModel):
+    # Every requested voucher id, mapped to its records (empty for misses)
+    results: Dict[str, List[CreditBalance]]
+    missing: List[str]
@@ -0,0 +1,284 @@
+"""In-process trigram index for client name / code / phone search.
+
+The index is built from the credit_balances table and answers
+case-insensitive substring and prefix queries without touching the
+database. Posting lists are sorted NumPy arrays, so a query with three or
+more characters only has to verify the rows that contain all of its
+trigrams. Queries of one or two characters have no trigram and always match
+like mode='prefix' (start of the value or of a word); they are answered from
+a sorted list of every word start of each field.
+
+Writes made by this process go into a small overlay. Writes made elsewhere
+are noticed through the table version and read into the overlay from the
+change feed. The index is rebuilt only once the overlay outgrows
+`max_overlay`, by one request while the others keep searching the current
+index.
+"""
+import bisect
+import re
+import threading
+import time
+from collections import defaultdict
+from datetime import datetime
+from types import SimpleNamespace
+from typing import Dict, List, Optional
+
+import numpy as np
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+import models
+from change_feed import changes_page, current_watermark
+from config import settings
+from table_versions import CREDIT_BALANCES, get_table_version
+
+SEARCH_FIELDS = ('client_name', 'client_code', 'phone_no')
+SEARCH_MODES = ('substring', 'prefix')
+# Shorter terms have no trigram and match in 'prefix' mode only
+MIN_SUBSTRING_LENGTH = 3
+# Read from the change feed to bring the overlay up to date
+FEED_FIELDS = ('id',) + SEARCH_FIELDS + ('created_at', 'updated_at')
+
+# Lower is better: whole value, start of value, start of a word, anywhere
+RANK_EXACT, RANK_PREFIX, RANK_WORD_PREFIX, RANK_SUBSTRING = range(4)
+
+_NON_DIGITS = re.compile(r'\D')
+_EMPTY = np.empty(0, dtype=np.int32)
+
+
+def normalize(field: str, value) -> str:
+    if value is None:
+        return ''
+    if field == 'phone_no':
+        return _NON_DIGITS.sub('', str(value))
+    return str(value).strip().lower()
+
+
+def trigrams(value: str) -> set:
+    return {value[i:i + 3] for i in range(len(value) - 2)}
+
+
+def word_starts(value: str) -> list:
+    """`value` and every suffix of it that starts a word, for prefix lookups of short terms."""
+    return [value] + [value[i + 1:] for i, char in enumerate(value) if char == ' ' and value[i + 1:i + 2] != ' ']
+
+
+def effective_mode(term: str, mode: str) -> str:
+    return mode if len(term) >= MIN_SUBSTRING_LENGTH else 'prefix'
+
+
+def _changed_at(record) -> Optional[datetime]:
+    """Last change time of a record (any object with its attributes), for ordering overlay updates."""
+    value = getattr(record, 'updated_at', None) or getattr(record, 'created_at', None)
+    return value.replace(tzinfo=None) if value is not None else None
+
+
+def match_rank(value: str, query: str, mode: str) -> Optional[int]:
+    """Rank of `query` inside `value`, or None if it does not match in this mode."""
+    position = value.find(query)
+    if position < 0:
+        return None
+    if value == query:
+        return RANK_EXACT
+    if position == 0:
+        return RANK_PREFIX
+    if f' {query}' in value:
+        return RANK_WORD_PREFIX
+    return None if mode == 'prefix' else RANK_SUBSTRING
+
+
+class SearchIndex:
+    def __init__(self, check_interval: float = 30.0, max_overlay: int = 5000):
+        self.check_interval = check_interval
+        self.max_overlay = max_overlay
+        self._lock = threading.Lock()
+        # Held while the index is rebuilt or caught up, so only one request does it
+        self._refresh_lock = threading.Lock()
+        self._version = None
+        self._watermark: Optional[str] = None
+        self._checked_at = 0.0
+        self._ids = _EMPTY
+        self._values: Dict[str, List[str]] = {field: [] for field in SEARCH_FIELDS}
+        self._postings: Dict[str, Dict[str, np.ndarray]] = {field: {} for field in SEARCH_FIELDS}
+        # Per field: (word starts in sorted order, their row positions) for short queries
+        self._sorted: Dict[str, tuple] = {field: ([], []) for field in SEARCH_FIELDS}
+        # Rows written since the last build: id -> (last change time, normalized values or None if deleted)
+        self._overlay: Dict[int, tuple] = {}
+
+    def _is_fresh(self) -> bool:
+        return (
+            self._version is not None
+            and len(self._overlay) <= self.max_overlay
+            and time.monotonic() - self._checked_at <= self.check_interval
+        )
+
+    def ensure_fresh(self, db: Session):
+        if self._is_fresh():
+            return
+        # Without an index the request has to wait for one; otherwise it searches the current one
+        if not self._refresh_lock.acquire(blocking=self._version is None):
+            return
+        try:
+            if self._is_fresh():
+                return  # Refreshed while this request waited
+            if self._version is None or len(self._overlay) > self.max_overlay:
+                self.rebuild(db)
+            elif get_table_version(db, CREDIT_BALANCES) != self._version:
+                self._catch_up(db)
+            else:
+                self._checked_at = time.monotonic()
+        finally:
+            self._refresh_lock.release()
+
+    def rebuild(self, db: Session):
+        # Taken before the rows are read, so the feed replays anything that commits meanwhile
+        version = get_table_version(db, CREDIT_BALANCES)
+        watermark = current_watermark(db)
+        rows = db.execute(
+            select(models.CreditBalance.id, *(getattr(models.CreditBalance, field) for field in SEARCH_FIELDS))
+            .order_by(models.CreditBalance.id)
+        ).all()
+
+        ids = np.fromiter((row[0] for row in rows), dtype=np.int64, count=len(rows))
+        values, postings, sorted_fields = {}, {}, {}
+        for offset, field in enumerate(SEARCH_FIELDS, start=1):
+            column = [normalize(field, row[offset]) for row in rows]
+            grams = defaultdict(list)
+            starts = []
+            for position, value in enumerate(column):
+                for gram in trigrams(value):
+                    grams[gram].append(position)
+                starts.extend((start, position) for start in word_starts(value))
+            starts.sort()
+            values[field] = column
+            postings[field] = {gram: np.array(positions, dtype=np.int32) for gram, positions in grams.items()}
+            sorted_fields[field] = ([start for start, _ in starts], [position for _, position in starts])
+
+        with self._lock:
+            self._ids, self._values, self._postings, self._sorted = ids, values, postings, sorted_fields
+            self._overlay = {}
+            self._version = version
+            self._watermark = watermark
+            self._checked_at = time.monotonic()
+
+    def _catch_up(self, db: Session):
+        """Read the writes made by other processes from the change feed into the overlay."""
+        version = get_table_version(db, CREDIT_BALANCES)
+        changes, watermark = [], self._watermark
+        while True:
+            page = changes_page(db, since=watermark, fields=FEED_FIELDS)
+            changes.extend(
+                (record['id'], SimpleNamespace(**record)) for record in page['changes']
+            )
+            changes.extend((credit_balance_id, None) for credit_balance_id in page['deleted'])
+            watermark = page['watermark']
+            if len(self._overlay) + len(changes) > self.max_overlay:
+                # Cheaper to start over (e.g. after a full re-import)
+                self.rebuild(db)
+                return
+            if not page['has_more']:
+                break
+
+        with self._lock:
+            self._apply(changes)
+            # Writes recorded by this process meanwhile may already have moved the version on
+            self._version = max(self._version, version)
+            self._watermark = watermark
+            self._checked_at = time.monotonic()
+
+    def _apply(self, changes: List[tuple]):
+        """Put (id, record or None) changes into the overlay; call with the lock held.
+
+        A change older than the one already there (the feed can be behind
+        this process's own writes) is ignored, and deletes are final.
+        """
+        for credit_balance_id, credit_balance in changes:
+            if credit_balance is None:
+                self._overlay[credit_balance_id] = (None, None)
+                continue
+            changed_at = _changed_at(credit_balance)
+            if credit_balance_id in self._overlay:
+                current_changed_at, current = self._overlay[credit_balance_id]
+                if current is None or (
+                    current_changed_at is not None and changed_at is not None and changed_at < current_changed_at
+                ):
+                    continue
+            self._overlay[credit_balance_id] = (changed_at, {
+                field: normalize(field, getattr(credit_balance, field)) for field in SEARCH_FIELDS
+            })
+
+    def record_change(self, credit_balance_id: int, credit_balance, version: int):
+        """Apply one committed write (credit_balance=None for a delete) to the overlay."""
+        self.record_changes([(credit_balance_id, credit_balance)], version)
+
+    def record_changes(self, changes: List[tuple], version: int):
+        """Apply several (id, record or None) writes committed under a single table version bump."""
+        with self._lock:
+            if self._version is None:
+                return
+            self._apply(changes)
+            if version == self._version + 1:
+                self._version = version
+            else:
+                # Someone else wrote in between: catch up from the change feed on the next search
+                self._checked_at = 0.0
+
+    def search(self, query: str, fields=SEARCH_FIELDS, mode: str = 'substring', limit: int = 20) -> List[int]:
+        """Ids of matching records, best match first."""
+        with self._lock:
+            ids, values, postings, sorted_fields = self._ids, self._values, self._postings, self._sorted
+            overlay = dict(self._overlay)
+
+        best = {}
+        for field in fields:
+            term = normalize(field, query)
+            if not term:
+                continue
+            term_mode = effective_mode(term, mode)
+            for position in self._candidates(postings[field], sorted_fields[field], term):
+                record_id = int(ids[position])
+                if record_id in overlay:
+                    continue
+                value = values[field][position]
+                rank = match_rank(value, term, term_mode)
+                if rank is not None:
+                    key = (rank, len(value), record_id)
+                    best[record_id] = min(best.get(record_id, key), key)
+            for record_id, (_, doc) in overlay.items():
+                if doc is None:
+                    continue
+                rank = match_rank(doc[field], term, term_mode)
+                if rank is not None:
+                    key = (rank, len(doc[field]), record_id)
+                    best[record_id] = min(best.get(record_id, key), key)
+
+        return [record_id for record_id, _ in sorted(best.items(), key=lambda item: item[1])[:limit]]
+
+    @staticmethod
+    def _candidates(postings: Dict[str, np.ndarray], sorted_field: tuple, term: str):
+        grams = trigrams(term)
+        if not grams:
+            # One or two characters: values with a word starting with the term (a row can appear twice)
+            sorted_starts, positions = sorted_field
+            start = bisect.bisect_left(sorted_starts, term)
+            end = bisect.bisect_left(sorted_starts, term + '\uffff', start)
+            return positions[start:end]
+        lists = sorted((postings.get(gram, _EMPTY) for gram in grams), key=len)
+        candidates = lists[0]
+        for positions in lists[1:]:
+            if not len(candidates):
+                break
+            candidates = np.intersect1d(candidates, positions, assume_unique=True)
+        return candidates.tolist()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "records": len(self._ids),
+                "overlay": len(self._overlay),
+                "version": self._version,
+                "trigrams": {field: len(grams) for field, grams in self._postings.items()},
+            }
+
+
+search_index = SearchIndex(check_interval=settings.SEARCH_INDEX_CHECK_INTERVAL)
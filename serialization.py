@@ -0,0 +1,62 @@
+from typing import Iterable, Optional, Sequence
+
+import orjson
+from fastapi import HTTPException, status
+from fastapi.responses import JSONResponse
+
+import models
+import schemas
+
+# Response fields of a credit balance, in the order FastAPI renders schemas.CreditBalance
+CREDIT_BALANCE_FIELDS = tuple(schemas.CreditBalance.model_fields)
+
+
+def parse_fields(fields: Optional[str]) -> tuple:
+    """Validate a comma-separated `fields=` parameter; every field when it is not given."""
+    if fields is None:
+        return CREDIT_BALANCE_FIELDS
+    requested = tuple(dict.fromkeys(field.strip() for field in fields.split(",") if field.strip()))
+    unknown = [field for field in requested if field not in CREDIT_BALANCE_FIELDS]
+    if unknown or not requested:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Invalid fields {unknown}. Use any of: {', '.join(CREDIT_BALANCE_FIELDS)}"
+        )
+    return requested
+
+
+def credit_balance_columns(fields: Sequence[str] = CREDIT_BALANCE_FIELDS) -> list:
+    """CreditBalance columns to select for `fields`, so queries return plain row tuples.
+
+    `id` is always selected, last if it was not asked for, because pagination
+    and ordering need it; rows_response() leaves it out again.
+    """
+    columns = [getattr(models.CreditBalance, field) for field in fields]
+    if "id" not in fields:
+        columns.append(models.CreditBalance.id)
+    return columns
+
+
+class FastJSONResponse(JSONResponse):
+    """JSON response encoded by orjson into one bytes buffer.
+
+    UTC datetimes end in `Z`, matching what Pydantic produces for the
+    response models.
+    """
+
+    def render(self, content) -> bytes:
+        return orjson.dumps(content, option=orjson.OPT_UTC_Z)
+
+
+def rows_response(
+    rows: Iterable,
+    fields: Sequence[str] = CREDIT_BALANCE_FIELDS,
+    headers: Optional[dict] = None,
+) -> FastJSONResponse:
+    """Encode rows selected with credit_balance_columns(fields) as a JSON list of `fields`.
+
+    The rows come straight from our own table, so they are not validated
+    against the response model one by one; the route's response_model still
+    documents the shape.
+    """
+    return FastJSONResponse([dict(zip(fields, row)) for row in rows], headers=headers)
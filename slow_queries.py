@@ -0,0 +1,74 @@
+import logging
+import threading
+from collections import deque
+from datetime import datetime, timezone
+from typing import Optional
+
+from config import settings
+
+logger = logging.getLogger(__name__)
+
+# Longest parameter repr kept per entry; executemany batches can be huge
+MAX_PARAMETERS_LENGTH = 500
+
+
+def format_parameters(parameters, executemany: bool) -> str:
+    """Short printable form of the bound parameters (first set only for executemany)."""
+    if executemany and parameters:
+        text = f"{parameters[0]!r} (+{len(parameters) - 1} more sets)"
+    else:
+        text = repr(parameters)
+    if len(text) > MAX_PARAMETERS_LENGTH:
+        text = text[:MAX_PARAMETERS_LENGTH] + "..."
+    return text
+
+
+class SlowQueryLog:
+    """Logs statements slower than `threshold` seconds and keeps the latest `max_entries` of them."""
+
+    def __init__(self, threshold: float = 0.5, max_entries: int = 200):
+        self.threshold = threshold
+        self.total = 0
+        self._lock = threading.Lock()
+        self._entries = deque(maxlen=max_entries)
+
+    def record(self, statement: str, parameters, executemany: bool, duration: float, route: Optional[str]):
+        entry = {
+            "timestamp": datetime.now(timezone.utc).isoformat(),
+            "duration_ms": round(duration * 1000, 1),
+            "route": route,
+            "statement": statement,
+            "parameters": format_parameters(parameters, executemany),
+        }
+        logger.warning(
+            f"Slow query ({entry['duration_ms']}ms) from {route or 'outside a request'}: "
+            f"{statement} -- parameters: {entry['parameters']}"
+        )
+        with self._lock:
+            self._entries.append(entry)
+            self.total += 1
+
+    def entries(self, limit: Optional[int] = None) -> list:
+        """Recorded slow queries, newest first."""
+        with self._lock:
+            entries = list(reversed(self._entries))
+        return entries[:limit] if limit else entries
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "threshold_ms": self.threshold * 1000,
+                "total": self.total,
+                "buffered": len(self._entries),
+                "max_entries": self._entries.maxlen,
+            }
+
+
+slow_query_log = SlowQueryLog(
+    threshold=settings.SLOW_QUERY_THRESHOLD_MS / 1000,
+    max_entries=settings.SLOW_QUERY_LOG_SIZE,
+)
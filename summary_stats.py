@@ -0,0 +1,152 @@
+import threading
+import time
+from typing import List, Optional, Tuple
+
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+
+import models
+from config import settings
+from table_versions import CREDIT_BALANCES, get_table_version
+
+UNASSIGNED = "Unassigned"
+
+
+def summary_values(credit_balance) -> dict:
+    """The fields of a CreditBalance that contribute to the summary aggregates."""
+    return {
+        "center": credit_balance.center,
+        "final_bucket": credit_balance.final_bucket,
+        "balance_amount": credit_balance.balance_amount or 0,
+        "balance_sessions": credit_balance.balance_sessions or 0,
+    }
+
+
+def _empty_bucket() -> dict:
+    return {"total_records": 0, "total_balance_amount": 0, "total_balance_sessions": 0}
+
+
+class SummaryStatsCache:
+    """In-memory totals for /credit-balances/stats/summary.
+
+    Computed once with a single GROUP BY query, then adjusted in place by the
+    write handlers through `record_change`. Writes made by other processes
+    (import scripts, other workers) are picked up by comparing the
+    credit_balances table version at most every `check_interval` seconds.
+    """
+
+    def __init__(self, check_interval: float = 30.0):
+        self.check_interval = check_interval
+        self._lock = threading.RLock()
+        self._version = None
+        self._checked_at = 0.0
+        self._totals = _empty_bucket()
+        self._by_center = {}
+        self._by_bucket = {}
+
+    def get(self, db: Session, refresh: bool = False, version: Optional[int] = None) -> Tuple[Optional[int], dict]:
+        """(table version the totals were computed at, totals).
+
+        Pass the current table `version` when the caller has already read it:
+        the totals are then brought up to it at once instead of at the next
+        `check_interval`. The returned version is None if a write raced the
+        read and the totals cannot be tied to a single version.
+        """
+        if refresh or self._version is None or (version is not None and version != self._version):
+            self.refresh(db)
+        elif version is None and time.monotonic() - self._checked_at > self.check_interval:
+            if get_table_version(db, CREDIT_BALANCES) != self._version:
+                self.refresh(db)
+            else:
+                self._checked_at = time.monotonic()
+        with self._lock:
+            return self._version, self.snapshot()
+
+    def refresh(self, db: Session):
+        """Recompute every aggregate from the table, tagged with the version it was read at."""
+        version = get_table_version(db, CREDIT_BALANCES)
+        rows = db.query(
+            models.CreditBalance.center,
+            models.CreditBalance.final_bucket,
+            func.count(models.CreditBalance.id),
+            func.sum(models.CreditBalance.balance_amount),
+            func.sum(models.CreditBalance.balance_sessions),
+        ).group_by(models.CreditBalance.center, models.CreditBalance.final_bucket).all()
+
+        totals, by_center, by_bucket = _empty_bucket(), {}, {}
+        for center, final_bucket, count, balance_amount, balance_sessions in rows:
+            for bucket in (
+                totals,
+                by_center.setdefault(center or UNASSIGNED, _empty_bucket()),
+                by_bucket.setdefault(final_bucket or UNASSIGNED, _empty_bucket()),
+            ):
+                bucket["total_records"] += count
+                bucket["total_balance_amount"] += balance_amount or 0
+                bucket["total_balance_sessions"] += balance_sessions or 0
+
+        # A write that committed during the GROUP BY may or may not be in the totals, so they
+        # cannot be tied to a version: leave it unset, so no delta is applied on top of them
+        # and the next read recomputes
+        if get_table_version(db, CREDIT_BALANCES) != version:
+            version = None
+
+        with self._lock:
+            self._totals, self._by_center, self._by_bucket = totals, by_center, by_bucket
+            self._version = version
+            self._checked_at = time.monotonic()
+
+    def record_change(self, before: Optional[dict], after: Optional[dict], version: int):
+        """Apply one committed create (before=None), update or delete (after=None).
+
+        `before`/`after` come from summary_values(); `version` is the table
+        version returned by bump_table_version for this write. If some other
+        writer got in between, the cache is marked stale instead.
+        """
+        self.record_changes([(before, after)], version)
+
+    def record_changes(self, changes: List[Tuple[Optional[dict], Optional[dict]]], version: int):
+        """Apply several (before, after) changes committed under a single table version bump."""
+        with self._lock:
+            if self._version is None:
+                return
+            if version != self._version + 1:
+                self._version = None
+                return
+            for before, after in changes:
+                if before:
+                    self._apply(before, -1)
+                if after:
+                    self._apply(after, 1)
+            self._version = version
+
+    def invalidate(self):
+        with self._lock:
+            self._version = None
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            centers = [name for name in self._by_center if name != UNASSIGNED]
+            return {
+                **self._totals,
+                "centers": centers,
+                "by_center": {name: dict(bucket) for name, bucket in self._by_center.items()},
+                "by_final_bucket": {name: dict(bucket) for name, bucket in self._by_bucket.items()},
+            }
+
+    def _apply(self, values: dict, sign: int):
+        for bucket in (
+            self._totals,
+            self._by_center.setdefault(values["center"] or UNASSIGNED, _empty_bucket()),
+            self._by_bucket.setdefault(values["final_bucket"] or UNASSIGNED, _empty_bucket()),
+        ):
+            bucket["total_records"] += sign
+            bucket["total_balance_amount"] += sign * values["balance_amount"]
+            bucket["total_balance_sessions"] += sign * values["balance_sessions"]
+        # Drop groups that no longer have any rows
+        for groups, key in ((self._by_center, values["center"]), (self._by_bucket, values["final_bucket"])):
+            key = key or UNASSIGNED
+            if groups[key]["total_records"] <= 0:
+                del groups[key]
+
+
+summary_stats_cache = SummaryStatsCache(check_interval=settings.STATS_CACHE_CHECK_INTERVAL)
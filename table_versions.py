@@ -0,0 +1,31 @@
+from sqlalchemy.orm import Session
+
+import models
+
+CREDIT_BALANCES = "credit_balances"
+
+
+def get_table_version(db: Session, table_name: str) -> int:
+    """Current change counter for `table_name` (0 if it has never been written)."""
+    version = db.query(models.TableVersion.version).filter(
+        models.TableVersion.table_name == table_name
+    ).scalar()
+    return version or 0
+
+
+def bump_table_version(db: Session, table_name: str) -> int:
+    """Increment the change counter for `table_name` inside the caller's transaction.
+
+    Call this before committing any write to the table so that caches in
+    other processes (API workers, import scripts) notice the change.
+    Returns the new version.
+    """
+    row = db.query(models.TableVersion).filter(
+        models.TableVersion.table_name == table_name
+    ).with_for_update().first()
+    if row is None:
+        row = models.TableVersion(table_name=table_name, version=0)
+        db.add(row)
+    row.version = (row.version or 0) + 1
+    db.flush()
+    return row.version
@@ -0,0 +1,101 @@
+"""Shared fixtures: the app on a throwaway SQLite database.
+
+SQLALCHEMY_DATABASE_URL has to be set before config is imported, so it is
+done here at module level. Every test starts from empty credit balance
+tables; the table version is bumped so the version-keyed caches start over.
+"""
+import os
+import sys
+import tempfile
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ["SQLALCHEMY_DATABASE_URL"] = f"sqlite:///{tempfile.mkdtemp(prefix='credit-balances-')}/test.db"
+
+from fastapi.testclient import TestClient  # noqa: E402
+
+import main  # noqa: E402
+import models  # noqa: E402
+from column_store import credit_balance_store  # noqa: E402
+from database import SessionLocal  # noqa: E402
+from table_versions import CREDIT_BALANCES, bump_table_version  # noqa: E402
+
+
+@pytest.fixture
+def db():
+    session = SessionLocal()
+    try:
+        yield session
+    finally:
+        session.close()
+
+
+@pytest.fixture(autouse=True)
+def clean_tables(db):
+    db.query(models.CreditBalanceTombstone).delete()
+    db.query(models.CreditBalance).delete()
+    bump_table_version(db, CREDIT_BALANCES)
+    db.commit()
+    credit_balance_store.enabled = False
+    credit_balance_store._snapshot = None
+    credit_balance_store.expire()
+    yield
+
+
+@pytest.fixture
+def client():
+    return TestClient(main.app)
+
+
+@pytest.fixture
+def center(db):
+    """The GK2 center; centers and users are kept across tests."""
+    existing = db.query(models.Center).filter(models.Center.name == "GK2").first()
+    if existing is None:
+        existing = models.Center(name="GK2", code="GK")
+        db.add(existing)
+        db.commit()
+    return existing
+
+
+@pytest.fixture
+def auth_headers(db, center):
+    """Bearer token headers for a user of the GK2 center with the given role."""
+    def headers(role: str = "USER") -> dict:
+        username = f"test-{role.lower()}"
+        if db.query(models.User).filter(models.User.username == username).first() is None:
+            db.add(models.User(
+                username=username,
+                email=f"{username}@example.com",
+                hashed_password="unused",
+                full_name=username,
+                role=role,
+                center_id=center.id,
+            ))
+            db.commit()
+        return {"Authorization": f"Bearer {main.create_access_token({'sub': username})}"}
+    return headers
+
+
+@pytest.fixture
+def create_balances(client):
+    """Create `count` credit balances through the API and return their response bodies."""
+    def create(count: int, **fields) -> list:
+        records = []
+        for number in range(count):
+            body = {
+                "client_code": f"C{number:04d}",
+                "client_name": f"Client {number}",
+                "phone_no": f"98{number:08d}",
+                "treatment_name": "Laser",
+                "center": "GK2",
+                "final_bucket": "Active",
+                "balance_amount": 100.0 + number,
+                **fields,
+            }
+            response = client.post("/credit-balances/", json=body)
+            assert response.status_code == 200, response.text
+            records.append(response.json())
+        return records
+    return create
@@ -0,0 +1,112 @@
+import pytest
+
+import models
+from column_store import credit_balance_store
+from config import settings
+
+ADMIN_ROUTES = ["/cache/stats", "/debug/slow-queries", "/debug/change-bus", "/debug/column-store"]
+
+
+@pytest.mark.parametrize("path", ADMIN_ROUTES)
+def test_admin_routes_require_a_token(client, path):
+    assert client.get(path).status_code == 401
+
+
+@pytest.mark.parametrize("path", ADMIN_ROUTES)
+def test_admin_routes_reject_other_roles(client, auth_headers, path):
+    assert client.get(path, headers=auth_headers("USER")).status_code == 403
+
+
+@pytest.mark.parametrize("path", ADMIN_ROUTES)
+def test_admin_routes_allow_admins(client, auth_headers, path):
+    assert client.get(path, headers=auth_headers("ADMIN")).status_code == 200
+
+
+@pytest.fixture(params=["database", "column_store"])
+def source(request):
+    credit_balance_store.enabled = request.param == "column_store"
+    return request.param
+
+
+@pytest.fixture
+def vouchered(create_balances):
+    """Records with known vouchers (GK prefix + first 3 client code chars + phone digits 4-7)."""
+    return {
+        "GKAB12345": [
+            create_balances(1, client_code="AB1", phone_no="9812345678")[0]["id"],
+            create_balances(1, client_code="AB1X", phone_no="9812345000")[0]["id"],
+        ],
+        "GKCD28765": [create_balances(1, client_code="CD2", phone_no="9898765432")[0]["id"]],
+    }
+
+
+def test_voucher_batch_resolves_in_request_order_and_logs_every_lookup(client, db, vouchered, source):
+    voucher_ids = ["GKCD28765", " gkab12345 ", "GKCD2", "NOPE123", "GKAB12345", "GKCD28765"]
+    response = client.post(
+        "/credit-balances/by-voucher/batch", json={"voucher_ids": voucher_ids, "user_name": f"batch-{source}"}
+    )
+
+    assert response.status_code == 200, response.text
+    body = response.json()
+    results = {voucher_id: [record["id"] for record in records] for voucher_id, records in body["results"].items()}
+    assert list(results) == ["GKCD28765", " gkab12345 ", "GKCD2", "NOPE123", "GKAB12345"]
+    assert results == {
+        "GKCD28765": vouchered["GKCD28765"],
+        " gkab12345 ": vouchered["GKAB12345"],
+        # Batch lookups are exact: a prefix of a voucher matches nothing
+        "GKCD2": [],
+        "NOPE123": [],
+        "GKAB12345": vouchered["GKAB12345"],
+    }
+    assert body["missing"] == ["GKCD2", "NOPE123"]
+
+    logged = db.query(models.ApiLog).filter(models.ApiLog.user_name == f"batch-{source}").all()
+    assert sorted(entry.voucher_id for entry in logged) == sorted(results)
+    assert {entry.api_endpoint for entry in logged} == {"/credit-balances/by-voucher/batch"}
+
+
+def test_voucher_batch_over_the_limit_is_rejected(client, monkeypatch):
+    monkeypatch.setattr(settings, "MAX_VOUCHER_BATCH_SIZE", 2)
+    response = client.post("/credit-balances/by-voucher/batch", json={"voucher_ids": ["A", "B", "C"], "user_name": "x"})
+    assert response.status_code == 400
+
+
+def lookup(client, voucher_id, match="exact") -> list:
+    response = client.post(
+        "/credit-balances/by-voucher", json={"voucher_id": voucher_id, "user_name": "lookup", "match": match}
+    )
+    assert response.status_code == 200, response.text
+    return [record["id"] for record in response.json()]
+
+
+def test_voucher_lookup_exact_uses_the_normalized_key(client, db, vouchered, source):
+    assert lookup(client, "GKAB12345") == vouchered["GKAB12345"]
+    assert lookup(client, "  gkab12345 ") == vouchered["GKAB12345"]
+    assert lookup(client, "GKAB1234") == []
+    assert {record.voucher_key for record in db.query(models.CreditBalance)} == {"GKAB12345", "GKCD28765"}
+
+
+def test_voucher_lookup_prefix(client, vouchered, source):
+    assert lookup(client, "gkab", "prefix") == vouchered["GKAB12345"]
+    assert lookup(client, "GK", "prefix") == vouchered["GKAB12345"] + vouchered["GKCD28765"]
+    assert lookup(client, "GKZZ", "prefix") == []
+    # LIKE wildcards in the input are matched literally
+    assert lookup(client, "GK%", "prefix") == []
+    assert lookup(client, "GK_B", "prefix") == []
+
+
+@pytest.mark.parametrize("path", ["/credit-balances/", "/credit-balances/by-center/GK2"])
+def test_sparse_fieldset_returns_only_the_requested_keys(client, create_balances, source, path):
+    create_balances(2)
+    response = client.get(path, params={"fields": "client_code, balance_amount"})
+    assert response.status_code == 200, response.text
+    assert response.json() == [
+        {"client_code": "C0000", "balance_amount": 100.0},
+        {"client_code": "C0001", "balance_amount": 101.0},
+    ]
+
+
+@pytest.mark.parametrize("fields", ["client_code,password", ","])
+def test_unknown_field_is_rejected(client, fields):
+    response = client.get("/credit-balances/", params={"fields": fields})
+    assert response.status_code == 400
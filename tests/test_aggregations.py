@@ -0,0 +1,58 @@
+"""GET /credit-balances/aggregate."""
+import pytest
+
+from column_store import credit_balance_store
+
+
+@pytest.fixture(params=["database", "column_store"])
+def source(request):
+    credit_balance_store.enabled = request.param == "column_store"
+    return request.param
+
+
+@pytest.fixture
+def ledger(create_balances):
+    create_balances(1, client_code="A1", center="GK2", final_bucket="Active", balance_amount=10.0)
+    create_balances(1, client_code="A2", center="GK2", final_bucket="Active", balance_amount=20.0)
+    create_balances(1, client_code="B1", center="GK2", final_bucket="Closed", balance_amount=5.0)
+    create_balances(1, client_code="B2", center="Punjabi Bagh", final_bucket="Active", balance_amount=7.0)
+
+
+def groups(client, **params) -> list:
+    response = client.get("/credit-balances/aggregate", params=params)
+    assert response.status_code == 200, response.text
+    return response.json()["groups"]
+
+
+def test_group_by_center(client, ledger, source):
+    assert groups(client, group_by="center", metrics="count,sum_balance_amount,avg_balance_amount") == [
+        {"center": "GK2", "count": 3, "sum_balance_amount": 35.0, "avg_balance_amount": pytest.approx(35.0 / 3)},
+        {"center": "Punjabi Bagh", "count": 1, "sum_balance_amount": 7.0, "avg_balance_amount": 7.0},
+    ]
+
+
+def test_group_by_bucket(client, ledger, source):
+    assert groups(client, group_by="final_bucket", metrics="count,sum_balance_amount") == [
+        {"final_bucket": "Active", "count": 3, "sum_balance_amount": 37.0},
+        {"final_bucket": "Closed", "count": 1, "sum_balance_amount": 5.0},
+    ]
+
+
+def test_grand_totals(client, ledger, source):
+    assert groups(client, metrics="count,sum_balance_amount") == [{"count": 4, "sum_balance_amount": 42.0}]
+
+
+def test_filtered_group_by(client, ledger, source):
+    assert groups(client, group_by="final_bucket", metrics="count,sum_balance_amount", center="GK2") == [
+        {"final_bucket": "Active", "count": 2, "sum_balance_amount": 30.0},
+        {"final_bucket": "Closed", "count": 1, "sum_balance_amount": 5.0},
+    ]
+    assert groups(client, group_by="center", metrics="count", client_code="b") == [
+        {"center": "GK2", "count": 1},
+        {"center": "Punjabi Bagh", "count": 1},
+    ]
+
+
+@pytest.mark.parametrize("params", [{"group_by": "client_name"}, {"metrics": "max_balance_amount"}, {"metrics": ""}])
+def test_unknown_dimension_or_metric_is_rejected(client, params):
+    assert client.get("/credit-balances/aggregate", params=params).status_code == 400
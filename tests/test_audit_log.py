@@ -0,0 +1,32 @@
+from starlette.requests import Request
+
+from audit_log import client_ip, parse_networks
+
+PROXIES = parse_networks("10.0.0.0/8, 127.0.0.1")
+
+
+def make_request(peer: str, forwarded: str = None) -> Request:
+    headers = [(b"x-forwarded-for", forwarded.encode())] if forwarded else []
+    return Request({"type": "http", "method": "GET", "path": "/", "headers": headers, "client": (peer, 5000)})
+
+
+def test_forwarded_header_from_untrusted_peer_is_ignored():
+    assert client_ip(make_request("203.0.113.9", "1.2.3.4"), PROXIES) == "203.0.113.9"
+
+
+def test_forwarded_header_is_ignored_without_trusted_proxies():
+    assert client_ip(make_request("127.0.0.1", "1.2.3.4"), []) == "127.0.0.1"
+
+
+def test_trusted_proxy_chain_yields_the_first_untrusted_hop():
+    # The client sent a spoofed 6.6.6.6; the proxies appended the real address and their own
+    request = make_request("127.0.0.1", "6.6.6.6, 198.51.100.7, 10.1.2.3")
+    assert client_ip(request, PROXIES) == "198.51.100.7"
+
+
+def test_all_hops_trusted_falls_back_to_the_first():
+    assert client_ip(make_request("10.0.0.1", "10.0.0.5, 10.0.0.6"), PROXIES) == "10.0.0.5"
+
+
+def test_malformed_hop_is_treated_as_untrusted():
+    assert client_ip(make_request("10.0.0.1", "not-an-ip"), PROXIES) == "not-an-ip"
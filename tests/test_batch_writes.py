@@ -0,0 +1,93 @@
+"""POST /credit-balances/batch."""
+import pytest
+
+import models
+from batch_writes import change_bus
+
+
+@pytest.fixture
+def published(monkeypatch):
+    """Events handed to the change bus, in order."""
+    events = []
+    monkeypatch.setattr(change_bus, "publish", lambda batch, version=None: events.extend(batch))
+    return events
+
+
+def test_events_carry_the_timestamps_the_database_set(client, db, create_balances, published):
+    existing = create_balances(1)[0]
+    assert existing["updated_at"] is None
+
+    response = client.post("/credit-balances/batch", json={
+        "create": [{"client_code": "N0001", "client_name": "New", "center": "GK2", "balance_amount": 5.0}],
+        "update": [{"id": existing["id"], "balance_amount": 1.0}],
+    })
+    assert response.status_code == 200, response.text
+    created_id = response.json()["results"][0]["id"]
+
+    records = {event["id"]: event["record"] for event in published if event["op"] == "upsert"}
+    stored = {row.id: row for row in db.query(models.CreditBalance).all()}
+    assert records[existing["id"]]["updated_at"] is not None
+    assert records[existing["id"]]["updated_at"] == stored[existing["id"]].updated_at
+    assert records[created_id]["created_at"] is not None
+    assert records[created_id]["created_at"] == stored[created_id].created_at
+
+
+def test_atomic_batch_with_an_invalid_item_writes_nothing(client, db, create_balances):
+    existing = create_balances(2)
+    response = client.post("/credit-balances/batch", json={
+        "create": [{"client_code": "N0001", "client_name": "New", "center": "GK2"}],
+        "update": [{"id": existing[0]["id"], "balance_amount": 1.0}],
+        "delete": [existing[1]["id"], 999999],
+    })
+
+    assert response.status_code == 422
+    body = response.json()
+    assert body["committed"] is False
+    assert [(result["op"], result["index"], result["status"]) for result in body["results"]] == [
+        ("create", 0, "skipped"),
+        ("update", 0, "skipped"),
+        ("delete", 0, "skipped"),
+        ("delete", 1, "error"),
+    ]
+    assert body["results"][3]["error"] == "Credit balance not found"
+    assert db.query(models.CreditBalance).count() == 2
+    assert db.get(models.CreditBalance, existing[0]["id"]).balance_amount == existing[0]["balance_amount"]
+
+
+def test_non_atomic_batch_applies_the_valid_items(client, db, create_balances):
+    existing = create_balances(3)
+    response = client.post("/credit-balances/batch", json={
+        "create": [{"client_code": "N0001", "client_name": "New", "center": "GK2"}],
+        "update": [
+            {"id": existing[0]["id"], "balance_amount": 1.0},
+            {"id": existing[1]["id"], "balance_amount": 2.0},
+        ],
+        "delete": [existing[1]["id"], existing[2]["id"]],
+        "atomic": False,
+    })
+
+    assert response.status_code == 200, response.text
+    body = response.json()
+    assert body["committed"] is True
+    assert (body["created"], body["updated"], body["deleted"]) == (1, 1, 1)
+    statuses = [(result["op"], result["index"], result["status"], result["error"]) for result in body["results"]]
+    duplicate = "Id appears more than once in this batch"
+    assert statuses == [
+        ("create", 0, "ok", None),
+        ("update", 0, "ok", None),
+        ("update", 1, "error", duplicate),
+        ("delete", 0, "error", duplicate),
+        ("delete", 1, "ok", None),
+    ]
+    db.expire_all()
+    assert db.get(models.CreditBalance, body["results"][0]["id"]).client_code == "N0001"
+    assert db.get(models.CreditBalance, existing[0]["id"]).balance_amount == 1.0
+    assert db.get(models.CreditBalance, existing[1]["id"]).balance_amount == existing[1]["balance_amount"]
+    assert db.get(models.CreditBalance, existing[2]["id"]) is None
+    assert db.query(models.CreditBalanceTombstone).count() == 1
+
+
+def test_batch_over_the_limit_is_rejected(client, monkeypatch):
+    monkeypatch.setattr("main.settings.MAX_BATCH_OPERATIONS", 1)
+    response = client.post("/credit-balances/batch", json={"delete": [1, 2]})
+    assert response.status_code == 400
@@ -0,0 +1,80 @@
+"""Server-Sent Events push and the poller behind it."""
+import asyncio
+
+import pytest
+
+import main
+import models
+from auth_cache import user_cache
+from change_bus import change_bus
+from database import engine
+from table_versions import CREDIT_BALANCES, bump_table_version
+
+
+@pytest.fixture
+def poller():
+    """The change bus as if its poller had just started: the first read only takes the feed position."""
+    change_bus._watermark = None
+    change_bus._version = None
+    change_bus._recent.clear()
+    assert change_bus._read_external_changes() == []
+    return change_bus
+
+
+def test_open_stream_holds_no_database_connection(db, auth_headers):
+    authorization = auth_headers()["Authorization"].encode()
+    db.commit()
+    user_cache.invalidate()  # So authentication has to query the database
+
+    async def open_stream():
+        chunks = asyncio.Queue()
+        disconnected = asyncio.Event()
+
+        async def receive():
+            await disconnected.wait()
+            return {"type": "http.disconnect"}
+
+        async def send(message):
+            if message["type"] == "http.response.body":
+                await chunks.put(message.get("body", b""))
+
+        scope = {
+            "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": "GET",
+            "scheme": "http", "path": "/credit-balances/by-user-center/stream", "raw_path": b"",
+            "root_path": "", "query_string": b"", "headers": [(b"authorization", authorization)],
+            "client": ("127.0.0.1", 50000), "server": ("testserver", 80),
+        }
+        app = asyncio.create_task(main.app(scope, receive, send))
+        first = await asyncio.wait_for(chunks.get(), 5)
+        checked_out = engine.pool.checkedout()
+        disconnected.set()
+        await asyncio.wait_for(app, 5)
+        return first, checked_out
+
+    first, checked_out = asyncio.run(open_stream())
+
+    assert first.startswith(b"event: ready")
+    assert checked_out == 0
+
+
+def test_poller_skips_changes_this_process_published(client, db, create_balances, poller):
+    records = create_balances(2)
+    assert client.delete(f"/credit-balances/{records[0]['id']}").status_code == 200
+    # Nothing but this process's own writes: the position just moves on
+    assert poller._read_external_changes() == []
+
+    client.put(f"/credit-balances/{records[1]['id']}", json={"balance_amount": 1.0})
+    outside = models.CreditBalance(client_code="X0001", client_name="Outside Writer")
+    db.add(outside)
+    bump_table_version(db, CREDIT_BALANCES)
+    db.commit()
+
+    events = poller._read_external_changes()
+
+    assert [(event["op"], event["id"]) for event in events] == [("upsert", outside.id)]
+    # Published now, so the overlap of the next read does not repeat it
+    db.add(models.CreditBalance(client_code="X0002", client_name="Second Writer"))
+    bump_table_version(db, CREDIT_BALANCES)
+    db.commit()
+    poller.publish(events)
+    assert [event["record"]["client_code"] for event in poller._read_external_changes()] == ["X0002"]
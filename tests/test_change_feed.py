@@ -0,0 +1,107 @@
+"""GET /credit-balances/changes."""
+from datetime import timedelta
+
+from sqlalchemy import update
+
+import change_feed
+import models
+
+
+def poll(client, **params) -> dict:
+    response = client.get("/credit-balances/changes", params=params)
+    assert response.status_code == 200, response.text
+    return response.json()
+
+
+def read_all(client, watermark=None, limit=2) -> tuple:
+    """Every page from `watermark` until has_more is false: (changed ids, deleted ids, pages, last watermark)."""
+    changed, deleted, pages = [], [], 0
+    while True:
+        params = {"limit": limit, **({"since": watermark} if watermark else {})}
+        page = poll(client, **params)
+        changed += [record["id"] for record in page["changes"]]
+        deleted += page["deleted"]
+        watermark = page["watermark"]
+        pages += 1
+        if not page["has_more"]:
+            return changed, deleted, pages, watermark
+
+
+def test_pages_through_every_record_once(client, create_balances):
+    ids = [record["id"] for record in create_balances(5)]
+
+    changed, deleted, pages, _ = read_all(client)
+
+    assert changed == ids
+    assert deleted == []
+    assert pages == 3
+
+
+def test_deletes_come_from_tombstones(client, db, create_balances):
+    ids = [record["id"] for record in create_balances(4)]
+    *_, watermark = read_all(client)
+
+    for record_id in ids[:3]:
+        assert client.delete(f"/credit-balances/{record_id}").status_code == 200
+    client.put(f"/credit-balances/{ids[3]}", json={"balance_amount": 1.0})
+
+    changed, deleted, pages, _ = read_all(client, watermark)
+
+    assert ids[3] in changed
+    assert sorted(set(deleted)) == ids[:3]
+    assert pages == 2
+    assert db.query(models.CreditBalanceTombstone).count() == 3
+
+
+def test_caught_up_poll_rereads_late_commits(client, db, create_balances):
+    create_balances(2)
+    *_, watermark = read_all(client)
+    read_at = change_feed.decode_watermark(db, watermark)[4]
+
+    # Timestamped before the watermark was read but committed after it, like a slow transaction
+    late = models.CreditBalance(client_code="L0001", client_name="Late", created_at=read_at - timedelta(seconds=5))
+    # Too old for the overlap: the feed already had time to see it
+    old = models.CreditBalance(client_code="O0001", client_name="Old", created_at=read_at - timedelta(hours=1))
+    db.add_all([late, old])
+    db.commit()
+
+    changed, *_ = read_all(client, watermark)
+
+    assert late.id in changed
+    assert old.id not in changed
+
+
+def test_updated_since_starts_from_a_point_in_time(client, db, create_balances):
+    records = create_balances(3)
+    created_at = db.get(models.CreditBalance, records[0]["id"]).created_at - timedelta(days=1)
+    # updated_at is given so that it is not set by this update
+    db.execute(
+        update(models.CreditBalance)
+        .where(models.CreditBalance.id == records[0]["id"])
+        .values(created_at=created_at, updated_at=None)
+    )
+    db.commit()
+
+    page = poll(client, updated_since=(created_at + timedelta(hours=1)).isoformat())
+
+    assert [record["id"] for record in page["changes"]] == [record["id"] for record in records[1:]]
+
+
+def test_watermark_from_before_tombstone_times_still_works(client, db, create_balances):
+    ids = [record["id"] for record in create_balances(2)]
+    client.delete(f"/credit-balances/{ids[0]}")
+    *_, watermark = read_all(client)
+    changed_at, last_id, _, tombstone_id, _ = change_feed.decode_watermark(db, watermark)
+    legacy = change_feed.base64.urlsafe_b64encode(change_feed.json.dumps(
+        {"changed_at": changed_at.isoformat(), "id": last_id, "tombstone_id": tombstone_id}
+    ).encode()).decode()
+    client.delete(f"/credit-balances/{ids[1]}")
+
+    page = poll(client, since=legacy)
+
+    assert page["deleted"] == [ids[1]]
+
+
+def test_invalid_watermark_is_rejected(client):
+    response = client.get("/credit-balances/changes", params={"since": "not-a-watermark"})
+    assert response.status_code == 400
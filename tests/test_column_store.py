@@ -0,0 +1,85 @@
+"""The in-memory column store: incremental merges, full reloads and parity with the database."""
+import pytest
+from sqlalchemy.exc import OperationalError
+
+import models
+from column_store import credit_balance_store
+from table_versions import CREDIT_BALANCES, bump_table_version
+
+
+@pytest.fixture
+def store():
+    credit_balance_store.enabled = True
+    credit_balance_store.refreshes = {"full": 0, "incremental": 0, "failed": 0}
+    return credit_balance_store
+
+
+def listing(client) -> list:
+    response = client.get("/credit-balances/")
+    assert response.status_code == 200, response.text
+    return response.json()
+
+
+def from_database(client) -> list:
+    credit_balance_store.enabled = False
+    try:
+        return listing(client)
+    finally:
+        credit_balance_store.enabled = True
+
+
+def test_writes_are_merged_into_the_snapshot(client, create_balances, store):
+    records = create_balances(3)
+    assert len(listing(client)) == 3
+    assert store.refreshes == {"full": 1, "incremental": 0, "failed": 0}
+
+    client.put(f"/credit-balances/{records[1]['id']}", json={"balance_amount": 7.5, "final_bucket": "Closed"})
+    create_balances(1, client_code="N0001")
+
+    rows = listing(client)
+    assert store.refreshes["incremental"] == 1
+    assert store.refreshes["full"] == 1
+    assert rows == from_database(client)
+    assert {row["client_code"] for row in rows} == {"C0000", "C0001", "C0002", "N0001"}
+    assert next(row for row in rows if row["id"] == records[1]["id"])["final_bucket"] == "Closed"
+
+
+def test_a_delete_made_elsewhere_forces_a_full_reload(client, db, create_balances, store):
+    records = create_balances(3)
+    listing(client)
+
+    # Not visible through the watermark, only through the row count
+    db.query(models.CreditBalance).filter(models.CreditBalance.id == records[0]["id"]).delete()
+    bump_table_version(db, CREDIT_BALANCES)
+    db.commit()
+    store.expire()
+
+    rows = listing(client)
+    assert store.refreshes["full"] == 2
+    assert [row["id"] for row in rows] == [record["id"] for record in records[1:]]
+    assert rows == from_database(client)
+
+
+def test_aggregates_match_the_database(client, create_balances, store):
+    create_balances(4)
+    create_balances(2, client_code="B", final_bucket=None, balance_amount=None)
+    url = "/credit-balances/aggregate?group_by=final_bucket&metrics=count,sum_balance_amount,avg_balance_amount"
+
+    from_store = client.get(url).json()
+    store.enabled = False
+    assert from_store == client.get(url).json()
+
+
+def test_a_failed_refresh_keeps_serving_the_last_snapshot(client, create_balances, store, monkeypatch):
+    create_balances(2)
+    listing(client)
+
+    def unreachable(*args, **kwargs):
+        raise OperationalError("SELECT", {}, Exception("link down"))
+
+    monkeypatch.setattr(store, "_load", unreachable)
+    create_balances(1, client_code="N0001")
+
+    assert len(listing(client)) == 2
+    assert store.refreshes["failed"] == 1
+    assert "link down" in store.last_error
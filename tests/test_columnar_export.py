@@ -0,0 +1,80 @@
+import io
+import os
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+import pytest
+
+from config import settings
+
+
+def read(format: str, content: bytes) -> pa.Table:
+    if format == "parquet":
+        return pq.read_table(io.BytesIO(content))
+    return pa.ipc.open_stream(content).read_all()
+
+
+@pytest.fixture
+def cache_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "COLUMNAR_EXPORT_CACHE_DIR", str(tmp_path))
+    return tmp_path
+
+
+def snapshots(directory) -> list:
+    return sorted(name for name in os.listdir(directory) if not name.endswith(".partial"))
+
+
+@pytest.mark.parametrize("format", ["parquet", "arrow"])
+def test_export_streams_every_batch(client, create_balances, monkeypatch, format):
+    monkeypatch.setattr(settings, "COLUMNAR_EXPORT_CHUNK_SIZE", 2)
+    create_balances(5)
+    response = client.get(f"/credit-balances/export/columnar?format={format}")
+    assert response.status_code == 200
+    assert "content-length" not in response.headers
+    table = read(format, response.content)
+    assert table.column("client_code").to_pylist() == [f"C{number:04d}" for number in range(5)]
+    if format == "parquet":
+        assert pq.ParquetFile(io.BytesIO(response.content)).num_row_groups == 3
+
+
+def test_cached_snapshot_is_reused_until_the_table_changes(client, create_balances, cache_dir):
+    create_balances(3)
+    first = client.get("/credit-balances/export/columnar?format=arrow")
+    assert len(snapshots(cache_dir)) == 1
+    again = client.get("/credit-balances/export/columnar?format=arrow")
+    assert again.content == first.content
+    assert "content-length" in again.headers  # Served from the file
+
+    create_balances(1)
+    client.get("/credit-balances/export/columnar?format=arrow")
+    # The snapshot of the previous version was replaced
+    assert len(snapshots(cache_dir)) == 1
+
+
+def test_eviction_removes_the_least_recently_used_snapshots(tmp_path):
+    from columnar_export import evict_snapshots
+    for age, name in enumerate(["v7-new", "v7-middle", "v7-old", "v6-stale"]):
+        path = tmp_path / f"credit_balances-{name}.arrow"
+        path.write_bytes(b"x" * 100)
+        os.utime(path, (1000 - age, 1000 - age))
+
+    evict_snapshots(str(tmp_path), 7, max_bytes=250, keep=str(tmp_path / "credit_balances-v7-old.arrow"))
+    assert snapshots(tmp_path) == ["credit_balances-v7-new.arrow", "credit_balances-v7-old.arrow"]
+
+
+def test_serving_a_snapshot_marks_it_recently_used(client, create_balances, cache_dir):
+    create_balances(2)
+    client.get("/credit-balances/export/columnar?format=arrow")
+    [name] = snapshots(cache_dir)
+    os.utime(cache_dir / name, (1, 1))
+    client.get("/credit-balances/export/columnar?format=arrow")
+    assert os.path.getmtime(cache_dir / name) > 1
+
+
+def test_abandoned_stream_leaves_no_partial_file(create_balances, cache_dir):
+    from columnar_export import stream_columnar
+    create_balances(4)
+    stream = stream_columnar("parquet", 1, cache_dir=str(cache_dir), cache_max_bytes=10 ** 9, chunk_size=2)
+    next(stream)
+    stream.close()
+    assert os.listdir(cache_dir) == []
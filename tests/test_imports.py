@@ -0,0 +1,50 @@
+import pandas as pd
+import pytest
+
+import import_excel
+import import_updated_excel
+import models
+from benchmark_import import synthetic_report
+from bulk_import import bulk_insert_credit_balances
+
+
+@pytest.fixture
+def report(monkeypatch):
+    """Serve a synthetic sheet instead of reading an Excel file."""
+    frame = synthetic_report(12)
+    monkeypatch.setattr(pd, "read_excel", lambda *args, **kwargs: frame.copy())
+    return frame
+
+
+def test_reload_replaces_the_table_and_tombstones_the_old_rows(db, create_balances, report):
+    old_ids = {record["id"] for record in create_balances(3)}
+    assert import_excel.import_excel_data("report.xlsx", bulk=True, batch_size=5) == 12
+    assert db.query(models.CreditBalance).count() == 12
+    tombstoned = {tombstone.credit_balance_id for tombstone in db.query(models.CreditBalanceTombstone)}
+    assert tombstoned == old_ids
+
+
+def test_row_by_row_reload_replaces_the_table(db, create_balances, report):
+    create_balances(3)
+    assert import_updated_excel.import_updated_excel_data("report.xlsx") == 12
+    assert db.query(models.CreditBalance).count() == 12
+
+
+@pytest.mark.parametrize("module, load", [
+    (import_excel, import_excel.import_excel_data),
+    (import_updated_excel, import_updated_excel.import_updated_excel_data),
+])
+def test_failed_reload_keeps_the_old_rows(db, create_balances, report, monkeypatch, module, load):
+    old_ids = sorted(record["id"] for record in create_balances(3))
+
+    def insert_some_then_fail(session, frame, batch_size, commit=True):
+        bulk_insert_credit_balances(session, frame.head(batch_size), batch_size, commit=commit)
+        raise RuntimeError("connection lost")
+
+    monkeypatch.setattr(module, "bulk_insert_credit_balances", insert_some_then_fail)
+    with pytest.raises(RuntimeError):
+        load("report.xlsx", bulk=True, batch_size=5)
+
+    db.expire_all()
+    assert sorted(record.id for record in db.query(models.CreditBalance)) == old_ids
+    assert db.query(models.CreditBalanceTombstone).count() == 0
@@ -0,0 +1,69 @@
+import pandas as pd
+import pytest
+
+import models
+from benchmark_import import synthetic_report
+from bulk_import import bulk_insert_credit_balances, clean_credit_balance_frame
+from centers import assign_centers
+from incremental_import import sync_credit_balances
+
+
+def cleaned(db, rows: int):
+    """`rows` report rows with distinct natural keys."""
+    frame = clean_credit_balance_frame(synthetic_report(rows))
+    frame["client_code"] = [f"K{number:04d}" for number in range(rows)]
+    return assign_centers(db, frame)
+
+
+def table(db) -> dict:
+    return {
+        record.id: (record.client_code, record.treatment_name, record.balance_amount)
+        for record in db.query(models.CreditBalance)
+    }
+
+
+@pytest.fixture
+def loaded(db):
+    bulk_insert_credit_balances(db, cleaned(db, 20))
+    return table(db)
+
+
+@pytest.mark.parametrize("staging", [False, True])
+def test_unchanged_sheet_writes_nothing(db, loaded, staging):
+    stats = sync_credit_balances(db, cleaned(db, 20), batch_size=7, staging=staging)
+    assert stats == {"inserted": 0, "updated": 0, "deleted": 0, "unchanged": 20}
+    assert table(db) == loaded
+
+
+@pytest.mark.parametrize("staging", [False, True])
+def test_sync_counts_and_applies_inserts_updates_and_deletes(db, loaded, staging):
+    incoming = cleaned(db, 20)
+    dropped = incoming.index[:3]
+    incoming.loc[incoming.index[5:7], "balance_amount"] = 1.25
+    incoming = incoming.drop(dropped)
+    extra = cleaned(db, 22).tail(2).assign(client_code=["NEW0001", "NEW0002"])
+    incoming = pd.concat([incoming, extra], ignore_index=True)
+
+    stats = sync_credit_balances(db, incoming, batch_size=7, staging=staging)
+    assert stats == {"inserted": 2, "updated": 2, "deleted": 3, "unchanged": 15}
+
+    after = table(db)
+    old_ids = sorted(loaded)
+    deleted_ids = old_ids[:3]
+    assert all(record_id not in after for record_id in deleted_ids)
+    # Updated and unchanged rows keep their ids
+    assert after[old_ids[5]][2] == 1.25 and after[old_ids[6]][2] == 1.25
+    assert after[old_ids[10]] == loaded[old_ids[10]]
+    assert sorted(code for code, _, _ in after.values() if code.startswith("NEW")) == ["NEW0001", "NEW0002"]
+    assert len(after) == 19
+    tombstoned = sorted(tombstone.credit_balance_id for tombstone in db.query(models.CreditBalanceTombstone))
+    assert tombstoned == deleted_ids
+
+
+def test_repeated_keys_are_paired_in_order(db):
+    frame = cleaned(db, 4).assign(client_code="SAME", treatment_name="Laser", center="GK2")
+    bulk_insert_credit_balances(db, frame)
+    ids = sorted(table(db))
+    stats = sync_credit_balances(db, frame.head(3), batch_size=7)
+    assert stats == {"inserted": 0, "updated": 0, "deleted": 1, "unchanged": 3}
+    assert sorted(table(db)) == ids[:3]
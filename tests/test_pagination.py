@@ -0,0 +1,58 @@
+import pytest
+
+from column_store import credit_balance_store
+from config import settings
+
+
+@pytest.fixture(params=["database", "column_store"])
+def source(request):
+    credit_balance_store.enabled = request.param == "column_store"
+    return request.param
+
+
+@pytest.fixture
+def small_pages(monkeypatch):
+    monkeypatch.setattr(settings, "MAX_PAGE_SIZE", 3)
+
+
+def test_request_without_limit_gets_one_capped_page(client, create_balances, small_pages, source):
+    create_balances(7)
+    response = client.get("/credit-balances/")
+    assert response.status_code == 200
+    assert [record["client_code"] for record in response.json()] == ["C0000", "C0001", "C0002"]
+    assert response.links["next"]["url"].endswith(f"cursor={response.headers['x-next-cursor']}")
+
+
+def test_limit_above_the_maximum_is_capped(client, create_balances, small_pages, source):
+    create_balances(7)
+    assert len(client.get("/credit-balances/?limit=1000").json()) == 3
+
+
+def test_skip_without_limit_is_capped(client, create_balances, small_pages, source):
+    create_balances(7)
+    assert [record["client_code"] for record in client.get("/credit-balances/?skip=2").json()] == [
+        f"C{number:04d}" for number in range(2, 5)
+    ]
+
+
+def test_center_routes_are_capped(client, create_balances, auth_headers, small_pages, source):
+    create_balances(7)
+    assert len(client.get("/credit-balances/by-center/GK2").json()) == 3
+    assert len(client.get("/credit-balances/by-user-center", headers=auth_headers()).json()) == 3
+
+
+def test_limit_pages_follow_the_link_header(client, create_balances, small_pages, source):
+    create_balances(7)
+    seen, url = [], "/credit-balances/?limit=50&skip=1"
+    while url:
+        response = client.get(url)
+        assert len(response.json()) <= 3
+        seen.extend(record["client_code"] for record in response.json())
+        link = response.links.get("next")
+        if link is None:
+            assert "x-next-cursor" not in response.headers
+            break
+        assert f"cursor={response.headers['x-next-cursor']}" in link["url"]
+        assert "skip" not in link["url"]
+        url = link["url"]
+    assert seen == [f"C{number:04d}" for number in range(1, 7)]
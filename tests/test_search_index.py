@@ -0,0 +1,111 @@
+"""GET /credit-balances/search and the index behind it."""
+import threading
+
+import pytest
+
+import models
+from change_feed import record_deletes
+from database import SessionLocal
+from search_index import search_index
+from table_versions import CREDIT_BALANCES, bump_table_version
+
+
+@pytest.fixture(autouse=True)
+def fresh_index(monkeypatch):
+    """Each test builds the index on first search; it is checked against the table version every time."""
+    monkeypatch.setattr(search_index, "check_interval", 0.0)
+    search_index._version = None
+    search_index._overlay = {}
+
+
+@pytest.fixture
+def rebuilds(monkeypatch):
+    """Number of full rebuilds so far."""
+    calls = []
+    rebuild = search_index.rebuild
+    monkeypatch.setattr(search_index, "rebuild", lambda db: (calls.append(1), rebuild(db)))
+    return calls
+
+
+def search(client, q, **params) -> list:
+    response = client.get("/credit-balances/search", params={"q": q, **params})
+    assert response.status_code == 200, response.text
+    return [record["client_name"] for record in response.json()]
+
+
+def test_short_queries_match_word_starts_in_the_index_and_the_overlay(client, create_balances):
+    create_balances(1, client_name="Mary Jones")
+    create_balances(1, client_name="Ravi Bajoria")
+    search(client, "warm up")
+    # Written after the index was built, so they are only in the overlay
+    create_balances(1, client_name="Jo Smith")
+    create_balances(1, client_name="Anil Kumar Joshi")
+
+    for mode in ("substring", "prefix"):
+        assert search(client, "jo", fields="client_name", mode=mode) == ["Jo Smith", "Mary Jones", "Anil Kumar Joshi"]
+    assert search(client, "jor", fields="client_name") == ["Ravi Bajoria"]
+
+
+def test_writes_from_other_processes_are_caught_up_without_a_rebuild(client, db, create_balances, rebuilds):
+    create_balances(2)
+    assert search(client, "client 1", fields="client_name") == ["Client 1"]
+    assert len(rebuilds) == 1
+
+    # As an importer would: straight to the database, with a version bump
+    db.add(models.CreditBalance(client_code="X0001", client_name="Outside Writer"))
+    bump_table_version(db, CREDIT_BALANCES)
+    db.commit()
+
+    assert search(client, "outside", fields="client_name") == ["Outside Writer"]
+    assert search(client, "client 1", fields="client_name") == ["Client 1"]
+    assert len(rebuilds) == 1
+
+
+def test_foreign_deletes_reach_the_overlay(client, db, create_balances, rebuilds):
+    records = create_balances(2)
+    assert search(client, "client", fields="client_name") == ["Client 0", "Client 1"]
+
+    assert client.delete(f"/credit-balances/{records[0]['id']}").status_code == 200
+    # Not known to the index: it has to come from the tombstone
+    record_deletes(db, models.CreditBalance.id == records[1]["id"])
+    db.query(models.CreditBalance).filter(models.CreditBalance.id == records[1]["id"]).delete()
+    bump_table_version(db, CREDIT_BALANCES)
+    db.commit()
+
+    assert search(client, "client", fields="client_name") == []
+    assert len(rebuilds) == 1
+
+
+def test_a_large_foreign_change_rebuilds(client, db, create_balances, rebuilds, monkeypatch):
+    create_balances(1)
+    search(client, "client")
+    monkeypatch.setattr(search_index, "max_overlay", 2)
+    db.add_all([models.CreditBalance(client_code=f"X{n}", client_name=f"Imported {n}") for n in range(3)])
+    bump_table_version(db, CREDIT_BALANCES)
+    db.commit()
+
+    assert len(search(client, "imported", fields="client_name")) == 3
+    assert len(rebuilds) == 2
+    assert search_index.stats()["overlay"] == 0
+
+
+def test_concurrent_requests_build_the_index_once(create_balances, rebuilds):
+    create_balances(3)
+    barrier = threading.Barrier(4)
+
+    def refresh():
+        db = SessionLocal()
+        try:
+            barrier.wait()
+            search_index.ensure_fresh(db)
+        finally:
+            db.close()
+
+    threads = [threading.Thread(target=refresh) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(rebuilds) == 1
+    assert search_index.stats()["records"] == 3
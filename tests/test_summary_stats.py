@@ -0,0 +1,63 @@
+import models
+import summary_stats
+from database import SessionLocal
+from summary_stats import SummaryStatsCache
+from table_versions import CREDIT_BALANCES, bump_table_version, get_table_version
+
+
+def external_insert(db, balance_amount: float):
+    """A write from another process: straight to the table, with a version bump."""
+    db.add(models.CreditBalance(client_code="EXT", client_name="External", balance_amount=balance_amount))
+    bump_table_version(db, CREDIT_BALANCES)
+    db.commit()
+
+
+def test_api_writes_update_the_totals(client, create_balances):
+    create_balances(2)
+    assert client.get("/credit-balances/stats/summary").json()["total_records"] == 2
+    create_balances(1)
+    assert client.get("/credit-balances/stats/summary").json()["total_records"] == 3
+
+
+def test_external_write_is_served_under_a_new_etag(client, db, create_balances):
+    create_balances(2)
+    first = client.get("/credit-balances/stats/summary")
+    assert first.json()["total_records"] == 2
+
+    external_insert(db, 50.0)
+    second = client.get("/credit-balances/stats/summary", headers={"If-None-Match": first.headers["etag"]})
+    assert second.status_code == 200
+    assert second.json()["total_records"] == 3
+    assert second.headers["etag"] != first.headers["etag"]
+
+    third = client.get("/credit-balances/stats/summary", headers={"If-None-Match": second.headers["etag"]})
+    assert third.status_code == 304
+
+
+def test_write_racing_a_refresh_is_not_counted_twice(db, create_balances, monkeypatch):
+    create_balances(2)
+    cache = SummaryStatsCache()
+    raced = []
+
+    def version_then_write(session, table_name):
+        version = get_table_version(session, table_name)
+        if not raced:
+            # An API write commits between the version read and the GROUP BY...
+            writer = SessionLocal()
+            writer.add(models.CreditBalance(client_code="RACE", client_name="Race", balance_amount=5.0))
+            raced.append(bump_table_version(writer, CREDIT_BALANCES))
+            writer.commit()
+            writer.close()
+        return version
+
+    monkeypatch.setattr(summary_stats, "get_table_version", version_then_write)
+    cache.refresh(db)
+    # ...and reports its change once the refresh is done
+    cache.record_change(
+        None, {"center": None, "final_bucket": None, "balance_amount": 5.0, "balance_sessions": 0}, raced[0]
+    )
+
+    version, stats = cache.get(db)
+    assert stats["total_records"] == 3
+    assert stats["total_balance_amount"] == 100.0 + 101.0 + 5.0
+    assert version == raced[0]
@@ -0,0 +1,59 @@
+"""The vectorized voucher generator against the per-record one."""
+import random
+
+import pandas as pd
+import pytest
+
+from vouchers import CENTER_PREFIX_RULES, DEFAULT_PREFIX, generate_voucher_number, generate_voucher_numbers
+
+CENTERS = {
+    'GK': ['GK2', 'gk 1', 'Greater Kailash'],
+    'PV': ['Preet Vihar', 'PV'],
+    'PB': ['Punjabi Bagh', 'bagh'],
+    'PT': ['Pitampura'],
+    DEFAULT_PREFIX: ['Noida', '', None],
+}
+PHONES = ['9812345678', '98-123 45678', '12345', '123', '', None, 9812345678]
+CLIENT_CODES = ['AD03C4403', 'AB', 'X', '', None]
+
+
+def random_frame(centers: list, rows: int, seed: int, center_codes: list = (None,)) -> pd.DataFrame:
+    rng = random.Random(seed)
+    return pd.DataFrame({
+        'client_code': [rng.choice(CLIENT_CODES + [f"C{rng.randrange(10 ** 6)}"]) for _ in range(rows)],
+        'phone_no': [rng.choice(PHONES + [str(rng.randrange(10 ** 9, 10 ** 10))]) for _ in range(rows)],
+        'center': [rng.choice(centers) for _ in range(rows)],
+        'center_code': [rng.choice(center_codes) for _ in range(rows)],
+    })
+
+
+def scalar(frame: pd.DataFrame, with_codes: bool) -> list:
+    """generate_voucher_number per row, given None for missing values as a model instance would."""
+    rows = frame.astype(object).where(frame.notna(), None).itertuples()
+    return [
+        generate_voucher_number(row.client_code, row.phone_no, row.center, row.center_code if with_codes else None)
+        for row in rows
+    ]
+
+
+def test_every_prefix_rule_is_covered():
+    assert set(CENTERS) == {prefix for _, prefix in CENTER_PREFIX_RULES} | {DEFAULT_PREFIX}
+
+
+@pytest.mark.parametrize("prefix", list(CENTERS))
+def test_vectorized_matches_scalar_per_center_prefix(prefix):
+    frame = random_frame(CENTERS[prefix], 5000, seed=len(prefix) + sum(map(ord, prefix)))
+
+    vectorized = generate_voucher_numbers(frame['client_code'], frame['phone_no'], frame['center'])
+
+    assert vectorized.tolist() == scalar(frame, with_codes=False)
+    assert all(voucher.startswith(prefix) for voucher in vectorized)
+
+
+def test_vectorized_matches_scalar_with_center_codes():
+    centers = [center for names in CENTERS.values() for center in names]
+    frame = random_frame(centers, 5000, seed=8, center_codes=[None, '', 'GK', 'RJ', 'NOI'])
+
+    vectorized = generate_voucher_numbers(frame['client_code'], frame['phone_no'], frame['center'], frame['center_code'])
+
+    assert vectorized.tolist() == scalar(frame, with_codes=True)
@@ -1,42 +1,76 @@
 import pyodbc
 from urllib.parse import quote_plus
+import pandas as pd
+from sqlalchemy import bindparam, select, update
 from sqlalchemy.orm import sessionmaker
 from database import engine
 from models import CreditBalance
+from table_versions import CREDIT_BALANCES, bump_table_version
+from centers import center_resolver
+from vouchers import generate_voucher_numbers
 import logging
+import time
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-def update_voucher_numbers():
-    """Update all voucher numbers in the database with correct prefixes."""
+DEFAULT_BATCH_SIZE = 5000
+
+def update_voucher_numbers(batch_size: int = DEFAULT_BATCH_SIZE):
+    """Update all voucher numbers in the database with correct prefixes.
+    
+    The prefix is the code of each record's center_id (run
+    add_center_id_column.py first to fill it in).
+    
+    Vouchers are regenerated for the whole table at once and only the rows
+    whose voucher actually changes are written, in executemany UPDATE batches.
+    """
     
     # Create session
     SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
     db = SessionLocal()
     
     try:
-        # Get all records
-        records = db.query(CreditBalance).all()
-        logger.info(f"Found {len(records)} records to update")
+        started = time.perf_counter()
+        
+        # Load only the columns the voucher depends on
+        columns = ['id', 'client_code', 'phone_no', 'center', 'center_id', 'voucher_number']
+        rows = db.execute(select(*(getattr(CreditBalance, column) for column in columns))).all()
+        records = pd.DataFrame(rows, columns=columns)
+        logger.info(f"Found {len(records)} records to check")
+        
+        center_codes = records['center_id'].map(center_resolver.codes(db))
+        new_vouchers = generate_voucher_numbers(records['client_code'], records['phone_no'], records['center'], center_codes)
+        mask = new_vouchers != records['voucher_number']
+        changed = pd.DataFrame({
+            'b_id': records.loc[mask, 'id'],
+            'b_voucher_number': new_vouchers[mask],
+            'b_voucher_key': new_vouchers[mask].str.strip().str.upper()
+        })
+        logger.info(f"{len(changed)} voucher numbers need updating")
+        
+        # Core UPDATE bypasses the model validator, so voucher_key is written explicitly
+        statement = (
+            update(CreditBalance.__table__)
+            .where(CreditBalance.__table__.c.id == bindparam('b_id'))
+            .values(voucher_number=bindparam('b_voucher_number'), voucher_key=bindparam('b_voucher_key'))
+        )
+        params = changed.astype(object).to_dict('records')
         
         updated_count = 0
-        for record in records:
-            # Generate new voucher number
-            new_voucher = record.generate_voucher_number()
-            
-            # Update the record
-            record.voucher_number = new_voucher
-            updated_count += 1
-            
-            if updated_count % 100 == 0:
-                db.commit()
-                logger.info(f"Updated {updated_count} records...")
+        for start in range(0, len(params), batch_size):
+            batch = params[start:start + batch_size]
+            db.execute(statement, batch)
+            db.commit()
+            updated_count += len(batch)
+            logger.info(f"Updated {updated_count} records...")
         
-        # Final commit
+        # Final commit; bumping the table version lets running API workers refresh their caches
+        if updated_count:
+            bump_table_version(db, CREDIT_BALANCES)
         db.commit()
-        logger.info(f"Successfully updated {updated_count} voucher numbers")
+        logger.info(f"Successfully updated {updated_count} voucher numbers in {time.perf_counter() - started:.2f}s")
         
         return updated_count
         
@@ -0,0 +1,81 @@
+"""Voucher number generation shared by the model, the importers and the backfill.
+
+A voucher is <center prefix><first 3 chars of client code><middle 4 phone digits>,
+e.g. PBAD05349 for Punjabi Bagh, client AD03C4403, phone 7985349490. The
+prefix is the code of the record's center (see centers.py); records whose
+center is not in the centers table fall back to the keyword rules below.
+"""
+from datetime import datetime
+from typing import Optional
+
+import numpy as np
+import pandas as pd
+
+# Checked in order; the first rule with a keyword contained in the upper-cased center wins
+CENTER_PREFIX_RULES = [
+    (('GK', 'GREATER KAILASH'), 'GK'),
+    (('PV', 'PREET'), 'PV'),
+    (('PUNJABI', 'BAGH'), 'PB'),
+    (('PITAMPURA',), 'PT'),
+]
+DEFAULT_PREFIX = 'XX'  # Unknown or missing center
+DEFAULT_CLIENT_DIGITS = '000'
+DEFAULT_PHONE = '0000000000'
+
+
+def center_prefix(center) -> str:
+    if not center:
+        return DEFAULT_PREFIX
+    center_upper = center.upper()
+    for keywords, prefix in CENTER_PREFIX_RULES:
+        if any(keyword in center_upper for keyword in keywords):
+            return prefix
+    return DEFAULT_PREFIX
+
+
+def phone_middle_digits(phone_no) -> str:
+    phone_clean = str(phone_no).replace(' ', '').replace('-', '') if phone_no else DEFAULT_PHONE
+    if len(phone_clean) >= 7:
+        return phone_clean[3:7]
+    return phone_clean.zfill(4)[:4]
+
+
+def generate_voucher_number(client_code, phone_no, center, center_code: Optional[str] = None) -> str:
+    """Voucher number for a single record."""
+    try:
+        client_digits = client_code[:3] if client_code else DEFAULT_CLIENT_DIGITS
+        prefix = center_code or center_prefix(center)
+        return f"{prefix}{client_digits}{phone_middle_digits(phone_no)}"
+    except Exception:
+        return f"ERR{datetime.now().strftime('%Y%m%d%H%M%S')}"
+
+
+def generate_voucher_numbers(
+    client_codes: pd.Series,
+    phone_nos: pd.Series,
+    centers: pd.Series,
+    center_codes: Optional[pd.Series] = None,
+) -> pd.Series:
+    """Voucher numbers for whole columns at once; same result as generate_voucher_number per row."""
+    # Prefix: evaluate every rule as a vectorized substring test, first match wins
+    centers_upper = centers.fillna('').astype(str).str.upper()
+    conditions = [
+        np.logical_or.reduce([centers_upper.str.contains(keyword, regex=False).to_numpy() for keyword in keywords])
+        for keywords, _ in CENTER_PREFIX_RULES
+    ]
+    prefixes = pd.Series(
+        np.select(conditions, [prefix for _, prefix in CENTER_PREFIX_RULES], default=DEFAULT_PREFIX),
+        index=centers.index,
+    )
+    if center_codes is not None:
+        known = center_codes.notna() & (center_codes.astype(str) != '')
+        prefixes = prefixes.where(~known, center_codes.astype(str))
+
+    client_codes = client_codes.fillna('').astype(str)
+    client_digits = client_codes.str[:3].where(client_codes != '', DEFAULT_CLIENT_DIGITS)
+
+    phones = phone_nos.fillna('').astype(str)
+    phones = phones.where(phones != '', DEFAULT_PHONE).str.replace(' ', '', regex=False).str.replace('-', '', regex=False)
+    middle_digits = phones.str[3:7].where(phones.str.len() >= 7, phones.str.zfill(4).str[:4])
+
+    return prefixes.set_axis(client_codes.index) + client_digits + middle_digits